@@ -38,6 +38,25 @@ class Settings(BaseSettings):
     host_proc: str = "/host/proc"
     host_sys: str = "/host/sys"
     
+    # Host command executor
+    host_exec_stream_queue_max: int = 1024  # строк в очереди execute_stream до backpressure
+    host_exec_max_concurrency: int = 16  # одновременных команд на хосте (execute)
+    host_exec_max_streams: int = 8  # одновременных execute_stream, отдельно от execute
+    host_exec_threaded_spawn: bool = False  # fork/exec в пуле потоков, а не в event loop
+    host_exec_session: bool = True  # execute(reuse_session=True) через долгоживущий shell
+    host_exec_max_output_bytes: int = 10 * 1024 * 1024  # потолок stdout/stderr на команду в execute()
+    
+    # Metrics collector caches (seconds)
+    metrics_processes_cache_ttl: float = 5.0
+    metrics_system_cache_ttl: float = 5.0  # включая разбор /proc/net/tcp*
+    metrics_partitions_cache_ttl: float = 30.0
+    metrics_net_if_cache_ttl: float = 5.0  # net_if_addrs / net_if_stats
+    metrics_timezone_cache_ttl: float = 300.0
+    metrics_certs_refresh_interval: float = 60.0  # фоновое обновление сводки сертификатов
+    
+    # IPSet
+    ipset_host_shell: bool = True  # ipset/iptables через долгоживущий nsenter sh, без exec nsenter на вызов
+    
     @property
     def haproxy_config(self) -> Path:
         return Path(self.haproxy_config_path)
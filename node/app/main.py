@@ -36,7 +36,7 @@ async def lifespan(app: FastAPI):
 
     from app.services.haproxy_manager import get_haproxy_manager
     haproxy_manager = get_haproxy_manager()
-    success, msg = haproxy_manager.full_init()
+    success, msg = await asyncio.to_thread(haproxy_manager.full_init)
     logger.info(f"HAProxy initialization: {msg}")
 
     traffic_collector = get_traffic_collector()
@@ -61,6 +61,11 @@ async def lifespan(app: FastAPI):
         await traffic_collector.stop()
     except Exception:
         pass
+    try:
+        # Отложенное (debounce) сохранение блоклиста не должно потеряться
+        await asyncio.to_thread(ipset_manager.flush_pending_save)
+    except Exception:
+        pass
     logger.info("Shutdown complete")
 
 
@@ -182,6 +182,12 @@ class CertificateRenewResponse(BaseModel):
     renewed_domains: list[str]
 
 
+class CertificateRenewBatchRequest(BaseModel):
+    """Request to renew several certificates in one run"""
+    domains: list[str] = Field(..., min_length=1, description="Domains to renew")
+    force: bool = Field(False, description="Renew even if not due (new ACME order)")
+
+
 class CertificateUpdateResponse(BaseModel):
     """Combined certificate update result"""
     updated_domains: list[str]
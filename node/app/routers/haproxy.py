@@ -10,6 +10,7 @@ from app.models.haproxy import (
     CertificateGenerateRequest,
     CertificateGenerateResponseExtended,
     CertificateInfo,
+    CertificateRenewBatchRequest,
     CertificateRenewResponse,
     CertificateRenewSingleResponse,
     CertificateUpdateResponse,
@@ -85,7 +86,8 @@ def _rule_to_response(r: HAProxyRule) -> HAProxyRuleResponse:
 async def get_haproxy_status():
     """Get HAProxy service status"""
     manager = get_haproxy_manager()
-    return await asyncio.to_thread(manager.get_status)
+    status = await asyncio.to_thread(manager.get_status)
+    return status.to_dict()
 
 
 @router.get("/logs")
@@ -295,7 +297,7 @@ async def get_available_certificates():
 async def get_all_certificates():
     """Get detailed information about all certificates"""
     manager = get_haproxy_manager()
-    certs = await asyncio.to_thread(manager.get_all_certs_info)
+    certs = await manager.get_all_certs_info_async()
 
     return AllCertificatesResponse(
         certificates=certs,
@@ -307,7 +309,7 @@ async def get_all_certificates():
 async def get_certificate_info(domain: str):
     """Get detailed certificate information"""
     manager = get_haproxy_manager()
-    info = await asyncio.to_thread(manager.get_cert_info, domain)
+    info = await manager.get_cert_info_async(domain)
 
     if not info:
         raise HTTPException(status_code=404)
@@ -365,13 +367,29 @@ async def renew_certificates():
     )
 
 
+@router.post("/certs/renew-batch", response_model=CertificateRenewResponse)
+async def renew_certificates_batch(request: CertificateRenewBatchRequest):
+    """Renew selected Let's Encrypt certificates in one run"""
+    logger.info(f"API: Received request to renew certificates: {request.domains}")
+    manager = get_haproxy_manager()
+    
+    success, message, renewed = await manager.renew_certificates_batch(request.domains, force=request.force)
+    
+    logger.info(f"API: Batch certificate renewal completed - success={success}, renewed={len(renewed)}")
+    return CertificateRenewResponse(
+        success=success,
+        message=message,
+        renewed_domains=renewed
+    )
+
+
 @router.post("/certs/{domain}/renew", response_model=CertificateRenewSingleResponse)
-async def renew_single_certificate(domain: str):
-    """Renew specific Let's Encrypt certificate"""
+async def renew_single_certificate(domain: str, force: bool = False):
+    """Renew specific Let's Encrypt certificate (force=true ignores the 30-day threshold)"""
     logger.info(f"API: Received request to renew certificate for {domain}")
     manager = get_haproxy_manager()
     
-    success, message, output_log = await manager.renew_certificate(domain)
+    success, message, output_log = await manager.renew_certificate(domain, force=force)
     
     logger.info(f"API: Certificate renewal for {domain} completed - success={success}")
     return CertificateRenewSingleResponse(
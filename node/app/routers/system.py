@@ -19,7 +19,9 @@ from fastapi import APIRouter, HTTPException
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 
-from app.services.host_executor import get_host_executor, MAX_TIMEOUT, DEFAULT_TIMEOUT
+from app.services.host_executor import (
+    get_host_executor, MAX_TIMEOUT, DEFAULT_TIMEOUT, STREAM_BATCH_MAX_LINES,
+)
 from app.services.host_files import read_host_file, write_host_file
 
 NGINX_SSL_DIR = Path("/opt/monitoring-node/nginx/ssl")
@@ -162,7 +164,7 @@ async def replace_node_cert(payload: ReplaceCertRequest):
         raise HTTPException(status_code=500, detail=f"write failed: {exc}") from exc
 
     try:
-        _reload_nginx_container()
+        await asyncio.to_thread(_reload_nginx_container)
     except Exception as exc:
         logger.error(f"nginx reload failed, rolling back: {exc}")
         if cert_bak.exists():
@@ -170,7 +172,7 @@ async def replace_node_cert(payload: ReplaceCertRequest):
         if key_bak.exists():
             shutil.copy2(key_bak, key_path)
         try:
-            _reload_nginx_container()
+            await asyncio.to_thread(_reload_nginx_container)
         except Exception:
             pass
         raise HTTPException(status_code=500, detail=f"nginx reload failed: {exc}") from exc
@@ -445,6 +447,7 @@ class ExecuteRequest(BaseModel):
     command: str = Field(..., min_length=1, max_length=65000, description="Shell command or script to execute")
     timeout: int = Field(DEFAULT_TIMEOUT, ge=1, le=MAX_TIMEOUT, description="Timeout in seconds")
     shell: str = Field("sh", pattern="^(sh|bash)$", description="Shell to use (sh or bash)")
+    batch: bool = Field(False, description="Stream only: allow stdout_batch/stderr_batch events")
 
 
 class ExecuteResponse(BaseModel):
@@ -455,6 +458,7 @@ class ExecuteResponse(BaseModel):
     stderr: str
     execution_time_ms: int
     error: Optional[str] = None
+    truncated: bool = False
 
 
 @router.post("/execute", response_model=ExecuteResponse)
@@ -492,7 +496,8 @@ async def execute_command(request: ExecuteRequest):
         stdout=result.stdout,
         stderr=result.stderr,
         execution_time_ms=result.execution_time_ms,
-        error=result.error
+        error=result.error,
+        truncated=result.truncated
     )
 
 
@@ -506,6 +511,7 @@ async def execute_command_stream(request: ExecuteRequest):
     SSE Event types:
         - stdout: {"line": "output line"}
         - stderr: {"line": "error line"}
+        - stdout_batch / stderr_batch: {"lines": ["...", ...]} (only with batch=true)
         - done: {"exit_code": 0, "execution_time_ms": 1234, "success": true}
         - error: {"message": "error description"}
     
@@ -513,6 +519,8 @@ async def execute_command_stream(request: ExecuteRequest):
         command: Shell command to execute
         timeout: Timeout in seconds (1-600, default 30)
         shell: Shell to use (sh or bash)
+        batch: Coalesce consecutive lines into *_batch events (older panels
+            don't know them, so it is opt-in)
     """
     executor = get_host_executor()
     
@@ -520,7 +528,8 @@ async def execute_command_stream(request: ExecuteRequest):
         async for event in executor.execute_stream(
             command=request.command,
             timeout=request.timeout,
-            shell=request.shell
+            shell=request.shell,
+            batch_max_lines=STREAM_BATCH_MAX_LINES if request.batch else 1
         ):
             yield event
     
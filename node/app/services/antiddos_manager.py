@@ -61,7 +61,9 @@ class AntiDdosManager:
         return result.success, result.stdout, result.stderr
 
     async def _script_installed(self) -> bool:
-        result = await self._executor.execute(f"test -x {WATCHDOG_SCRIPT}", timeout=5)
+        result = await self._executor.execute(
+            f"test -x {WATCHDOG_SCRIPT}", timeout=5, reuse_session=True, capture="none"
+        )
         return result.exit_code == 0
 
     async def _write_host_file(self, path: str, content: str) -> bool:
@@ -159,7 +161,8 @@ class AntiDdosManager:
                 state = {}
 
         svc = await self._executor.execute(
-            f"systemctl is-active {WATCHDOG_SERVICE} 2>/dev/null", timeout=5
+            f"systemctl is-active {WATCHDOG_SERVICE} 2>/dev/null", timeout=5,
+            reuse_session=True,
         )
         watchdog_active = svc.stdout.strip() == "active"
 
@@ -1,19 +1,30 @@
 """HAProxy configuration manager for native systemd HAProxy service"""
 
 import asyncio
+import functools
+import hashlib
 import ipaddress
 import logging
+import os
 import re
 import shutil
-import subprocess
+import socket
+import string
+import threading
 import time
-from dataclasses import dataclass, field
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field, replace
+from datetime import datetime, timezone
 from pathlib import Path
 from typing import Optional
 
 import psutil
+from cryptography import x509
+from cryptography.hazmat.primitives import serialization
 
 from app.config import get_settings
+from app.services.firewall_manager import get_firewall_manager
 from app.services.host_executor import get_host_executor
 
 logger = logging.getLogger(__name__)
@@ -25,6 +36,268 @@ MAXCONN_PER_RAM_MB = 10
 MAXCONN_MIN = 10000
 MAXCONN_MAX = 500000
 
+CHECK_CACHE_SIZE = 8
+
+# Все пробы get_status одним заходом на хост: каждый execute_sync — это
+# nsenter + sh + systemctl, и раньше их было до пяти на один опрос статуса
+_PROBE_SEPARATOR = "__HAPROXY_PROBE__"
+_STATUS_PROBE_SCRIPT = (
+    "command -v haproxy >/dev/null 2>&1 || exit 0; "
+    "systemctl is-active haproxy; systemctl is-enabled haproxy; "
+    f"echo {_PROBE_SEPARATOR}; "
+    "systemctl status haproxy --no-pager -l 2>&1; "
+    f"echo {_PROBE_SEPARATOR}; "
+    "systemctl is-active --quiet haproxy || "
+    "journalctl -u haproxy -n 20 --no-pager --no-hostname; true"
+)
+
+# Статические шаблоны компилируются один раз: встроенный кэш re ограничен
+# и ключуется полной строкой шаблона, поэтому f-строки в нём не задерживаются.
+_FRONTEND_RE = re.compile(
+    r'^frontend\s+(tcp|https)_(\S+)\s*\n(.*?)(?=^frontend|^backend|\Z)',
+    re.MULTILINE | re.DOTALL
+)
+_BACKEND_RE = re.compile(
+    r'^backend\s+backend_(tcp|https)_(\S+)\s*\n(.*?)(?=^frontend|^backend|\Z)',
+    re.MULTILINE | re.DOTALL
+)
+_RULE_NAME_RE = re.compile(r'^[a-zA-Z0-9_-]+$')
+_SERVER_LINE_RE = re.compile(r'^    server .+$', re.MULTILINE)
+_SERVER_TARGET_RE = re.compile(r'server\s+\S+\s+(\S+):(\d+)')
+_SERVER_TARGET_SSL_RE = re.compile(r'server\s+\S+\s+\S+:\d+\s+ssl')
+_SERVER_PARSE_RE = re.compile(r'\s*server\s+(\S+)\s+(\S+):(\d+)(.*)')
+_SERVER_LINES_RE = re.compile(r'^\s*server\s+.+', re.MULTILINE)
+_BALANCE_LINE_RE = re.compile(r'^\s*balance\s+', re.MULTILINE)
+_BIND_PORT_RE = re.compile(r'bind\s+\*:(\d+)')
+_BIND_PORT_SUB_RE = re.compile(r'(bind\s+\*:)\d+')
+_SERVER_ADDR_SUB_RE = re.compile(r'(server\s+\S+\s+)\S+:(\d+)')
+_SERVER_PORT_SUB_RE = re.compile(r'(server\s+\S+\s+\S+:)\d+')
+_BIND_LINE_RE = re.compile(r'^\s*bind\s+.+$', re.MULTILINE)
+_CERT_DOMAIN_RE = re.compile(r'ssl\s+crt\s+/etc/letsencrypt/live/([^/]+)/combined\.pem')
+_CERT_PATH_RE = re.compile(rb'\bcrt\s+(/\S+)')
+_GLOBAL_SECTION_RE = re.compile(r'^global[ \t]*\n((?:[ \t]+\S.*\n?)*)', re.MULTILINE)
+_GLOBAL_MAXCONN_RE = re.compile(r'^[ \t]+maxconn\b', re.MULTILINE)
+# Метки через одиночные точки: ".", ".." и "a..b" не проходят — имя
+# подставляется в путь live/{domain}. \Z, а не $: $ пропускает "evil\n"
+_DOMAIN_RE = re.compile(r'^[a-zA-Z0-9-]+(?:\.[a-zA-Z0-9-]+)*\Z')
+DOMAIN_MAX_LENGTH = 253
+_STATS_SOCKET_RE = re.compile(r'^\s*stats\s+socket\s+(/\S+)', re.MULTILINE)
+
+STATS_SOCKET_TIMEOUT = 2.0
+COPY_BUFFER_SIZE = 1024 * 1024
+
+
+@functools.lru_cache(maxsize=32)
+def _server_opt_re(name: str) -> re.Pattern:
+    return re.compile(rf'{name}\s+(\S+)')
+
+
+_BASE_CONFIG_TEMPLATE = string.Template("""global
+    stats socket /var/run/haproxy.sock mode 660 level admin expose-fd listeners
+    no log
+    maxconn $maxconn
+    tune.bufsize 16384
+    tune.maxpollevents 1024
+    tune.recv_enough 16384
+
+defaults
+    mode tcp
+    timeout connect 5s
+    timeout client 30m
+    timeout server 30m
+    timeout tunnel 1h
+    timeout client-fin 5s
+    timeout server-fin 5s
+    option dontlognull
+    option redispatch
+    option tcp-smart-accept
+    option tcp-smart-connect
+    option splice-auto
+    option clitcpka
+    clitcpka-idle 60s
+    clitcpka-intvl 10s
+    clitcpka-cnt 3
+    option srvtcpka
+    srvtcpka-idle 60s
+    srvtcpka-intvl 10s
+    srvtcpka-cnt 3
+
+resolvers mydns
+    nameserver dns1 1.1.1.1:53
+    nameserver dns2 8.8.8.8:53
+    resolve_retries 3
+    timeout resolve 1s
+    timeout retry 1s
+    hold valid 60s
+    hold nx 10s
+    hold other 10s
+
+$rules_start
+$rules_end
+""")
+_TCP_FRONTEND_TEMPLATE = string.Template("""frontend $frontend_name
+    bind *:$listen_port$accept_proxy_opt
+    mode tcp
+    default_backend $backend_name
+""")
+_TCP_BACKEND_TEMPLATE = string.Template("""backend $backend_name
+    mode tcp
+    option tcp-check
+    server srv1 $target_ip:$target_port$resolver_opts$server_opts
+""")
+_HTTPS_FRONTEND_TEMPLATE = string.Template("""frontend $frontend_name
+    bind *:$listen_port ssl crt $cert_path$accept_proxy_opt
+    mode http
+    default_backend $backend_name
+""")
+_HTTPS_BACKEND_TEMPLATE = string.Template("""backend $backend_name
+    mode http
+    http-request set-header Host $target_ip
+    http-request set-header X-Forwarded-Proto https
+    http-request set-header X-Forwarded-For %[src]
+    $server_line
+""")
+
+
+def _split_sections(content: str) -> tuple[str, list[str], str]:
+    """Режет конфиг на (header, секции области правил, footer).
+
+    header заканчивается строкой RULES_START_MARKER, footer начинается с
+    RULES_END_MARKER. Новая секция начинается со строки без отступа
+    (frontend/backend/...); комментарии и пустые строки остаются в текущей.
+    Без маркеров (конфиг из панели) областью правил считается весь файл.
+    """
+    start = content.find(RULES_START_MARKER)
+    end = content.find(RULES_END_MARKER, start + 1) if start != -1 else -1
+    if start == -1 or end == -1:
+        header, region, footer = "", content, ""
+    else:
+        region_start = content.find("\n", start)
+        region_start = end if region_start == -1 or region_start > end else region_start + 1
+        header, region, footer = content[:region_start], content[region_start:end], content[end:]
+
+    sections: list[str] = []
+    current: list[str] = []
+    for line in region.splitlines(keepends=True):
+        if line[:1].isalpha() and current:
+            sections.append("".join(current))
+            current = []
+        current.append(line)
+    if current:
+        sections.append("".join(current))
+    return header, [s for s in sections if s.strip()], footer
+
+
+def _join_sections(header: str, sections: list[str], footer: str) -> str:
+    """Обратная к _split_sections сборка: секции через одну пустую строку."""
+    body = "\n\n".join(s for s in (section.strip("\n") for section in sections) if s)
+    if not body:
+        return header + footer
+    if header and not header.endswith("\n"):
+        header += "\n"
+    return f"{header}\n{body}\n{footer}" if header else f"{body}\n{footer}"
+
+
+def _section_name(section: str) -> tuple[str, ...]:
+    """('frontend', 'tcp_x') для заголовка секции, () для прочего."""
+    return tuple(section.lstrip("\n").split("\n", 1)[0].split()[:2])
+
+
+# certbot в verbose-режиме может выдать мегабайты; в логи и ответ идёт только хвост
+CERTBOT_OUTPUT_TAIL = 8192
+# Порог certbot renew по умолчанию
+RENEW_BEFORE_DAYS = 30
+COMBINE_WORKERS = 8
+
+
+async def _drain_tail(stream: asyncio.StreamReader, limit: int = CERTBOT_OUTPUT_TAIL) -> bytes:
+    """Read a stream to EOF keeping only its last `limit` bytes"""
+    tail = bytearray()
+    while True:
+        chunk = await stream.read(COPY_BUFFER_SIZE)
+        if not chunk:
+            return bytes(tail)
+        tail += chunk
+        if len(tail) > limit:
+            del tail[:-limit]
+
+
+async def _run_certbot(cmd: list[str], timeout: float) -> tuple[int, str, str]:
+    """Run certbot, draining stdout/stderr concurrently into bounded buffers.
+    
+    Returns: (returncode, stdout_tail, stderr_tail)
+    Raises asyncio.TimeoutError after killing the process.
+    """
+    process = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
+    try:
+        stdout, stderr, _ = await asyncio.wait_for(
+            asyncio.gather(_drain_tail(process.stdout), _drain_tail(process.stderr), process.wait()),
+            timeout=timeout
+        )
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+        raise
+    return (
+        process.returncode,
+        stdout.decode('utf-8', errors='replace'),
+        stderr.decode('utf-8', errors='replace'),
+    )
+
+
+_certbot_path: Optional[str] = None
+
+
+def _find_certbot() -> Optional[str]:
+    """shutil.which("certbot"), cached once found — certbot does not vanish at runtime"""
+    global _certbot_path
+    if _certbot_path is None:
+        _certbot_path = shutil.which("certbot")
+    return _certbot_path
+
+
+def _concat_files(dst: Path, sources: tuple[Path, ...]) -> None:
+    """Склеивает файлы в dst байтами; на Linux копирование идёт через sendfile
+    без декодирования PEM и промежуточной строки в памяти."""
+    with open(dst, "wb") as out:
+        for src_path in sources:
+            with open(src_path, "rb") as src:
+                size = os.fstat(src.fileno()).st_size
+                offset = 0
+                try:
+                    while offset < size:
+                        sent = os.sendfile(out.fileno(), src.fileno(), offset, size - offset)
+                        if sent == 0:
+                            break
+                        offset += sent
+                except (AttributeError, OSError):
+                    # Нет sendfile в файл (не Linux) — копирование крупными блоками с того же места
+                    src.seek(offset)
+                    out.seek(0, os.SEEK_END)
+                    shutil.copyfileobj(src, out, COPY_BUFFER_SIZE)
+
+
+def _is_valid_domain(domain: str) -> bool:
+    """Имя домена, безопасное как имя каталога в live/"""
+    return bool(domain) and len(domain) <= DOMAIN_MAX_LENGTH and _DOMAIN_RE.match(domain) is not None
+
+
+def _with_mutex(method):
+    """Сериализует read → modify → write конфига на экземпляре менеджера.
+
+    Без этого параллельные add_rule/delete_rule читали один и тот же файл,
+    и последний писатель молча затирал правило первого.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._mutex:
+            return method(self, *args, **kwargs)
+    return wrapper
+
 
 @dataclass
 class BackendServer:
@@ -86,6 +359,23 @@ class HAProxyRule:
     balancer_options: Optional[BalancerOptions] = None
 
 
+@dataclass(slots=True)
+class HAProxyStatus:
+    """HAProxy service status; refreshed in place inside the manager, callers get copies"""
+    running: bool = False
+    enabled: bool = False  # autostart on boot
+    installed: bool = False
+    config_valid: bool = False
+    config_exists: bool = False
+    config_message: str = ""
+    config_path: str = ""
+    status_output: str = ""
+    service_logs: str = ""
+
+    def to_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
 class HAProxyManager:
     """Manages HAProxy configuration via native systemd service"""
     
@@ -95,9 +385,25 @@ class HAProxyManager:
         self.certs_dir = self.settings.haproxy_certs
         self._executor = get_host_executor()
         # Status cache to reduce systemctl calls
-        self._status_cache: Optional[dict] = None
+        self._status = HAProxyStatus(config_path=str(self.config_path))
         self._status_cache_time: float = 0
         self._status_cache_ttl: float = 5.0  # 5 seconds
+        # Реентерабельный: update_rule вызывает delete_rule и add_rule
+        self._mutex = threading.RLock()
+        # haproxy -c по хэшу содержимого: мутация валидирует конфиг, а следом
+        # reload/get_status проверяют тот же самый файл ещё раз
+        self._check_cache: OrderedDict[str, tuple[bool, str]] = OrderedDict()
+        # check_config зовут и под _mutex, и без него (get_status) из разных
+        # потоков; свой лок только на LRU, сам haproxy -c идёт без него
+        self._check_cache_lock = threading.Lock()
+        # Runtime API сокет держим открытым в интерактивном режиме (prompt);
+        # HAProxy сам закрывает его по "stats timeout", тогда переподключаемся
+        self._stats_sock: Optional[socket.socket] = None
+        self._stats_lock = threading.Lock()
+        # Разобранный срок сертификата по (путь, mtime) — файлы меняются только при выпуске/продлении
+        self._cert_info_cache: dict[Path, tuple[int, datetime]] = {}
+        # Список live/ по mtime каталога: certbot добавляет/удаляет записи целиком
+        self._avail_cache: Optional[tuple[int, list[str]]] = None
     
     @staticmethod
     def _is_domain(target: str) -> bool:
@@ -114,7 +420,7 @@ class HAProxyManager:
         
         def patch_server_line(match: re.Match) -> str:
             line = match.group(0)
-            server_match = re.search(r'server\s+\S+\s+(\S+):\d+', line)
+            server_match = _SERVER_TARGET_RE.search(line)
             if not server_match:
                 return line
             target = server_match.group(1)
@@ -126,7 +432,7 @@ class HAProxyManager:
             host_port_end = server_match.end()
             return line[:host_port_end] + resolver_suffix + line[host_port_end:]
         
-        return re.sub(r'^    server .+$', patch_server_line, content, flags=re.MULTILINE)
+        return _SERVER_LINE_RE.sub(patch_server_line, content)
     
     def _read_config(self) -> str:
         """Read HAProxy config file"""
@@ -201,88 +507,47 @@ class HAProxyManager:
 
         Конфиг из панельного профиля один на много серверов с разной RAM,
         поэтому потолок соединений вычисляется на ноде при применении."""
-        global_match = re.search(r'^global[ \t]*\n((?:[ \t]+\S.*\n?)*)', content, re.MULTILINE)
+        global_match = _GLOBAL_SECTION_RE.search(content)
         if not global_match:
             return content
-        if re.search(r'^[ \t]+maxconn\b', global_match.group(1), re.MULTILINE):
+        if _GLOBAL_MAXCONN_RE.search(global_match.group(1)):
             return content
         insert_pos = global_match.start(1)
         return content[:insert_pos] + f"    maxconn {self._compute_maxconn()}\n" + content[insert_pos:]
 
     def _generate_base_config(self) -> str:
         """Generate base HAProxy config for high-speed TCP relay"""
-        return f"""global
-    stats socket /var/run/haproxy.sock mode 660 level admin expose-fd listeners
-    no log
-    maxconn {self._compute_maxconn()}
-    tune.bufsize 16384
-    tune.maxpollevents 1024
-    tune.recv_enough 16384
-
-defaults
-    mode tcp
-    timeout connect 5s
-    timeout client 30m
-    timeout server 30m
-    timeout tunnel 1h
-    timeout client-fin 5s
-    timeout server-fin 5s
-    option dontlognull
-    option redispatch
-    option tcp-smart-accept
-    option tcp-smart-connect
-    option splice-auto
-    option clitcpka
-    clitcpka-idle 60s
-    clitcpka-intvl 10s
-    clitcpka-cnt 3
-    option srvtcpka
-    srvtcpka-idle 60s
-    srvtcpka-intvl 10s
-    srvtcpka-cnt 3
-
-resolvers mydns
-    nameserver dns1 1.1.1.1:53
-    nameserver dns2 8.8.8.8:53
-    resolve_retries 3
-    timeout resolve 1s
-    timeout retry 1s
-    hold valid 60s
-    hold nx 10s
-    hold other 10s
-
-{RULES_START_MARKER}
-{RULES_END_MARKER}
-"""
+        return _BASE_CONFIG_TEMPLATE.substitute(
+            maxconn=self._compute_maxconn(),
+            rules_start=RULES_START_MARKER,
+            rules_end=RULES_END_MARKER,
+        )
     
+    @_with_mutex
     def regenerate_config(self, preserve_rules: bool = True) -> tuple[bool, str]:
         """Regenerate HAProxy config preserving rules"""
-        rules_content = ""
+        sections: list[str] = []
         
         if preserve_rules and self.config_path.exists():
-            content = self._read_config()
-            match = re.search(
-                rf'{re.escape(RULES_START_MARKER)}(.*?){re.escape(RULES_END_MARKER)}',
-                content, re.DOTALL
-            )
-            if match:
-                rules_content = match.group(1)
+            header, sections, _ = _split_sections(self._read_config())
+            if not header:
+                # Нет маркеров — своих правил в файле нет
+                sections = []
         
         self._backup_config()
         new_config = self._generate_base_config()
         
-        if rules_content.strip():
-            rules_content = self._patch_dns_resolvers(rules_content)
-            new_config = new_config.replace(
-                RULES_END_MARKER,
-                rules_content.rstrip() + '\n' + RULES_END_MARKER
-            )
+        if sections:
+            header, _, footer = _split_sections(new_config)
+            sections = [self._patch_dns_resolvers(section) for section in sections]
+            new_config = _join_sections(header, sections, footer)
         
         self._write_config(new_config)
         logger.info("Config regenerated")
         
         return True, "Config regenerated"
     
+    @_with_mutex
     def init_config(self) -> tuple[bool, str]:
         """Initialize base HAProxy config if not exists"""
         if not self.config_path.exists():
@@ -300,8 +565,27 @@ resolvers mydns
     
     def check_config(self) -> tuple[bool, str]:
         """Validate HAProxy configuration using haproxy -c"""
-        if not self.config_path.exists():
+        try:
+            content = self.config_path.read_bytes()
+        except FileNotFoundError:
             return False, "Config file not found"
+        except OSError as e:
+            return False, f"Cannot read config: {e}"
+        
+        # haproxy -c читает и файлы, на которые ссылается конфиг: появившийся
+        # или пересобранный combined.pem меняет результат при том же конфиге
+        h = hashlib.blake2b(content, digest_size=16)
+        for cert_path in _CERT_PATH_RE.findall(content):
+            try:
+                h.update(b"%s:%d;" % (cert_path, os.stat(cert_path).st_mtime_ns))
+            except OSError:
+                h.update(b"%s:missing;" % cert_path)
+        digest = h.hexdigest()
+        with self._check_cache_lock:
+            cached = self._check_cache.get(digest)
+            if cached is not None:
+                self._check_cache.move_to_end(digest)
+                return cached
         
         # Use host executor to run haproxy check on host
         result = self._executor.execute_sync(
@@ -310,23 +594,116 @@ resolvers mydns
         )
         
         if result.success:
-            return True, "Configuration valid"
-        
-        # Parse error message
-        error_msg = result.stderr.strip() if result.stderr else result.stdout.strip()
-        if not error_msg:
-            error_msg = "Configuration check failed"
+            outcome = (True, "Configuration valid")
+        elif result.error:
+            # Таймаут или сбой запуска ничего не говорят о самом конфиге — не кэшируем
+            return False, result.error
+        else:
+            # Parse error message
+            error_msg = result.stderr.strip() if result.stderr else result.stdout.strip()
+            outcome = (False, error_msg or "Configuration check failed")
+        
+        with self._check_cache_lock:
+            self._check_cache[digest] = outcome
+            if len(self._check_cache) > CHECK_CACHE_SIZE:
+                self._check_cache.popitem(last=False)
+        return outcome
+    
+    def _stats_socket_path(self) -> Optional[str]:
+        """Host path of the runtime API socket as seen from this process"""
+        match = _STATS_SOCKET_RE.search(self._read_config())
+        if not match:
+            return None
+        path = match.group(1)
+        # Из контейнера (pid: host) файловая система хоста видна через /proc/1/root
+        if self._executor._use_nsenter:
+            return f"/proc/1/root{path}"
+        return path
+    
+    def _close_stats_socket(self):
+        if self._stats_sock is not None:
+            try:
+                self._stats_sock.close()
+            except OSError:
+                pass
+            self._stats_sock = None
+    
+    def _drop_stats_socket(self):
+        """Forget the runtime API connection after a start/stop/reload of the service"""
+        with self._stats_lock:
+            self._close_stats_socket()
+    
+    @staticmethod
+    def _read_prompt(sock: socket.socket) -> bytes:
+        """Read one interactive-mode response, terminated by the '> ' prompt"""
+        chunks = []
+        tail = b""
+        while not tail.endswith(b"\n> "):
+            chunk = sock.recv(65536)
+            if not chunk:
+                raise ConnectionResetError("stats socket closed")
+            chunks.append(chunk)
+            tail = (tail + chunk)[-3:]
+        return b"".join(chunks)[:-3]
+    
+    def _stats_query(self, command: str) -> Optional[str]:
+        """Run a runtime API command over the persistent stats socket.
         
-        return False, error_msg
+        Returns None when the socket is unavailable (HAProxy stopped, no
+        stats socket in config, permission denied).
+        """
+        with self._stats_lock:
+            for _ in range(2):
+                if self._stats_sock is None:
+                    path = self._stats_socket_path()
+                    if not path:
+                        return None
+                    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                    sock.settimeout(STATS_SOCKET_TIMEOUT)
+                    try:
+                        sock.connect(path)
+                        sock.sendall(b"prompt\n")
+                        self._read_prompt(sock)
+                    except OSError:
+                        sock.close()
+                        return None
+                    self._stats_sock = sock
+                try:
+                    self._stats_sock.sendall(command.encode() + b"\n")
+                    return self._read_prompt(self._stats_sock).decode("utf-8", errors="replace")
+                except OSError:
+                    # Закрыт по таймауту или после перезапуска — одна повторная попытка
+                    self._close_stats_socket()
+            return None
     
     def is_running(self) -> bool:
         """Check if HAProxy service is running"""
+        info = self._stats_query("show info")
+        if info is not None and "Pid:" in info:
+            return True
         result = self._executor.execute_sync(
             "systemctl is-active haproxy",
             timeout=10
         )
         return result.success and result.stdout.strip() == "active"
     
+    def _wait_running(self, timeout: float = 1.0) -> bool:
+        """Poll is_running with exponential backoff (10ms → 500ms) until timeout.
+
+        Обычно HAProxy поднимается за десятки миллисекунд, фиксированные 0.5s
+        сна были лишней задержкой на каждом успешном старте.
+        """
+        deadline = time.monotonic() + timeout
+        delay = 0.01
+        while True:
+            if self.is_running():
+                return True
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            time.sleep(min(delay, remaining))
+            delay = min(delay * 2, 0.5)
+    
     def is_installed(self) -> bool:
         """Check if HAProxy is installed on the system"""
         result = self._executor.execute_sync(
@@ -343,63 +720,58 @@ resolvers mydns
         )
         return result.success and result.stdout.strip() == "enabled"
     
-    def get_status(self) -> dict:
-        """Get HAProxy service status with caching"""
+    def _probe_service(self) -> tuple[bool, bool, bool, str, str]:
+        """(installed, running, enabled, status_output, service_logs) за один вызов на хосте"""
+        result = self._executor.execute_sync(_STATUS_PROBE_SCRIPT, timeout=15)
+        parts = result.stdout.split(_PROBE_SEPARATOR)
+        if len(parts) != 3:
+            return False, False, False, "", ""
+        
+        states = parts[0].split()
+        is_running = len(states) > 0 and states[0] == "active"
+        is_enabled = len(states) > 1 and states[1] == "enabled"
+        status_output = parts[1].strip()
+        service_logs = parts[2].strip() if not is_running else ""
+        return True, is_running, is_enabled, status_output, service_logs
+    
+    def get_status(self) -> HAProxyStatus:
+        """Get HAProxy service status with caching.
+        
+        Returns a snapshot taken under _mutex: the shared instance is refreshed
+        in place by concurrent callers and must not be read outside the lock.
+        """
         current_time = time.time()
         
         # Return cached status if still valid
-        if current_time - self._status_cache_time < self._status_cache_ttl and self._status_cache:
-            return self._status_cache
+        with self._mutex:
+            if current_time - self._status_cache_time < self._status_cache_ttl:
+                return replace(self._status)
         
-        is_installed = self.is_installed()
-        is_running = self.is_running() if is_installed else False
-        is_enabled = self.is_enabled() if is_installed else False
+        is_installed, is_running, is_enabled, status_output, service_logs = self._probe_service()
         is_valid, config_msg = self.check_config() if is_installed else (False, "HAProxy not installed")
         config_exists = self.config_path.exists()
         
-        status_output = ""
-        service_logs = ""
-        
-        if is_installed:
-            # Get systemctl status
-            status_result = self._executor.execute_sync(
-                "systemctl status haproxy --no-pager -l",
-                timeout=10
-            )
-            status_output = status_result.stdout if status_result.stdout else status_result.stderr
-            
-            # Get recent logs if not running
-            if not is_running:
-                logs_result = self._executor.execute_sync(
-                    "journalctl -u haproxy -n 20 --no-pager",
-                    timeout=10
-                )
-                service_logs = logs_result.stdout if logs_result.success else ""
-        else:
+        if not is_installed:
             status_output = "HAProxy is not installed. Install with: apt install haproxy"
         
-        result = {
-            "running": is_running,
-            "enabled": is_enabled,  # autostart on boot
-            "installed": is_installed,
-            "config_valid": is_valid,
-            "config_exists": config_exists,
-            "config_message": config_msg,
-            "config_path": str(self.config_path),
-            "status_output": status_output,
-            "service_logs": service_logs
-        }
-        
-        # Cache the result
-        self._status_cache = result
-        self._status_cache_time = current_time
-        
-        return result
+        with self._mutex:
+            status = self._status
+            status.running = is_running
+            status.enabled = is_enabled
+            status.installed = is_installed
+            status.config_valid = is_valid
+            status.config_exists = config_exists
+            status.config_message = config_msg
+            status.config_path = str(self.config_path)
+            status.status_output = status_output
+            status.service_logs = service_logs
+            self._status_cache_time = current_time
+            return replace(status)
     
     def get_logs(self, tail: int = 100) -> str:
         """Get HAProxy service logs via journalctl"""
         result = self._executor.execute_sync(
-            f"journalctl -u haproxy -n {tail} --no-pager",
+            f"journalctl -u haproxy -n {tail} --no-pager -o cat",
             timeout=30
         )
         
@@ -436,7 +808,8 @@ resolvers mydns
         )
         
         # Invalidate status cache
-        self._status_cache = None
+        self._status_cache_time = 0
+        self._drop_stats_socket()
         
         if result.success:
             logger.info("HAProxy reloaded via systemctl")
@@ -457,7 +830,8 @@ resolvers mydns
         )
         
         # Invalidate status cache
-        self._status_cache = None
+        self._status_cache_time = 0
+        self._drop_stats_socket()
         
         if result.success:
             logger.info("HAProxy restarted via systemctl")
@@ -491,12 +865,12 @@ resolvers mydns
         )
         
         # Invalidate status cache
-        self._status_cache = None
+        self._status_cache_time = 0
+        self._drop_stats_socket()
         
         if result.success:
             # Verify it actually started
-            time.sleep(0.5)
-            if self.is_running():
+            if self._wait_running():
                 # Enable autostart on boot
                 enable_result = self._executor.execute_sync(
                     "systemctl enable haproxy",
@@ -532,7 +906,8 @@ resolvers mydns
             timeout=30
         )
         
-        self._status_cache = None
+        self._status_cache_time = 0
+        self._drop_stats_socket()
         
         if result.success:
             disable_result = self._executor.execute_sync(
@@ -563,7 +938,8 @@ resolvers mydns
             timeout=30
         )
         
-        self._status_cache = None
+        self._status_cache_time = 0
+        self._drop_stats_socket()
         
         if result.success:
             logger.info("HAProxy temporarily stopped (autostart unchanged)")
@@ -593,11 +969,11 @@ resolvers mydns
             timeout=30
         )
         
-        self._status_cache = None
+        self._status_cache_time = 0
+        self._drop_stats_socket()
         
         if result.success:
-            time.sleep(0.5)
-            if self.is_running():
+            if self._wait_running():
                 logger.info("HAProxy temporarily started (autostart unchanged)")
                 return True, "HAProxy started"
             else:
@@ -609,11 +985,11 @@ resolvers mydns
     
     @staticmethod
     def _parse_server_opt(opts: str, name: str, cast=str, default=None):
-        m = re.search(rf'{name}\s+(\S+)', opts)
+        m = _server_opt_re(name).search(opts)
         return cast(m.group(1)) if m else default
 
     def _parse_server_line(self, line: str) -> BackendServer | None:
-        m = re.match(r'\s*server\s+(\S+)\s+(\S+):(\d+)(.*)', line)
+        m = _SERVER_PARSE_RE.match(line)
         if not m:
             return None
         srv_name, addr, port, opts = m.groups()
@@ -685,21 +1061,12 @@ resolvers mydns
 
         rules = []
 
-        frontend_pattern = re.compile(
-            r'^frontend\s+(tcp|https)_(\S+)\s*\n(.*?)(?=^frontend|^backend|\Z)',
-            re.MULTILINE | re.DOTALL
-        )
-        backend_pattern = re.compile(
-            r'^backend\s+backend_(tcp|https)_(\S+)\s*\n(.*?)(?=^frontend|^backend|\Z)',
-            re.MULTILINE | re.DOTALL
-        )
-
         frontends = {}
-        for match in frontend_pattern.finditer(content):
+        for match in _FRONTEND_RE.finditer(content):
             rule_type, name, block = match.groups()
-            port_match = re.search(r'bind\s+\*:(\d+)', block)
-            cert_match = re.search(r'ssl\s+crt\s+/etc/letsencrypt/live/([^/]+)/combined\.pem', block) if rule_type == "https" else None
-            bind_line_match = re.search(r'^\s*bind\s+.+$', block, re.MULTILINE)
+            port_match = _BIND_PORT_RE.search(block)
+            cert_match = _CERT_DOMAIN_RE.search(block) if rule_type == "https" else None
+            bind_line_match = _BIND_LINE_RE.search(block)
             accept_proxy = bool(bind_line_match and 'accept-proxy' in bind_line_match.group(0))
 
             frontends[name] = {
@@ -709,14 +1076,14 @@ resolvers mydns
                 "accept_proxy": accept_proxy,
             }
 
-        for match in backend_pattern.finditer(content):
+        for match in _BACKEND_RE.finditer(content):
             rule_type, name, block = match.groups()
             if name not in frontends:
                 continue
 
             fe = frontends[name]
-            server_lines = re.findall(r'^\s*server\s+.+', block, re.MULTILINE)
-            has_balance = bool(re.search(r'^\s*balance\s+', block, re.MULTILINE))
+            server_lines = _SERVER_LINES_RE.findall(block)
+            has_balance = bool(_BALANCE_LINE_RE.search(block))
 
             if len(server_lines) > 1 or has_balance:
                 servers = []
@@ -734,9 +1101,9 @@ resolvers mydns
                     is_balancer=True, servers=servers, balancer_options=balancer_options,
                 ))
             else:
-                server_match = re.search(r'server\s+\S+\s+(\S+):(\d+)', block)
+                server_match = _SERVER_TARGET_RE.search(block)
                 if server_match:
-                    target_ssl = bool(re.search(r'server\s+\S+\s+\S+:\d+\s+ssl', block))
+                    target_ssl = bool(_SERVER_TARGET_SSL_RE.search(block))
                     send_proxy = bool(re.search(r'send-proxy', block))
                     rules.append(HAProxyRule(
                         name=name, rule_type=fe["type"], listen_port=fe["port"],
@@ -792,18 +1159,30 @@ resolvers mydns
         fullchain = cert_dir / "fullchain.pem"
         privkey = cert_dir / "privkey.pem"
         
-        if not fullchain.exists():
+        try:
+            fullchain_mtime = fullchain.stat().st_mtime_ns
+        except OSError:
             logger.warning(f"Certificate fullchain.pem not found for {domain} at {fullchain}")
             return None
         
-        if not privkey.exists():
+        try:
+            privkey_mtime = privkey.stat().st_mtime_ns
+        except OSError:
             logger.warning(f"Certificate privkey.pem not found for {domain} at {privkey}")
             return None
         
+        combined = cert_dir / "combined.pem"
         try:
-            combined = cert_dir / "combined.pem"
-            content = fullchain.read_text() + privkey.read_text()
-            combined.write_text(content)
+            # certbot renew трогает только сертификаты на подходе к истечению —
+            # остальные combined.pem новее своих исходников, пересобирать нечего
+            if combined.stat().st_mtime_ns >= max(fullchain_mtime, privkey_mtime):
+                return combined
+        except OSError:
+            pass
+        
+        try:
+            self._invalidate_cert_info(cert_dir)
+            _concat_files(combined, (fullchain, privkey))
             combined.chmod(0o600)
             logger.info(f"Created/updated combined cert for {domain} at {combined}")
             return combined
@@ -811,12 +1190,13 @@ resolvers mydns
             logger.error(f"Failed to create combined cert for {domain}: {e}")
             return None
     
+    @_with_mutex
     def add_rule(self, rule: HAProxyRule) -> tuple[bool, str]:
         """Add new rule to config"""
         if self.rule_exists(rule.name):
             return False, f"Rule '{rule.name}' already exists"
         
-        if not re.match(r'^[a-zA-Z0-9_-]+$', rule.name):
+        if not _RULE_NAME_RE.match(rule.name):
             return False, "Invalid rule name (use a-z, A-Z, 0-9, -, _)"
         
         if not 1 <= rule.listen_port <= 65535:
@@ -866,17 +1246,17 @@ resolvers mydns
                 server_opts += " send-proxy check-send-proxy"
             server_opts += " check inter 5s fall 3 rise 2"
 
-            new_block = f"""
-frontend {frontend_name}
-    bind *:{rule.listen_port}{accept_proxy_opt}
-    mode tcp
-    default_backend {backend_name}
-
-backend {backend_name}
-    mode tcp
-    option tcp-check
-    server srv1 {rule.target_ip}:{rule.target_port}{resolver_opts}{server_opts}
-"""
+            new_sections = [
+                _TCP_FRONTEND_TEMPLATE.substitute(
+                    frontend_name=frontend_name, listen_port=rule.listen_port,
+                    accept_proxy_opt=accept_proxy_opt, backend_name=backend_name,
+                ),
+                _TCP_BACKEND_TEMPLATE.substitute(
+                    backend_name=backend_name, target_ip=rule.target_ip,
+                    target_port=rule.target_port, resolver_opts=resolver_opts,
+                    server_opts=server_opts,
+                ),
+            ]
         else:
             if not rule.cert_domain:
                 self._restore_config()
@@ -900,22 +1280,21 @@ backend {backend_name}
                 server_line += f" ssl verify none sni str({rule.target_ip})"
             server_line += resolver_opts
 
-            new_block = f"""
-frontend {frontend_name}
-    bind *:{rule.listen_port} ssl crt {cert_path}{accept_proxy_opt}
-    mode http
-    default_backend {backend_name}
-
-backend {backend_name}
-    mode http
-    http-request set-header Host {rule.target_ip}
-    http-request set-header X-Forwarded-Proto https
-    http-request set-header X-Forwarded-For %[src]
-    {server_line}
-"""
+            new_sections = [
+                _HTTPS_FRONTEND_TEMPLATE.substitute(
+                    frontend_name=frontend_name, listen_port=rule.listen_port,
+                    cert_path=cert_path, accept_proxy_opt=accept_proxy_opt,
+                    backend_name=backend_name,
+                ),
+                _HTTPS_BACKEND_TEMPLATE.substitute(
+                    backend_name=backend_name, target_ip=rule.target_ip,
+                    server_line=server_line,
+                ),
+            ]
         
-        content = content.replace(RULES_END_MARKER, new_block + RULES_END_MARKER)
-        self._write_config(content)
+        header, sections, footer = _split_sections(content)
+        sections.extend(new_sections)
+        self._write_config(_join_sections(header, sections, footer))
         
         is_valid, error = self.check_config()
         if not is_valid:
@@ -933,6 +1312,7 @@ backend {backend_name}
             return True, f"Rule created ({reload_msg})"
         return True, "Rule created"
     
+    @_with_mutex
     def delete_rule(self, name: str) -> tuple[bool, str]:
         """Delete rule from config"""
         rule = self.get_rule(name)
@@ -945,17 +1325,11 @@ backend {backend_name}
         frontend_name = f"{rule.rule_type}_{name}"
         backend_name = f"backend_{rule.rule_type}_{name}"
         
-        content = re.sub(
-            rf'^frontend\s+{re.escape(frontend_name)}\s*\n.*?(?=^frontend|^backend|{re.escape(RULES_END_MARKER)})',
-            '', content, flags=re.MULTILINE | re.DOTALL
-        )
-        content = re.sub(
-            rf'^backend\s+{re.escape(backend_name)}\s*\n.*?(?=^frontend|^backend|{re.escape(RULES_END_MARKER)})',
-            '', content, flags=re.MULTILINE | re.DOTALL
-        )
-        content = re.sub(r'\n{3,}', '\n\n', content)
+        header, sections, footer = _split_sections(content)
+        dropped = {("frontend", frontend_name), ("backend", backend_name)}
+        sections = [s for s in sections if _section_name(s) not in dropped]
         
-        self._write_config(content)
+        self._write_config(_join_sections(header, sections, footer))
         
         is_valid, error = self.check_config()
         if not is_valid:
@@ -973,6 +1347,7 @@ backend {backend_name}
             return True, f"Rule deleted ({reload_msg})"
         return True, "Rule deleted"
     
+    @_with_mutex
     def update_rule(self, name: str, updates: dict) -> tuple[bool, str]:
         """Update rule fields. Recreates rule block if type changes."""
         rule = self.get_rule(name)
@@ -1021,37 +1396,33 @@ backend {backend_name}
             
             return True, f"Rule recreated with new type: {new_type}"
         
-        # Simple field updates (no type change) - use regex replacement
+        # Simple field updates (no type change) - edit the rule sections in place
         self._backup_config()
         content = self._read_config()
         
         frontend_name = f"{rule.rule_type}_{name}"
         backend_name = f"backend_{rule.rule_type}_{name}"
         
-        if "listen_port" in updates:
-            port = updates["listen_port"]
-            if not 1 <= port <= 65535:
-                return False, "Invalid listen port"
-            content = re.sub(
-                rf'(frontend\s+{re.escape(frontend_name)}.*?bind\s+\*:)\d+',
-                rf'\g<1>{port}', content, flags=re.DOTALL
-            )
-        
-        if "target_ip" in updates:
-            ip = updates["target_ip"]
-            content = re.sub(
-                rf'(backend\s+{re.escape(backend_name)}.*?server\s+\S+\s+)\S+:(\d+)',
-                rf'\g<1>{ip}:\2', content, flags=re.DOTALL
-            )
+        if "listen_port" in updates and not 1 <= updates["listen_port"] <= 65535:
+            return False, "Invalid listen port"
+        if "target_port" in updates and not 1 <= updates["target_port"] <= 65535:
+            return False, "Invalid target port"
         
-        if "target_port" in updates:
-            port = updates["target_port"]
-            if not 1 <= port <= 65535:
-                return False, "Invalid target port"
-            content = re.sub(
-                rf'(backend\s+{re.escape(backend_name)}.*?server\s+\S+\s+\S+:)\d+',
-                rf'\g<1>{port}', content, flags=re.DOTALL
-            )
+        # Правки только внутри своих секций, а не DOTALL-проход по всему файлу
+        header, sections, footer = _split_sections(content)
+        for i, section in enumerate(sections):
+            section_name = _section_name(section)
+            if section_name == ("frontend", frontend_name):
+                if "listen_port" in updates:
+                    section = _BIND_PORT_SUB_RE.sub(rf'\g<1>{updates["listen_port"]}', section, count=1)
+            elif section_name == ("backend", backend_name):
+                if "target_ip" in updates:
+                    ip = updates["target_ip"]
+                    section = _SERVER_ADDR_SUB_RE.sub(rf'\g<1>{ip}:\2', section, count=1)
+                if "target_port" in updates:
+                    section = _SERVER_PORT_SUB_RE.sub(rf'\g<1>{updates["target_port"]}', section, count=1)
+            sections[i] = section
+        content = _join_sections(header, sections, footer)
 
         # Нормализация: send-proxy без check-send-proxy
         if new_send_proxy:
@@ -1083,6 +1454,7 @@ backend {backend_name}
         """Get full config content"""
         return self._read_config()
     
+    @_with_mutex
     def apply_config(self, config_content: str, reload_after: bool = True, ensure_started: bool = False) -> tuple[bool, str, bool]:
         """Apply HAProxy config from panel.
 
@@ -1125,18 +1497,32 @@ backend {backend_name}
     
     def get_available_certs(self) -> list[str]:
         """Get list of available certificates from /etc/letsencrypt/live/"""
+        try:
+            dir_mtime = self.certs_dir.stat().st_mtime_ns
+        except OSError:
+            return []
+        
+        cached = self._avail_cache
+        if cached and cached[0] == dir_mtime:
+            return list(cached[1])
+        
         certs = []
         
-        if self.certs_dir.exists():
-            for d in self.certs_dir.iterdir():
-                # Handle both directories and symlinks to directories
-                if d.name == "README":
-                    continue
-                if d.is_dir() or (d.is_symlink() and d.resolve().is_dir()):
-                    if (d / "fullchain.pem").exists() and (d / "privkey.pem").exists():
+        try:
+            with os.scandir(self.certs_dir) as entries:
+                for d in entries:
+                    if d.name == "README":
+                        continue
+                    # is_dir() follows symlinks, so symlinked cert dirs count too
+                    if d.is_dir() and os.path.exists(os.path.join(d.path, "fullchain.pem")) \
+                            and os.path.exists(os.path.join(d.path, "privkey.pem")):
                         certs.append(d.name)
+        except OSError:
+            return []
         
-        return sorted(certs)
+        certs.sort()
+        self._avail_cache = (dir_mtime, certs)
+        return list(certs)
     
     def get_cert_info(self, domain: str) -> Optional[dict]:
         """Get certificate information including expiry date and file paths"""
@@ -1147,44 +1533,57 @@ backend {backend_name}
         
         cert_file = cert_dir / "fullchain.pem"
         
-        if not cert_file.exists():
+        try:
+            mtime_ns = cert_file.stat().st_mtime_ns
+        except OSError:
             return None
         
         try:
-            result = subprocess.run(
-                ["openssl", "x509", "-enddate", "-noout", "-in", str(cert_file)],
-                capture_output=True, text=True
-            )
-            if result.returncode == 0:
-                from datetime import datetime
-                date_str = result.stdout.strip().split("=")[1]
-                expiry = datetime.strptime(date_str, "%b %d %H:%M:%S %Y %Z")
-                days_left = (expiry - datetime.now()).days
-                
-                combined = cert_dir / "combined.pem"
-                
-                files = {
-                    "pem": str(combined) if combined.exists() else None,
-                    "key": str(cert_dir / "privkey.pem") if (cert_dir / "privkey.pem").exists() else None,
-                    "cert": str(cert_dir / "cert.pem") if (cert_dir / "cert.pem").exists() else None,
-                    "fullchain": str(cert_file),
-                    "chain": str(cert_dir / "chain.pem") if (cert_dir / "chain.pem").exists() else None,
-                }
-                
-                return {
-                    "domain": domain,
-                    "expiry_date": expiry.isoformat(),
-                    "days_left": days_left,
-                    "expired": days_left < 0,
-                    "combined_exists": combined.exists(),
-                    "cert_path": str(cert_dir),
-                    "files": files
-                }
+            cached = self._cert_info_cache.get(cert_file)
+            if cached and cached[0] == mtime_ns:
+                expiry = cached[1]
+            else:
+                # Первый сертификат в fullchain — листовой, как и у openssl x509
+                cert = x509.load_pem_x509_certificate(cert_file.read_bytes())
+                expiry = cert.not_valid_after_utc
+                self._cert_info_cache[cert_file] = (mtime_ns, expiry)
+            days_left = (expiry - datetime.now(timezone.utc)).days
+            
+            combined = cert_dir / "combined.pem"
+            # Один getdents вместо stat на каждый файл
+            with os.scandir(cert_dir) as entries:
+                names = {e.name for e in entries}
+            
+            files = {
+                "pem": str(combined) if "combined.pem" in names else None,
+                "key": str(cert_dir / "privkey.pem") if "privkey.pem" in names else None,
+                "cert": str(cert_dir / "cert.pem") if "cert.pem" in names else None,
+                "fullchain": str(cert_file),
+                "chain": str(cert_dir / "chain.pem") if "chain.pem" in names else None,
+            }
+            
+            return {
+                "domain": domain,
+                # Без смещения, как раньше отдавал strptime по выводу openssl (время в GMT)
+                "expiry_date": expiry.replace(tzinfo=None).isoformat(),
+                "days_left": days_left,
+                "expired": days_left < 0,
+                "combined_exists": "combined.pem" in names,
+                "cert_path": str(cert_dir),
+                "files": files
+            }
         except Exception as e:
             logger.error(f"Error getting cert info for {domain}: {e}")
         
         return None
     
+    def _invalidate_cert_info(self, cert_dir: Optional[Path] = None):
+        """Drop cached certificate expiry for one directory (or all of them)"""
+        if cert_dir is None:
+            self._cert_info_cache.clear()
+        else:
+            self._cert_info_cache.pop(cert_dir / "fullchain.pem", None)
+    
     def _find_cert_dir(self, domain: str) -> Optional[Path]:
         """Find certificate directory for domain (handles -0001 suffixes and symlinks)"""
         # First try exact match
@@ -1193,13 +1592,19 @@ backend {backend_name}
             return exact
         
         # Look for directories with suffixes like domain-0001, domain-0002
-        if self.certs_dir.exists():
-            for d in sorted(self.certs_dir.iterdir(), reverse=True):
-                # Handle both directories and symlinks
-                is_dir = d.is_dir() or (d.is_symlink() and d.resolve().is_dir())
-                if is_dir and d.name.startswith(domain):
-                    if (d / "fullchain.pem").exists():
-                        return d
+        # Фильтруем до сортировки: обычно кандидат один, а в live/ их может быть сотни
+        prefix = domain + "-"
+        try:
+            with os.scandir(self.certs_dir) as it:
+                candidates = [e for e in it if e.name == domain or e.name.startswith(prefix)]
+        except OSError:
+            return None
+        candidates.sort(key=lambda e: e.name, reverse=True)
+        
+        for d in candidates:
+            # is_dir() follows symlinks, so symlinked cert dirs count too
+            if d.is_dir() and os.path.exists(os.path.join(d.path, "fullchain.pem")):
+                return Path(d.path)
         
         return None
     
@@ -1213,9 +1618,7 @@ backend {backend_name}
         
         Returns: (success, message, error_log)
         """
-        from app.services.firewall_manager import get_firewall_manager
-        
-        if not shutil.which("certbot"):
+        if not _find_certbot():
             return False, "certbot not installed in container", None
         
         # Build certbot command
@@ -1229,19 +1632,18 @@ backend {backend_name}
         if method == "standalone":
             # Open port 80 in firewall for domain validation
             firewall = get_firewall_manager()
-            port_opened, fw_msg, fw_error = firewall.add_rule(80, "tcp")
+            port_opened, fw_msg, fw_error = await asyncio.to_thread(firewall.add_rule, 80, "tcp")
             if port_opened:
                 logger.info(f"Firewall: port 80 opened for certificate generation")
             else:
                 logger.warning(f"Could not open port 80: {fw_msg}")
             
-            was_running = self.is_running()
-            
-            rules = self.parse_rules()
+            rules = await asyncio.to_thread(self.parse_rules)
             uses_port_80 = any(r.listen_port == 80 for r in rules)
+            was_running = uses_port_80 and await asyncio.to_thread(self.is_running)
             
             if uses_port_80 and was_running:
-                success, msg = self._temporary_stop()
+                success, msg = await asyncio.to_thread(self._temporary_stop)
                 if success:
                     logger.info("Stopped HAProxy for certificate generation")
                 else:
@@ -1251,21 +1653,9 @@ backend {backend_name}
             error_log = None
             
             try:
-                # Use async subprocess to avoid blocking event loop
-                process = await asyncio.create_subprocess_exec(
-                    *cmd,
-                    stdout=asyncio.subprocess.PIPE,
-                    stderr=asyncio.subprocess.PIPE
-                )
-                
                 try:
-                    stdout, stderr = await asyncio.wait_for(process.communicate(), timeout=120)
-                    stdout_str = stdout.decode('utf-8', errors='replace') if stdout else ""
-                    stderr_str = stderr.decode('utf-8', errors='replace') if stderr else ""
-                    returncode = process.returncode
+                    returncode, stdout_str, stderr_str = await _run_certbot(cmd, timeout=120)
                 except asyncio.TimeoutError:
-                    process.kill()
-                    await process.wait()
                     return False, "Certificate generation timed out (120s)", f"Command: {' '.join(cmd)}\n\nError: Timeout"
                 
                 if returncode == 0:
@@ -1273,7 +1663,7 @@ backend {backend_name}
                     cert_dir = self._find_cert_dir(domain)
                     if cert_dir:
                         actual_domain = cert_dir.name
-                        self._create_combined_cert(actual_domain)
+                        await asyncio.to_thread(self._create_combined_cert, actual_domain)
                         message = f"Certificate for {domain} generated successfully"
                         logger.info(message)
                         success = True
@@ -1293,7 +1683,7 @@ backend {backend_name}
                 success = False
             finally:
                 if uses_port_80 and was_running:
-                    start_success, start_msg = self._temporary_start()
+                    start_success, start_msg = await asyncio.to_thread(self._temporary_start)
                     if start_success:
                         logger.info("HAProxy restarted after certificate generation")
                     else:
@@ -1306,27 +1696,15 @@ backend {backend_name}
             cmd.extend(["--webroot", "-w", webroot_path, "-d", domain])
             
             try:
-                # Use async subprocess to avoid blocking event loop
-                process = await asyncio.create_subprocess_exec(
-                    *cmd,
-                    stdout=asyncio.subprocess.PIPE,
-                    stderr=asyncio.subprocess.PIPE
-                )
-                
                 try:
-                    stdout, stderr = await asyncio.wait_for(process.communicate(), timeout=120)
-                    stdout_str = stdout.decode('utf-8', errors='replace') if stdout else ""
-                    stderr_str = stderr.decode('utf-8', errors='replace') if stderr else ""
-                    returncode = process.returncode
+                    returncode, stdout_str, stderr_str = await _run_certbot(cmd, timeout=120)
                 except asyncio.TimeoutError:
-                    process.kill()
-                    await process.wait()
                     return False, "Certificate generation timed out (120s)", f"Command: {' '.join(cmd)}\n\nError: Timeout"
                 
                 if returncode == 0:
                     cert_dir = self._find_cert_dir(domain)
                     if cert_dir:
-                        self._create_combined_cert(cert_dir.name)
+                        await asyncio.to_thread(self._create_combined_cert, cert_dir.name)
                     return True, f"Certificate for {domain} generated successfully", None
                 else:
                     error_log = f"Command: {' '.join(cmd)}\n\nExit code: {returncode}\n\nStdout:\n{stdout_str}\n\nStderr:\n{stderr_str}"
@@ -1341,53 +1719,19 @@ backend {backend_name}
     
     async def renew_certificates(self) -> tuple[bool, str, list[str]]:
         """Renew all Let's Encrypt certificates (async)"""
-        from app.services.firewall_manager import get_firewall_manager
-        
-        if not shutil.which("certbot"):
+        if not _find_certbot():
             return False, "certbot not installed", []
         
         logger.info("Starting renewal of all certificates")
         
-        # Open port 80 in firewall for domain validation
-        firewall = get_firewall_manager()
-        port_opened, fw_msg, fw_error = firewall.add_rule(80, "tcp")
-        if port_opened:
-            logger.info("Firewall: port 80 opened for certificate renewal")
-        else:
-            logger.warning(f"Could not open port 80: {fw_msg}")
-        
-        # Only stop HAProxy if it actually holds port 80 — certbot standalone needs
-        # that port free. Stopping it unconditionally kills every established tunnel
-        # on every other port (443 etc.) for the whole duration of the renewal.
-        was_running = self.is_running()
-        rules = self.parse_rules()
-        uses_port_80 = any(r.listen_port == 80 for r in rules)
-
-        if uses_port_80 and was_running:
-            success, msg = self._temporary_stop()
-            if success:
-                logger.info("Stopped HAProxy for certificate renewal (a rule binds port 80)")
-            else:
-                logger.warning(f"Could not stop HAProxy: {msg}")
+        restart_needed = await self._free_port_80("certificate renewal")
 
         try:
             logger.info("Running certbot renew --non-interactive")
             
-            # Use async subprocess to avoid blocking event loop
-            process = await asyncio.create_subprocess_exec(
-                "certbot", "renew", "--non-interactive",
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
-            
             try:
-                stdout, stderr = await asyncio.wait_for(process.communicate(), timeout=300)
-                stdout_str = stdout.decode('utf-8', errors='replace') if stdout else ""
-                stderr_str = stderr.decode('utf-8', errors='replace') if stderr else ""
-                returncode = process.returncode
+                returncode, stdout_str, stderr_str = await _run_certbot(["certbot", "renew", "--non-interactive"], timeout=300)
             except asyncio.TimeoutError:
-                process.kill()
-                await process.wait()
                 logger.error("Certificate renewal timed out")
                 return False, "Renewal timed out (300s)", []
             
@@ -1401,12 +1745,12 @@ backend {backend_name}
             failed = []
             
             # Update combined certs for ALL available certificates
-            available_certs = self.get_available_certs()
+            available_certs = await asyncio.to_thread(self.get_available_certs)
             logger.info(f"Updating combined certificates for {len(available_certs)} domains: {available_certs}")
             
-            for domain in available_certs:
-                logger.info(f"Processing certificate for {domain}")
-                if self._create_combined_cert(domain):
+            results = await asyncio.to_thread(self._create_combined_certs, available_certs)
+            for domain, combined in zip(available_certs, results):
+                if combined:
                     renewed.append(domain)
                 else:
                     failed.append(domain)
@@ -1427,61 +1771,60 @@ backend {backend_name}
             renewed = []
             logger.exception("Exception during certificate renewal")
         finally:
-            if uses_port_80 and was_running:
-                start_success, start_msg = self._temporary_start()
-                if start_success:
-                    logger.info("HAProxy restarted after certificate renewal")
-                else:
-                    logger.error(f"Failed to restart HAProxy: {start_msg}")
+            if restart_needed:
+                await self._restart_after_port_80("certificate renewal")
 
         if renewed:
-            self.reload(auto_start=False)
+            await asyncio.to_thread(self.reload, auto_start=False)
         
         return success, message, renewed
     
-    async def renew_certificate(self, domain: str) -> tuple[bool, str, Optional[str]]:
-        """
-        Renew specific Let's Encrypt certificate (async)
+    async def _free_port_80(self, purpose: str) -> bool:
+        """Open port 80 and stop HAProxy if a rule binds it (certbot standalone needs it).
         
-        Args:
-            domain: Domain name to renew
-        
-        Returns: (success, message, output_log)
+        Returns True when HAProxy has to be started again afterwards.
         """
-        from app.services.firewall_manager import get_firewall_manager
-        
-        if not shutil.which("certbot"):
-            return False, "certbot not installed", None
-        
-        # Check if certificate exists
-        cert_dir = self._find_cert_dir(domain)
-        if not cert_dir:
-            return False, f"Certificate for {domain} not found", None
-        
-        logger.info(f"Starting certificate renewal for {domain} (cert_dir: {cert_dir.name})")
-        
-        # Open port 80 in firewall for domain validation (same as generate)
         firewall = get_firewall_manager()
-        port_opened, fw_msg, fw_error = firewall.add_rule(80, "tcp")
+        port_opened, fw_msg, fw_error = await asyncio.to_thread(firewall.add_rule, 80, "tcp")
         if port_opened:
-            logger.info("Firewall: port 80 opened for certificate renewal")
+            logger.info(f"Firewall: port 80 opened for {purpose}")
         else:
             logger.warning(f"Could not open port 80: {fw_msg}")
         
-        # Only stop HAProxy if it actually holds port 80 — see renew_certificates().
-        was_running = self.is_running()
-        rules = self.parse_rules()
-        uses_port_80 = any(r.listen_port == 80 for r in rules)
-
-        if uses_port_80 and was_running:
-            success, msg = self._temporary_stop()
-            if success:
-                logger.info("Stopped HAProxy for certificate renewal (a rule binds port 80)")
-            else:
-                logger.warning(f"Could not stop HAProxy: {msg}")
-
-        output_log = ""
-        try:
+        # Only stop HAProxy if it actually holds port 80 — certbot standalone needs
+        # that port free. Stopping it unconditionally kills every established tunnel
+        # on every other port (443 etc.) for the whole duration of the renewal.
+        # Правила читаются из файла, is_running — запрос к сокету/systemctl: без
+        # правила на :80 статус сервиса не нужен вовсе
+        rules = await asyncio.to_thread(self.parse_rules)
+        if not any(r.listen_port == 80 for r in rules):
+            return False
+        if not await asyncio.to_thread(self.is_running):
+            return False
+        
+        success, msg = await asyncio.to_thread(self._temporary_stop)
+        if success:
+            logger.info(f"Stopped HAProxy for {purpose} (a rule binds port 80)")
+        else:
+            logger.warning(f"Could not stop HAProxy: {msg}")
+        return True
+    
+    async def _restart_after_port_80(self, purpose: str):
+        start_success, start_msg = await asyncio.to_thread(self._temporary_start)
+        if start_success:
+            logger.info(f"HAProxy restarted after {purpose}")
+        else:
+            logger.error(f"Failed to restart HAProxy: {start_msg}")
+    
+    async def _renew_one(self, domain: str, cert_name: str, force: bool = False) -> tuple[bool, str, str]:
+        """Run certbot for one domain with port 80 already free.
+        
+        Without force certbot renew reuses the stored renewal config and only
+        contacts the ACME server when the certificate is due.
+        
+        Returns: (success, message, output_log)
+        """
+        if force:
             # Use certonly --standalone like during generation (more reliable than renew)
             # This explicitly uses standalone authenticator and doesn't depend on renewal config
             cmd = [
@@ -1493,24 +1836,15 @@ backend {backend_name}
                 "--force-renewal",
                 "-d", domain
             ]
-            
+        else:
+            cmd = ["certbot", "renew", "--cert-name", cert_name, "--non-interactive"]
+        
+        try:
             logger.info(f"Running certbot command: {' '.join(cmd)}")
             
-            # Use async subprocess to avoid blocking event loop
-            process = await asyncio.create_subprocess_exec(
-                *cmd,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
-            
             try:
-                stdout, stderr = await asyncio.wait_for(process.communicate(), timeout=300)
-                stdout_str = stdout.decode('utf-8', errors='replace') if stdout else ""
-                stderr_str = stderr.decode('utf-8', errors='replace') if stderr else ""
-                returncode = process.returncode
+                returncode, stdout_str, stderr_str = await _run_certbot(cmd, timeout=300)
             except asyncio.TimeoutError:
-                process.kill()
-                await process.wait()
                 logger.error(f"Certificate renewal timed out for {domain}")
                 return False, "Certificate renewal timed out (300s)", f"Command: {' '.join(cmd)}\n\nError: Timeout"
             
@@ -1522,47 +1856,133 @@ backend {backend_name}
             if stderr_str:
                 logger.debug(f"Certbot stderr: {stderr_str[:500]}")
             
-            if returncode == 0:
-                # Find the cert directory (may have suffix like -0001) and update combined cert
-                renewed_cert_dir = self._find_cert_dir(domain)
-                if renewed_cert_dir:
-                    self._create_combined_cert(renewed_cert_dir.name)
-                    message = f"Certificate for {domain} renewed successfully"
-                    success = True
-                    logger.info(message)
-                else:
-                    message = f"Certificate renewed but directory not found for {domain}"
-                    success = False
-                    logger.error(message)
-            else:
+            if returncode != 0:
                 message = stderr_str or stdout_str or "Renewal failed"
-                success = False
                 logger.error(f"Certificate renewal failed for {domain}: {message[:200]}")
-                
+                return False, message, output_log
+            
+            # Find the cert directory (may have suffix like -0001) and update combined cert
+            renewed_cert_dir = self._find_cert_dir(domain)
+            if not renewed_cert_dir:
+                message = f"Certificate renewed but directory not found for {domain}"
+                logger.error(message)
+                return False, message, output_log
+            
+            await asyncio.to_thread(self._create_combined_cert, renewed_cert_dir.name)
+            message = f"Certificate for {domain} renewed successfully"
+            logger.info(message)
+            return True, message, output_log
+        
         except Exception as e:
-            message = str(e)
-            output_log = f"Exception: {str(e)}"
-            success = False
             logger.exception(f"Exception during certificate renewal for {domain}")
+            return False, str(e), f"Exception: {str(e)}"
+    
+    def _renewal_due(self, cert_name: str) -> bool:
+        """Same threshold certbot renew uses; unreadable certs count as due"""
+        info = self.get_cert_info(cert_name)
+        return info is None or info["days_left"] <= RENEW_BEFORE_DAYS
+    
+    async def renew_certificate(self, domain: str, force: bool = False) -> tuple[bool, str, Optional[str]]:
+        """
+        Renew specific Let's Encrypt certificate (async)
+        
+        Args:
+            domain: Domain name to renew
+            force: Order a new certificate even if the current one is not due
+        
+        Returns: (success, message, output_log)
+        """
+        if not _find_certbot():
+            return False, "certbot not installed", None
+        
+        # Check if certificate exists
+        cert_dir = self._find_cert_dir(domain)
+        if not cert_dir:
+            return False, f"Certificate for {domain} not found", None
+        
+        # Не due — certbot всё равно ничего не сделает, а HAProxy уже был бы остановлен
+        if not force and not await asyncio.to_thread(self._renewal_due, cert_dir.name):
+            return True, f"Certificate for {domain} is not due for renewal", None
+        
+        logger.info(f"Starting certificate renewal for {domain} (cert_dir: {cert_dir.name}, force={force})")
+        
+        restart_needed = await self._free_port_80("certificate renewal")
+        try:
+            success, message, output_log = await self._renew_one(domain, cert_dir.name, force)
         finally:
-            if uses_port_80 and was_running:
-                start_success, start_msg = self._temporary_start()
-                if start_success:
-                    logger.info("HAProxy restarted after certificate renewal")
-                else:
-                    logger.error(f"Failed to restart HAProxy: {start_msg}")
+            if restart_needed:
+                await self._restart_after_port_80("certificate renewal")
 
         if success:
-            self.reload(auto_start=False)
+            await asyncio.to_thread(self.reload, auto_start=False)
         
         return success, message, output_log
     
+    async def renew_certificates_batch(
+        self, domains: list[str], force: bool = False
+    ) -> tuple[bool, str, list[str]]:
+        """Renew several certificates with one port-80 / HAProxy stop-start cycle (async)
+        
+        certbot has no multi-certificate form of certonly (several -d make one
+        SAN certificate), so domains are still renewed one by one; what is
+        shared is the firewall change, the HAProxy downtime window and the
+        final reload.
+        
+        Returns: (success, message, renewed_domains)
+        """
+        if not _find_certbot():
+            return False, "certbot not installed", []
+        
+        cert_dirs = {d: self._find_cert_dir(d) for d in domains}
+        missing = [d for d, cert_dir in cert_dirs.items() if not cert_dir]
+        targets = [d for d, cert_dir in cert_dirs.items() if cert_dir]
+        if not targets:
+            return False, "No certificates found for the requested domains", []
+        if not force:
+            due = await asyncio.to_thread(
+                lambda: [d for d in targets if self._renewal_due(cert_dirs[d].name)]
+            )
+            if not due:
+                message = "No certificates are due for renewal"
+                if missing:
+                    message += f" (not found: {', '.join(missing)})"
+                return not missing, message, []
+            targets = due
+        
+        logger.info(f"Starting batch renewal for {len(targets)} certificates: {targets}")
+        
+        renewed = []
+        failed = list(missing)
+        restart_needed = await self._free_port_80("batch certificate renewal")
+        try:
+            for domain in targets:
+                success, _, _ = await self._renew_one(domain, cert_dirs[domain].name, force)
+                (renewed if success else failed).append(domain)
+        finally:
+            if restart_needed:
+                await self._restart_after_port_80("batch certificate renewal")
+        
+        if renewed:
+            await asyncio.to_thread(self.reload, auto_start=False)
+        
+        message = f"Batch renewal completed. Renewed: {len(renewed)}, Failed: {len(failed)}"
+        if failed:
+            message += f" ({', '.join(failed)})"
+        return not failed, message, renewed
+    
+    def _create_combined_certs(self, domains: list[str]) -> list[Optional[Path]]:
+        """_create_combined_cert for many domains; каждый домен — своя пара
+        чтение/запись, поэтому они идут параллельно в пуле потоков"""
+        if len(domains) <= 1:
+            return [self._create_combined_cert(d) for d in domains]
+        with ThreadPoolExecutor(max_workers=min(COMBINE_WORKERS, len(domains))) as pool:
+            return list(pool.map(self._create_combined_cert, domains))
+    
     def update_combined_certs(self) -> list[str]:
         """Update all combined certificates from Let's Encrypt"""
-        updated = []
-        for domain in self.get_available_certs():
-            if self._create_combined_cert(domain):
-                updated.append(domain)
+        domains = self.get_available_certs()
+        results = self._create_combined_certs(domains)
+        updated = [d for d, combined in zip(domains, results) if combined]
         
         if updated:
             # Reload only if HAProxy is running
@@ -1584,8 +2004,26 @@ backend {backend_name}
         
         return certs_info
     
+    async def get_cert_info_async(self, domain: str) -> Optional[dict]:
+        """get_cert_info off the event loop"""
+        return await asyncio.to_thread(self.get_cert_info, domain)
+    
+    async def get_all_certs_info_async(self) -> list[dict]:
+        """Get information about all available certificates, reading them concurrently"""
+        domains = await asyncio.to_thread(self.get_available_certs)
+        infos = await asyncio.gather(*(self.get_cert_info_async(d) for d in domains))
+        
+        certs_info = [info for info in infos if info]
+        # Sort by days_left (closest to expiry first)
+        certs_info.sort(key=lambda x: x.get("days_left", 999999))
+        
+        return certs_info
+    
     def delete_certificate(self, domain: str) -> tuple[bool, str]:
         """Delete certificate files for a domain"""
+        if not _is_valid_domain(domain):
+            return False, "Invalid domain name"
+        
         deleted_files = []
         errors = []
         
@@ -1607,6 +2045,24 @@ backend {backend_name}
         
         if not cert_dir.exists():
             return False, f"Certificate for {domain} not found"
+        # Удаляем только собственный каталог сертификата внутри live/, никогда её саму
+        if cert_dir.parent != self.certs_dir:
+            return False, f"Refusing to delete {cert_dir}: not a certificate directory"
+        
+        self._invalidate_cert_info(cert_dir)
+        self._avail_cache = None
+        
+        # Обычный случай — один проход rmtree (заодно уносит README и прочий мусор).
+        # Симлинк на каталог rmtree не трогает, а при нехватке прав нужен
+        # поштучный учёт удалённого — для этого остаётся старый путь ниже.
+        if not cert_dir.is_symlink():
+            try:
+                removed = [str(cert_dir / name) for name in os.listdir(cert_dir)]
+                shutil.rmtree(cert_dir)
+                logger.info(f"Deleted certificate for {domain}")
+                return True, f"Certificate for {domain} deleted successfully ({len(removed) + 1} files)"
+            except OSError as e:
+                logger.warning(f"rmtree of {cert_dir} failed, deleting files one by one: {e}")
         
         try:
             # Delete certificate files
@@ -1643,7 +2099,7 @@ backend {backend_name}
     ) -> tuple[bool, str]:
         """Upload custom certificate to /etc/letsencrypt/live/{domain}/"""
         
-        if not domain or not re.match(r'^[a-zA-Z0-9.-]+$', domain):
+        if not _is_valid_domain(domain):
             return False, "Invalid domain name"
         
         if not cert_content or not key_content:
@@ -1655,6 +2111,17 @@ backend {backend_name}
         if "-----BEGIN" not in key_content or "PRIVATE KEY" not in key_content:
             return False, "Invalid key format (missing PRIVATE KEY)"
         
+        # Validate certificate and key before saving
+        try:
+            x509.load_pem_x509_certificate(cert_content.encode())
+        except ValueError as e:
+            return False, f"Invalid certificate: {e}"
+        
+        try:
+            serialization.load_pem_private_key(key_content.encode(), password=None)
+        except (ValueError, TypeError) as e:
+            return False, f"Invalid private key: {e}"
+        
         cert_dir = self.certs_dir / domain
         cert_dir.mkdir(parents=True, exist_ok=True)
         
@@ -1663,21 +2130,6 @@ backend {backend_name}
         combined_file = cert_dir / "combined.pem"
         
         try:
-            # Validate certificate before saving
-            import tempfile
-            with tempfile.NamedTemporaryFile(mode='w', suffix='.pem', delete=False) as tmp:
-                tmp.write(cert_content)
-                tmp_path = tmp.name
-            
-            result = subprocess.run(
-                ["openssl", "x509", "-noout", "-in", tmp_path],
-                capture_output=True, text=True
-            )
-            Path(tmp_path).unlink()
-            
-            if result.returncode != 0:
-                return False, "Invalid certificate: OpenSSL validation failed"
-            
             # Save certificate (as fullchain)
             fullchain_file.write_text(cert_content.strip() + "\n")
             fullchain_file.chmod(0o644)
@@ -1690,6 +2142,8 @@ backend {backend_name}
             combined_content = cert_content.strip() + "\n" + key_content.strip() + "\n"
             combined_file.write_text(combined_content)
             combined_file.chmod(0o600)
+            self._invalidate_cert_info(cert_dir)
+            self._avail_cache = None
             
             logger.info(f"Uploaded certificate for {domain}")
             return True, f"Certificate for {domain} uploaded successfully"
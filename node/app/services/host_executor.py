@@ -5,24 +5,73 @@ Requires container to run with: privileged: true, pid: host
 """
 
 import asyncio
+import codecs
+import contextlib
+import functools
 import json
 import logging
 import os
+import selectors
+import signal
+import subprocess
 import time
+import uuid
+from collections import deque
 from dataclasses import dataclass
-from typing import Optional, AsyncGenerator
+from typing import Literal, Optional, AsyncGenerator
+
+from app.config import get_settings
+
+try:
+    import orjson
+    _json_bytes = orjson.dumps
+except ImportError:
+    def _json_bytes(obj) -> bytes:
+        return json.dumps(obj).encode()
 
 logger = logging.getLogger(__name__)
 
 # Maximum allowed timeout (10 minutes)
 MAX_TIMEOUT = 600
 DEFAULT_TIMEOUT = 30
+STREAM_READ_SIZE = 64 * 1024
+# Микро-пачки строк в execute_stream: до 32 строк или 20 мс на один SSE-кадр
+STREAM_BATCH_MAX_LINES = 32
+STREAM_BATCH_MAX_MS = 20
+# Если команда молчит, раз в 15 с шлём SSE-комментарий, чтобы прокси не рвали соединение
+STREAM_KEEPALIVE_S = 15
 
 # Extended PATH to include common binary locations (snap, local bins, etc.)
 EXTENDED_PATH = "/snap/bin:/usr/local/sbin:/usr/local/bin:/usr/sbin:/usr/bin:/sbin:/bin"
 
+# SSE-кадры собираются сразу в bytes: неизменные части заготовлены один раз
+_SSE_HEADERS = {
+    name: f"event: {name}\ndata: ".encode()
+    for name in ("stdout", "stderr", "stdout_batch", "stderr_batch")
+}
+_SSE_TAIL = b"\n\n"
+_SSE_KEEPALIVE = b": keepalive\n\n"
+
+# Какие потоки execute() читает; остальные уходят в /dev/null
+Capture = Literal["both", "stdout", "stderr", "none"]
+# Завершающие кадры: форма фиксирована, подставляются только значения
+_DONE_TMPL = b'event: done\ndata: {"exit_code":%d,"execution_time_ms":%d,"success":%s}\n\n'
+_ERROR_TMPL = b'event: error\ndata: {"message":%s}\n\n'
+
+
+def _sse_frame(event: str, data: dict) -> bytes:
+    return b"".join((_SSE_HEADERS[event], _json_bytes(data), _SSE_TAIL))
+
+
+def _done_frame(exit_code: int, execution_time_ms: int) -> bytes:
+    return _DONE_TMPL % (exit_code, execution_time_ms, b"true" if exit_code == 0 else b"false")
 
-@dataclass
+
+def _error_frame(message: str) -> bytes:
+    return _ERROR_TMPL % _json_bytes(message)
+
+
+@dataclass(slots=True)
 class ExecuteResult:
     """Result of command execution"""
     success: bool
@@ -31,13 +80,390 @@ class ExecuteResult:
     stderr: str
     execution_time_ms: int
     error: Optional[str] = None
+    truncated: bool = False
+
+
+_WHITESPACE = frozenset(b" \t\n\r\x0b\x0c")
+
+
+def _decode_output(data: bytes, dropped: int = 0) -> str:
+    """Captured stream -> str for ExecuteResult, noting bytes cut by the output cap"""
+    # Пробелы по краям отрезаем по индексам в bytes и декодируем срез
+    # memoryview: ни копии bytes, ни второй строки от str.strip()
+    start, end = 0, len(data)
+    while end > start and data[end - 1] in _WHITESPACE:
+        end -= 1
+    while start < end and data[start] in _WHITESPACE:
+        start += 1
+    text = str(memoryview(data)[start:end], 'utf-8', 'replace')
+    if dropped:
+        text += f"\n... <truncated {dropped} bytes>"
+    return text
+
+
+async def _drain_capped(stream: Optional[asyncio.StreamReader], cap: int) -> tuple[bytes, int]:
+    """Read stream to EOF keeping at most cap bytes; returns (kept, dropped byte count).
+    
+    The rest is read and thrown away rather than left in the pipe, so the
+    command is not blocked and still reports its real exit code.
+    """
+    if stream is None:
+        return b"", 0
+    buf = bytearray()
+    dropped = 0
+    while True:
+        chunk = await stream.read(STREAM_READ_SIZE)
+        if not chunk:
+            return bytes(buf), dropped
+        room = cap - len(buf)
+        if room > 0:
+            buf += chunk[:room]
+        dropped += max(0, len(chunk) - max(room, 0))
+
+
+def _kill_process_group(process) -> None:
+    """SIGKILL a command started with start_new_session=True together with its children"""
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        try:
+            process.kill()
+        except ProcessLookupError:
+            pass
+
+
+class _ThreadSpawnedProcess:
+    """asyncio.subprocess.Process look-alike over a Popen started in a worker thread.
+    
+    Only what HostExecutor uses: pid, returncode, stdout/stderr StreamReaders,
+    kill(), wait(), communicate().
+    """
+    
+    def __init__(
+        self,
+        popen: subprocess.Popen,
+        stdout: Optional[asyncio.StreamReader],
+        stderr: Optional[asyncio.StreamReader]
+    ):
+        self._popen = popen
+        self.pid = popen.pid
+        self.stdout = stdout
+        self.stderr = stderr
+    
+    @property
+    def returncode(self) -> Optional[int]:
+        return self._popen.poll()
+    
+    def kill(self) -> None:
+        self._popen.kill()
+    
+    async def wait(self) -> int:
+        return await asyncio.to_thread(self._popen.wait)
+    
+    async def communicate(self) -> tuple[Optional[bytes], Optional[bytes]]:
+        async def read(stream):
+            return await stream.read() if stream is not None else None
+        
+        stdout, stderr = await asyncio.gather(read(self.stdout), read(self.stderr))
+        await self.wait()
+        return stdout, stderr
+
+
+class _StreamProtocol(asyncio.SubprocessProtocol):
+    """execute_stream plumbing: pipe callbacks split output into lines directly.
+    
+    No StreamReader or reader tasks: pipe_data_received decodes the chunk and
+    appends (stream_name, line) tuples to `lines`, setting `data_ready`; EOF
+    of a pipe appends (stream_name, None). When `lines` reaches `limit`, both
+    pipes are paused until the consumer drains it below half of that, so a
+    slow SSE client backs up into the command's pipe buffer.
+    
+    Also stands in for the process object: pid, returncode, kill(), wait().
+    """
+    
+    _NAMES = {1: "stdout", 2: "stderr"}
+    
+    def __init__(self, limit: int):
+        self.lines: deque = deque()
+        self.data_ready = asyncio.Event()
+        self.discard = False
+        self.pid: Optional[int] = None
+        self._limit = max(1, limit)
+        self._paused = False
+        self._decoders = {fd: codecs.getincrementaldecoder('utf-8')(errors='replace') for fd in self._NAMES}
+        self._pending = {fd: "" for fd in self._NAMES}
+        self._pipes: dict[int, asyncio.BaseTransport] = {}
+        self._transport: Optional[asyncio.SubprocessTransport] = None
+        self._popen: Optional[subprocess.Popen] = None
+        self._exited = asyncio.Event()
+    
+    def connection_made(self, transport):
+        self._transport = transport
+        self.pid = transport.get_pid()
+        self._pipes = {fd: transport.get_pipe_transport(fd) for fd in self._NAMES}
+    
+    async def attach_popen(self, popen: subprocess.Popen) -> None:
+        """Wire a Popen started outside the loop (HOST_EXEC_THREADED_SPAWN)"""
+        loop = asyncio.get_running_loop()
+        self._popen = popen
+        self.pid = popen.pid
+        for fd, pipe in ((1, popen.stdout), (2, popen.stderr)):
+            self._pipes[fd], _ = await loop.connect_read_pipe(lambda fd=fd: _PipeForwarder(self, fd), pipe)
+        asyncio.ensure_future(asyncio.to_thread(popen.wait)).add_done_callback(lambda _: self.process_exited())
+    
+    def pipe_data_received(self, fd, data):
+        if self.discard:
+            return
+        name = self._NAMES[fd]
+        *lines, pending = (self._pending[fd] + self._decoders[fd].decode(data)).split('\n')
+        self.lines.extend((name, line.rstrip('\r')) for line in lines)
+        if len(pending) > STREAM_READ_SIZE:
+            # Строка без перевода строки не копится бесконечно
+            self.lines.append((name, pending))
+            pending = ""
+        self._pending[fd] = pending
+        self.data_ready.set()
+        if len(self.lines) >= self._limit and not self._paused:
+            self._paused = True
+            for pipe in self._pipes.values():
+                if not pipe.is_closing():
+                    pipe.pause_reading()
+    
+    def pipe_connection_lost(self, fd, exc):
+        if fd not in self._NAMES:
+            return
+        name = self._NAMES[fd]
+        pending = self._pending[fd] + self._decoders[fd].decode(b"", final=True)
+        if pending and not self.discard:
+            self.lines.append((name, pending.rstrip('\r')))
+        self.lines.append((name, None))
+        self.data_ready.set()
+    
+    def process_exited(self):
+        self._exited.set()
+    
+    def popleft(self) -> tuple[str, Optional[str]]:
+        item = self.lines.popleft()
+        if self._paused and len(self.lines) <= self._limit // 2:
+            self._paused = False
+            for pipe in self._pipes.values():
+                if not pipe.is_closing():
+                    pipe.resume_reading()
+        return item
+    
+    @property
+    def returncode(self) -> Optional[int]:
+        if self._popen is not None:
+            return self._popen.poll()
+        return self._transport.get_returncode() if self._transport is not None else None
+    
+    def kill(self) -> None:
+        if self._popen is not None:
+            self._popen.kill()
+        elif self._transport is not None:
+            self._transport.kill()
+    
+    async def wait(self) -> Optional[int]:
+        await self._exited.wait()
+        return self.returncode
+    
+    def close(self) -> None:
+        for pipe in self._pipes.values():
+            pipe.close()
+        if self._transport is not None:
+            self._transport.close()
+
+
+class _PipeForwarder(asyncio.Protocol):
+    """connect_read_pipe protocol feeding one fd of a _StreamProtocol"""
+    
+    def __init__(self, owner: _StreamProtocol, fd: int):
+        self._owner = owner
+        self._fd = fd
+    
+    def data_received(self, data):
+        self._owner.pipe_data_received(self._fd, data)
+    
+    def connection_lost(self, exc):
+        self._owner.pipe_connection_lost(self._fd, exc)
+
+
+class _SessionDied(Exception):
+    """The persistent shell went away before the command was handed to it"""
+
+
+class _HostSession:
+    """Long-lived `[nsenter ...] <shell>` fed commands over stdin.
+    
+    Each command runs in a subshell with stdin from /dev/null, so cd/export/exit
+    do not leak into the session or into the next command. Completion is
+    detected by a per-command marker: on stdout it carries $?, on stderr it
+    just terminates that stream's output.
+    
+    Not safe for concurrent use on its own: HostExecutor serialises callers
+    with `lock` (one command in flight per session).
+    """
+    
+    def __init__(self, process):
+        self.process = process
+        self.lock = asyncio.Lock()
+        self._killed = False
+    
+    @property
+    def alive(self) -> bool:
+        # returncode появляется только после reap, kill() отмечаем сами
+        return not self._killed and self.process.returncode is None
+    
+    async def run(
+        self,
+        prepared_command: str,
+        capture: Capture = "both",
+        cap: int = 0
+    ) -> tuple[int, tuple[bytes, int], tuple[bytes, int]]:
+        """Run one command; returns (exit code, (stdout, dropped), (stderr, dropped))"""
+        token = uuid.uuid4().hex
+        out_marker = f"\n__END_{token}__:".encode()
+        err_marker = f"\n__END_{token}__\n".encode()
+        redirects = "</dev/null"
+        if capture in ("stderr", "none"):
+            redirects += " >/dev/null"
+        if capture in ("stdout", "none"):
+            redirects += " 2>/dev/null"
+        script = (
+            f"( {prepared_command}\n) {redirects}\n"
+            f"printf '\\n__END_{token}__:%s\\n' $?\n"
+            f"printf '\\n__END_{token}__\\n' >&2\n"
+        )
+        try:
+            self.process.stdin.write(script.encode())
+            await self.process.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError) as e:
+            raise _SessionDied(str(e)) from e
+        
+        (stdout, out_dropped, tail), (stderr, err_dropped, _) = await asyncio.gather(
+            self._read_until(self.process.stdout, out_marker, cap),
+            self._read_until(self.process.stderr, err_marker, cap),
+        )
+        while b"\n" not in tail:
+            chunk = await self.process.stdout.read(64)
+            if not chunk:
+                raise ConnectionResetError("host session closed its stdout")
+            tail += chunk
+        return int(tail.split(b"\n", 1)[0]), (stdout, out_dropped), (stderr, err_dropped)
+    
+    @staticmethod
+    async def _read_until(stream, marker: bytes, cap: int) -> tuple[bytes, int, bytes]:
+        """Read stream up to marker keeping at most cap bytes of it.
+        
+        Returns (kept data, dropped byte count, bytes after the marker).
+        """
+        buf = bytearray()
+        dropped = 0
+        while True:
+            chunk = await stream.read(STREAM_READ_SIZE)
+            if not chunk:
+                raise ConnectionResetError("host session closed its output")
+            # Ищем только в хвосте: маркер мог разрезаться между кусками
+            start = max(0, len(buf) - len(marker))
+            buf += chunk
+            idx = buf.find(marker, start)
+            if idx >= 0:
+                data, rest = buf[:idx], bytes(buf[idx + len(marker):])
+                if len(data) > cap:
+                    dropped += len(data) - cap
+                    del data[cap:]
+                return bytes(data), dropped, rest
+            # Сверх cap держим только хвост длиной с маркер — для поиска
+            excess = len(buf) - cap - len(marker)
+            if excess > 0:
+                del buf[cap:cap + excess]
+                dropped += excess
+    
+    def kill(self) -> None:
+        self._killed = True
+        _kill_process_group(self.process)
 
 
 class HostExecutor:
     """Executes commands on host system via nsenter (for Docker with pid: host)"""
     
-    def __init__(self):
-        self._use_nsenter = self._check_nsenter_needed()
+    # nsenter flags:
+    # -t 1: target PID 1 (init process on host)
+    # -m: mount namespace
+    # -u: UTS namespace (hostname)
+    # -n: network namespace
+    # -i: IPC namespace
+    # -p: PID namespace
+    # -C: cgroup namespace (required for snap apps)
+    _NSENTER_PREFIX = ("nsenter", "-t", "1", "-m", "-u", "-n", "-i", "-p", "-C", "--")
+    
+    def __init__(self, use_nsenter: Optional[bool] = None):
+        # use_nsenter=None — определить самим (контейнер или нет)
+        self._use_nsenter = self._check_nsenter_needed() if use_nsenter is None else use_nsenter
+        # Без nsenter команда наследует наш PATH; если в нём уже есть все
+        # каталоги EXTENDED_PATH, обёртка export PATH=... ничего не меняет
+        own_path = set(os.environ.get("PATH", "").split(":"))
+        self._needs_path_prefix = self._use_nsenter or not set(EXTENDED_PATH.split(":")) <= own_path
+        settings = get_settings()
+        self._stream_queue_max = settings.host_exec_stream_queue_max
+        # Потолок одновременных nsenter-процессов: каждый — это PID, fd и память
+        self._sem = asyncio.Semaphore(settings.host_exec_max_concurrency)
+        # Стримы (tail -f, journalctl -f) живут до MAX_TIMEOUT — у них свой лимит,
+        # иначе открытые терминалы выедают слоты у коротких execute()
+        self._stream_sem = asyncio.Semaphore(settings.host_exec_max_streams)
+        self._threaded_spawn = settings.host_exec_threaded_spawn
+        self._max_output_bytes = settings.host_exec_max_output_bytes
+        self._active = 0
+        # Долгоживущие shell-сессии для execute(reuse_session=True), по одной на shell
+        self._session_enabled = settings.host_exec_session
+        self._sessions: dict[str, _HostSession] = {}
+        self._cmd_prefixes: dict[str, tuple[str, ...]] = {}
+    
+    @contextlib.asynccontextmanager
+    async def _slot(self, command: str, stream: bool = False):
+        """Concurrency slot for one host command.
+        
+        execute() is bounded by HOST_EXEC_MAX_CONCURRENCY, execute_stream() by
+        HOST_EXEC_MAX_STREAMS; the two pools are independent.
+        """
+        sem = self._stream_sem if stream else self._sem
+        if sem.locked():
+            logger.warning(
+                "Host executor saturated (%d running, %s), queueing: %s",
+                self._active, "streams" if stream else "commands", command[:50]
+            )
+        async with sem:
+            self._active += 1
+            try:
+                yield
+            finally:
+                self._active -= 1
+    
+    async def _spawn(self, cmd: tuple[str, ...], capture: Capture = "both", **kwargs):
+        """Start cmd with the captured streams piped and the rest sent to /dev/null.
+        
+        By default this is asyncio.create_subprocess_exec, whose fork/exec runs
+        on the event loop thread. With HOST_EXEC_THREADED_SPAWN the Popen call
+        goes to a worker thread and only the pipes are attached to the loop.
+        """
+        stdout = subprocess.PIPE if capture in ("both", "stdout") else subprocess.DEVNULL
+        stderr = subprocess.PIPE if capture in ("both", "stderr") else subprocess.DEVNULL
+        if not self._threaded_spawn:
+            return await asyncio.create_subprocess_exec(*cmd, stdout=stdout, stderr=stderr, **kwargs)
+        
+        loop = asyncio.get_running_loop()
+        popen = await asyncio.to_thread(
+            functools.partial(subprocess.Popen, cmd, stdout=stdout, stderr=stderr, **kwargs)
+        )
+        readers = []
+        for pipe in (popen.stdout, popen.stderr):
+            if pipe is None:
+                readers.append(None)
+                continue
+            reader = asyncio.StreamReader(loop=loop)
+            await loop.connect_read_pipe(lambda r=reader: asyncio.StreamReaderProtocol(r), pipe)
+            readers.append(reader)
+        return _ThreadSpawnedProcess(popen, *readers)
     
     def _check_nsenter_needed(self) -> bool:
         """Check if we're in a container and need nsenter"""
@@ -53,13 +479,27 @@ class HostExecutor:
     
     def _prepare_command(self, command: str) -> str:
         """Wrap command with extended PATH to ensure snap/local binaries are accessible"""
+        if not self._needs_path_prefix:
+            return command
         return f'export PATH="{EXTENDED_PATH}:$PATH"; {command}'
     
+    def _build_cmd(self, command: str, shell: str) -> tuple[str, ...]:
+        """argv for running command on the host (single place for all execute* paths)"""
+        prefix = self._cmd_prefixes.get(shell)
+        if prefix is None:
+            # [nsenter ... --] shell -c — одинаково для всех вызовов с этим shell
+            prefix = (*self._NSENTER_PREFIX, shell, "-c") if self._use_nsenter else (shell, "-c")
+            self._cmd_prefixes[shell] = prefix
+        return (*prefix, self._prepare_command(command))
+    
     async def execute(
         self,
         command: str,
         timeout: int = DEFAULT_TIMEOUT,
-        shell: str = "sh"
+        shell: str = "sh",
+        reuse_session: bool = False,
+        capture: Capture = "both",
+        max_output_bytes: Optional[int] = None
     ) -> ExecuteResult:
         """
         Execute command on host system.
@@ -68,54 +508,178 @@ class HostExecutor:
             command: Shell command to execute
             timeout: Timeout in seconds (max 600)
             shell: Shell to use (sh or bash)
+            reuse_session: Run through a persistent shell instead of spawning
+                nsenter + shell for this call. Meant for short, frequently
+                polled probes; falls back to a fresh process when the session
+                is busy or dead. Commands must not leave background jobs
+                writing to stdout/stderr.
+            capture: Streams to collect: "both", "stdout", "stderr" or "none".
+                The others go to /dev/null and come back as "" (for commands
+                whose exit code is all that matters use "none").
+            max_output_bytes: Per-stream capture limit (default
+                HOST_EXEC_MAX_OUTPUT_BYTES). Output past it is read and
+                dropped; the result gets truncated=True.
         
         Returns:
             ExecuteResult with stdout, stderr, exit_code and timing
         """
+        cap = self._max_output_bytes if max_output_bytes is None else max_output_bytes
+        async with self._slot(command):
+            if reuse_session and self._session_enabled:
+                result = await self._execute_in_session(command, timeout, shell, capture, cap)
+                if result is not None:
+                    return result
+            return await self._execute(command, timeout, shell, capture, cap)
+    
+    async def execute_in_session(
+        self,
+        command: str,
+        timeout: int = DEFAULT_TIMEOUT,
+        shell: str = "sh",
+        capture: Capture = "both",
+        max_output_bytes: Optional[int] = None
+    ) -> Optional[ExecuteResult]:
+        """Run command through the persistent shell only.
+        
+        Unlike execute(reuse_session=True) nothing is spawned when the session
+        is busy or cannot be started: None is returned and the caller picks
+        its own fallback (e.g. a direct exec without the shell wrapper).
+        """
+        cap = self._max_output_bytes if max_output_bytes is None else max_output_bytes
+        async with self._slot(command):
+            return await self._execute_in_session(command, timeout, shell, capture, cap)
+    
+    async def _get_session(self, shell: str) -> Optional[_HostSession]:
+        """Idle live session for shell (spawned lazily), or None if busy/unavailable"""
+        session = self._sessions.get(shell)
+        if session is not None and not session.alive:
+            session = None
+        if session is None:
+            cmd = [*self._NSENTER_PREFIX, shell] if self._use_nsenter else [shell]
+            try:
+                process = await asyncio.create_subprocess_exec(
+                    *cmd,
+                    stdin=asyncio.subprocess.PIPE,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.PIPE,
+                    start_new_session=True
+                )
+            except Exception as e:
+                logger.warning("Host session for %s unavailable: %s", shell, e)
+                return None
+            session = self._sessions[shell] = _HostSession(process)
+        if session.lock.locked():
+            return None
+        return session
+    
+    async def _execute_in_session(
+        self,
+        command: str,
+        timeout: int,
+        shell: str,
+        capture: Capture,
+        cap: int
+    ) -> Optional[ExecuteResult]:
+        """execute() through a persistent shell; None means "use a fresh process" """
+        session = await self._get_session(shell)
+        if session is None:
+            return None
+        
+        timeout = min(max(1, timeout), MAX_TIMEOUT)
+        start_time = time.time()
+        
+        async with session.lock:
+            logger.info("Executing on host (session): %s%s", command[:100], "..." if len(command) > 100 else "")
+            try:
+                exit_code, stdout, stderr = await asyncio.wait_for(
+                    session.run(self._prepare_command(command), capture, cap), timeout=timeout
+                )
+            except _SessionDied as e:
+                logger.info("Host session for %s died (%s), spawning per call", shell, e)
+                session.kill()
+                return None
+            except asyncio.TimeoutError:
+                # Сессия в неизвестном состоянии — убиваем её, следующая поднимется заново
+                session.kill()
+                execution_time = int((time.time() - start_time) * 1000)
+                logger.warning("Command timed out after %ss: %s", timeout, command[:50])
+                return ExecuteResult(
+                    success=False,
+                    exit_code=-1,
+                    stdout="",
+                    stderr="",
+                    execution_time_ms=execution_time,
+                    error=f"Command timed out after {timeout} seconds"
+                )
+            except Exception as e:
+                # Команда уже ушла в shell — повторять её в новом процессе нельзя
+                session.kill()
+                execution_time = int((time.time() - start_time) * 1000)
+                logger.error("Command execution failed: %s", e)
+                return ExecuteResult(
+                    success=False,
+                    exit_code=-1,
+                    stdout="",
+                    stderr="",
+                    execution_time_ms=execution_time,
+                    error=str(e)
+                )
+        
+        execution_time = int((time.time() - start_time) * 1000)
+        stdout_str = _decode_output(*stdout)
+        stderr_str = _decode_output(*stderr)
+        
+        logger.info(
+            "Command completed: exit_code=%s, time=%sms, stdout_len=%d",
+            exit_code, execution_time, len(stdout_str)
+        )
+        
+        return ExecuteResult(
+            success=exit_code == 0,
+            exit_code=exit_code,
+            stdout=stdout_str,
+            stderr=stderr_str,
+            execution_time_ms=execution_time,
+            truncated=bool(stdout[1] or stderr[1])
+        )
+    
+    async def _execute(
+        self,
+        command: str,
+        timeout: int,
+        shell: str,
+        capture: Capture = "both",
+        cap: int = 0
+    ) -> ExecuteResult:
+        """execute() body; the caller holds a concurrency slot"""
         # Validate timeout
         timeout = min(max(1, timeout), MAX_TIMEOUT)
         
-        # Wrap command with extended PATH
-        prepared_command = self._prepare_command(command)
-        
-        # Build command
-        if self._use_nsenter:
-            # nsenter flags:
-            # -t 1: target PID 1 (init process on host)
-            # -m: mount namespace
-            # -u: UTS namespace (hostname)
-            # -n: network namespace
-            # -i: IPC namespace
-            # -p: PID namespace
-            # -C: cgroup namespace (required for snap apps)
-            cmd = [
-                "nsenter", "-t", "1", "-m", "-u", "-n", "-i", "-p", "-C",
-                "--", shell, "-c", prepared_command
-            ]
-        else:
-            cmd = [shell, "-c", prepared_command]
+        cmd = self._build_cmd(command, shell)
         
         start_time = time.time()
         
         try:
-            logger.info(f"Executing on host: {command[:100]}{'...' if len(command) > 100 else ''}")
+            logger.info("Executing on host: %s%s", command[:100], "..." if len(command) > 100 else "")
             
-            process = await asyncio.create_subprocess_exec(
-                *cmd,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
+            process = await self._spawn(cmd, capture)
             
-            try:
-                stdout, stderr = await asyncio.wait_for(
-                    process.communicate(),
-                    timeout=timeout
+            async def collect():
+                # Не communicate(): вывод сверх cap не копится в памяти
+                streams = await asyncio.gather(
+                    _drain_capped(process.stdout, cap),
+                    _drain_capped(process.stderr, cap),
                 )
+                await process.wait()
+                return streams
+            
+            try:
+                stdout, stderr = await asyncio.wait_for(collect(), timeout=timeout)
             except asyncio.TimeoutError:
                 process.kill()
                 await process.wait()
                 execution_time = int((time.time() - start_time) * 1000)
-                logger.warning(f"Command timed out after {timeout}s: {command[:50]}")
+                logger.warning("Command timed out after %ss: %s", timeout, command[:50])
                 return ExecuteResult(
                     success=False,
                     exit_code=-1,
@@ -127,12 +691,12 @@ class HostExecutor:
             
             execution_time = int((time.time() - start_time) * 1000)
             exit_code = process.returncode or 0
-            stdout_str = stdout.decode('utf-8', errors='replace').strip()
-            stderr_str = stderr.decode('utf-8', errors='replace').strip()
+            stdout_str = _decode_output(*stdout)
+            stderr_str = _decode_output(*stderr)
             
             logger.info(
-                f"Command completed: exit_code={exit_code}, "
-                f"time={execution_time}ms, stdout_len={len(stdout_str)}"
+                "Command completed: exit_code=%s, time=%sms, stdout_len=%d",
+                exit_code, execution_time, len(stdout_str)
             )
             
             return ExecuteResult(
@@ -140,13 +704,14 @@ class HostExecutor:
                 exit_code=exit_code,
                 stdout=stdout_str,
                 stderr=stderr_str,
-                execution_time_ms=execution_time
+                execution_time_ms=execution_time,
+                truncated=bool(stdout[1] or stderr[1])
             )
             
         except FileNotFoundError:
             execution_time = int((time.time() - start_time) * 1000)
             error_msg = "nsenter not found" if self._use_nsenter else f"{shell} not found"
-            logger.error(f"Command execution failed: {error_msg}")
+            logger.error("Command execution failed: %s", error_msg)
             return ExecuteResult(
                 success=False,
                 exit_code=-1,
@@ -157,7 +722,7 @@ class HostExecutor:
             )
         except Exception as e:
             execution_time = int((time.time() - start_time) * 1000)
-            logger.error(f"Command execution failed: {e}")
+            logger.error("Command execution failed: %s", e)
             return ExecuteResult(
                 success=False,
                 exit_code=-1,
@@ -171,173 +736,253 @@ class HostExecutor:
         self,
         command: str,
         timeout: int = DEFAULT_TIMEOUT,
-        shell: str = "sh"
-    ) -> AsyncGenerator[str, None]:
+        shell: str = "sh",
+        batch_max_lines: int = STREAM_BATCH_MAX_LINES,
+        batch_max_ms: int = STREAM_BATCH_MAX_MS
+    ) -> AsyncGenerator[bytes, None]:
         """
         Execute command on host system with streaming output (SSE format).
         
-        Yields SSE-formatted events:
+        Yields SSE-formatted events as UTF-8 bytes:
             event: stdout\ndata: {"line": "..."}\n\n
             event: stderr\ndata: {"line": "..."}\n\n
+            event: stdout_batch\ndata: {"lines": ["...", "..."]}\n\n
+            event: stderr_batch\ndata: {"lines": ["...", "..."]}\n\n
             event: done\ndata: {"exit_code": 0, "execution_time_ms": 1234}\n\n
             event: error\ndata: {"message": "..."}\n\n
+            : keepalive\n\n  (comment, after STREAM_KEEPALIVE_S without output)
+        
+        Consecutive lines of one stream are coalesced into a *_batch event of
+        up to batch_max_lines, held for at most batch_max_ms. batch_max_lines=1
+        disables batching (only single-line events are sent).
         """
-        timeout = min(max(1, timeout), MAX_TIMEOUT)
+        async with self._slot(command, stream=True):
+            # aclosing: при обрыве клиента внутренний генератор закрывается сразу
+            # (и убивает команду), а не когда до него доберётся GC
+            async with contextlib.aclosing(
+                self._execute_stream(command, timeout, shell, batch_max_lines, batch_max_ms)
+            ) as frames:
+                async for frame in frames:
+                    yield frame
+    
+    async def _spawn_stream(self, cmd: tuple[str, ...], limit: int) -> "_StreamProtocol":
+        """Start cmd for execute_stream with its pipes wired to a _StreamProtocol.
+        
+        Normally loop.subprocess_exec; with HOST_EXEC_THREADED_SPAWN the Popen
+        runs in a worker thread and its pipes are attached with connect_read_pipe.
+        Runs in its own session so the whole process group can be killed.
+        """
+        loop = asyncio.get_running_loop()
+        if not self._threaded_spawn:
+            _, protocol = await loop.subprocess_exec(
+                lambda: _StreamProtocol(limit),
+                *cmd,
+                stdin=None,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                start_new_session=True
+            )
+            return protocol
         
-        # Wrap command with extended PATH
-        prepared_command = self._prepare_command(command)
+        popen = await asyncio.to_thread(
+            functools.partial(
+                subprocess.Popen, cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, start_new_session=True
+            )
+        )
+        protocol = _StreamProtocol(limit)
+        await protocol.attach_popen(popen)
+        return protocol
+    
+    async def _execute_stream(
+        self,
+        command: str,
+        timeout: int,
+        shell: str,
+        batch_max_lines: int,
+        batch_max_ms: int
+    ) -> AsyncGenerator[bytes, None]:
+        """execute_stream() body; the caller holds a concurrency slot"""
+        timeout = min(max(1, timeout), MAX_TIMEOUT)
         
-        if self._use_nsenter:
-            cmd = [
-                "nsenter", "-t", "1", "-m", "-u", "-n", "-i", "-p", "-C",
-                "--", shell, "-c", prepared_command
-            ]
-        else:
-            cmd = [shell, "-c", prepared_command]
+        cmd = self._build_cmd(command, shell)
         
         start_time = time.time()
-        
-        def format_sse(event: str, data: dict) -> str:
-            return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+        process: Optional[_StreamProtocol] = None
         
         try:
-            logger.info(f"Executing (stream) on host: {command[:100]}{'...' if len(command) > 100 else ''}")
+            logger.info("Executing (stream) on host: %s%s", command[:100], "..." if len(command) > 100 else "")
             
-            process = await asyncio.create_subprocess_exec(
-                *cmd,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
+            # Своя группа процессов: при таймауте/обрыве клиента убиваем
+            # и всё, что команда успела породить (pipe'ы, journalctl -f).
+            # Строки режет сам протокол прямо в колбэках pipe'ов
+            process = await self._spawn_stream(cmd, self._stream_queue_max)
             
             deadline = time.time() + timeout
-            merged_queue: asyncio.Queue = asyncio.Queue()
+            merged = process.lines
+            data_ready = process.data_ready
             
-            async def read_stream_to_queue(stream, stream_name: str):
-                try:
-                    while True:
-                        line = await stream.readline()
-                        if line:
-                            decoded = line.decode('utf-8', errors='replace').rstrip('\n\r')
-                            await merged_queue.put((stream_name, decoded))
-                        else:
-                            break
-                except Exception as e:
-                    logger.debug(f"Stream {stream_name} read ended: {e}")
-                finally:
-                    await merged_queue.put((stream_name, None))
-            
-            stdout_task = asyncio.create_task(read_stream_to_queue(process.stdout, "stdout"))
-            stderr_task = asyncio.create_task(read_stream_to_queue(process.stderr, "stderr"))
+            open_streams = 2
+            batch: list[str] = []
+            batch_stream = ""
+            batch_until = 0.0
+            last_sent = time.time()
             
-            streams_remaining = 2
+            def flush_batch() -> bytes:
+                nonlocal last_sent
+                last_sent = time.time()
+                frame = (
+                    _sse_frame(batch_stream, {"line": batch[0]}) if len(batch) == 1
+                    else _sse_frame(f"{batch_stream}_batch", {"lines": batch[:]})
+                )
+                batch.clear()
+                return frame
             
-            while streams_remaining > 0:
-                remaining = deadline - time.time()
-                if remaining <= 0:
-                    stdout_task.cancel()
-                    stderr_task.cancel()
-                    process.kill()
-                    await process.wait()
+            while open_streams > 0:
+                if merged and time.time() < deadline:
+                    stream_name, line = process.popleft()
+                else:
+                    if not merged:
+                        # Ждём данных до дедлайна команды, срока отправки пачки или
+                        # keepalive — никакого периодического опроса
+                        data_ready.clear()
+                        wait_until = min(deadline, last_sent + STREAM_KEEPALIVE_S)
+                        if batch:
+                            wait_until = min(wait_until, batch_until)
+                        try:
+                            await asyncio.wait_for(
+                                data_ready.wait(), timeout=max(0.0, wait_until - time.time())
+                            )
+                            continue
+                        except asyncio.TimeoutError:
+                            pass
+                        now = time.time()
+                        if not batch and now < deadline and now >= last_sent + STREAM_KEEPALIVE_S:
+                            last_sent = now
+                            yield _SSE_KEEPALIVE
+                            continue
+                    if batch:
+                        yield flush_batch()
+                    if time.time() < deadline:
+                        continue
+                    self._stop_stream(process)
                     execution_time = int((time.time() - start_time) * 1000)
-                    logger.warning(f"Command timed out after {timeout}s: {command[:50]}")
-                    yield format_sse("error", {"message": f"Command timed out after {timeout} seconds"})
-                    yield format_sse("done", {"exit_code": -1, "execution_time_ms": execution_time, "success": False})
+                    logger.warning("Command timed out after %ss: %s", timeout, command[:50])
+                    yield _error_frame(f"Command timed out after {timeout} seconds")
+                    yield _done_frame(-1, execution_time)
                     return
                 
-                try:
-                    stream_name, line = await asyncio.wait_for(
-                        merged_queue.get(), timeout=min(remaining, 1.0)
-                    )
-                    if line is None:
-                        streams_remaining -= 1
-                    else:
-                        yield format_sse(stream_name, {"line": line})
-                except asyncio.TimeoutError:
-                    pass
+                if line is None:
+                    open_streams -= 1
+                    continue
+                if batch_max_lines <= 1:
+                    last_sent = time.time()
+                    yield _sse_frame(stream_name, {"line": line})
+                    continue
+                if batch and stream_name != batch_stream:
+                    yield flush_batch()
+                if not batch:
+                    batch_stream = stream_name
+                    batch_until = time.time() + batch_max_ms / 1000
+                batch.append(line)
+                if len(batch) >= batch_max_lines:
+                    yield flush_batch()
+            
+            if batch:
+                yield flush_batch()
             
             await process.wait()
-            await asyncio.gather(stdout_task, stderr_task, return_exceptions=True)
             
             execution_time = int((time.time() - start_time) * 1000)
             exit_code = process.returncode or 0
             
-            logger.info(f"Command (stream) completed: exit_code={exit_code}, time={execution_time}ms")
+            logger.info("Command (stream) completed: exit_code=%s, time=%sms", exit_code, execution_time)
             
-            yield format_sse("done", {
-                "exit_code": exit_code,
-                "execution_time_ms": execution_time,
-                "success": exit_code == 0
-            })
+            yield _done_frame(exit_code, execution_time)
             
         except FileNotFoundError:
             execution_time = int((time.time() - start_time) * 1000)
             error_msg = "nsenter not found" if self._use_nsenter else f"{shell} not found"
-            logger.error(f"Command execution failed: {error_msg}")
-            yield format_sse("error", {"message": error_msg + " - container must have privileged: true and pid: host"})
-            yield format_sse("done", {"exit_code": -1, "execution_time_ms": execution_time, "success": False})
+            logger.error("Command execution failed: %s", error_msg)
+            yield _error_frame(error_msg + " - container must have privileged: true and pid: host")
+            yield _done_frame(-1, execution_time)
         except Exception as e:
             execution_time = int((time.time() - start_time) * 1000)
-            logger.error(f"Command execution failed: {e}")
-            yield format_sse("error", {"message": str(e)})
-            yield format_sse("done", {"exit_code": -1, "execution_time_ms": execution_time, "success": False})
+            logger.error("Command execution failed: %s", e)
+            yield _error_frame(str(e))
+            yield _done_frame(-1, execution_time)
+        finally:
+            if process is not None:
+                # Клиент отключился (GeneratorExit/CancelledError на yield или await) —
+                # команда не должна продолжать работать вхолостую
+                if process.returncode is None:
+                    logger.info("Stream consumer went away, killing: %s", command[:50])
+                    self._stop_stream(process)
+                # Транспорты закрываем явно, иначе они висят до GC
+                process.close()
+    
+    @staticmethod
+    def _stop_stream(process: "_StreamProtocol"):
+        """Kill the command's process group and stop collecting its output"""
+        process.discard = True
+        _kill_process_group(process)
     
     def execute_sync(
         self,
         command: str,
         timeout: int = DEFAULT_TIMEOUT,
-        shell: str = "sh"
+        shell: str = "sh",
+        max_output_bytes: Optional[int] = None
     ) -> ExecuteResult:
         """
-        Synchronous version of execute for use in non-async contexts.
-        """
-        import subprocess
+        Blocking execute() for non-async code (worker threads, asyncio.to_thread).
         
-        timeout = min(max(1, timeout), MAX_TIMEOUT)
-        
-        # Wrap command with extended PATH
-        prepared_command = self._prepare_command(command)
+        Both pipes are drained as data arrives through one selector, so a
+        chatty command never stalls on a full pipe and no reader threads or
+        per-call event loop are needed.
         
-        if self._use_nsenter:
-            cmd = [
-                "nsenter", "-t", "1", "-m", "-u", "-n", "-i", "-p", "-C",
-                "--", shell, "-c", prepared_command
-            ]
+        Must not be called from a coroutine: the command would block the event
+        loop for up to MAX_TIMEOUT, so this raises RuntimeError instead.
+        """
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            pass
         else:
-            cmd = [shell, "-c", prepared_command]
+            raise RuntimeError(
+                "execute_sync() called from a running event loop; await execute() "
+                "or run the caller via asyncio.to_thread()"
+            )
         
+        timeout = min(max(1, timeout), MAX_TIMEOUT)
+        cap = self._max_output_bytes if max_output_bytes is None else max_output_bytes
+        cmd = self._build_cmd(command, shell)
         start_time = time.time()
+        deadline = start_time + timeout
         
         try:
-            logger.info(f"Executing on host (sync): {command[:100]}{'...' if len(command) > 100 else ''}")
+            logger.info("Executing on host (sync): %s%s", command[:100], "..." if len(command) > 100 else "")
             
-            result = subprocess.run(
+            process = subprocess.Popen(
                 cmd,
-                capture_output=True,
-                timeout=timeout
-            )
-            
-            execution_time = int((time.time() - start_time) * 1000)
-            
-            return ExecuteResult(
-                success=result.returncode == 0,
-                exit_code=result.returncode,
-                stdout=result.stdout.decode('utf-8', errors='replace').strip(),
-                stderr=result.stderr.decode('utf-8', errors='replace').strip(),
-                execution_time_ms=execution_time
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                start_new_session=True
             )
-            
-        except subprocess.TimeoutExpired:
+        except FileNotFoundError:
             execution_time = int((time.time() - start_time) * 1000)
+            error_msg = "nsenter not found" if self._use_nsenter else f"{shell} not found"
+            logger.error("Command execution failed: %s", error_msg)
             return ExecuteResult(
                 success=False,
                 exit_code=-1,
                 stdout="",
                 stderr="",
                 execution_time_ms=execution_time,
-                error=f"Command timed out after {timeout} seconds"
+                error=error_msg + " - container must have privileged: true and pid: host"
             )
         except Exception as e:
             execution_time = int((time.time() - start_time) * 1000)
+            logger.error("Command execution failed: %s", e)
             return ExecuteResult(
                 success=False,
                 exit_code=-1,
@@ -346,7 +991,72 @@ class HostExecutor:
                 execution_time_ms=execution_time,
                 error=str(e)
             )
-
+        
+        stdout_fd, stderr_fd = process.stdout.fileno(), process.stderr.fileno()
+        buffers = {stdout_fd: bytearray(), stderr_fd: bytearray()}
+        dropped = {stdout_fd: 0, stderr_fd: 0}
+        timed_out = False
+        
+        with process.stdout, process.stderr, selectors.DefaultSelector() as selector:
+            for fd in buffers:
+                selector.register(fd, selectors.EVENT_READ)
+            
+            while selector.get_map():
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    timed_out = True
+                    break
+                for key, _ in selector.select(remaining):
+                    chunk = os.read(key.fd, STREAM_READ_SIZE)
+                    if not chunk:
+                        selector.unregister(key.fd)
+                        continue
+                    buf = buffers[key.fd]
+                    room = cap - len(buf)
+                    if room > 0:
+                        buf += chunk[:room]
+                    dropped[key.fd] += max(0, len(chunk) - max(room, 0))
+            
+            if not timed_out:
+                try:
+                    process.wait(timeout=max(0.0, deadline - time.time()))
+                except subprocess.TimeoutExpired:
+                    # Оба pipe закрыты, а процесс ещё жив (закрыл вывод и ждёт)
+                    timed_out = True
+            
+            if timed_out:
+                _kill_process_group(process)
+                process.wait()
+        
+        execution_time = int((time.time() - start_time) * 1000)
+        
+        if timed_out:
+            logger.warning("Command timed out after %ss: %s", timeout, command[:50])
+            return ExecuteResult(
+                success=False,
+                exit_code=-1,
+                stdout="",
+                stderr="",
+                execution_time_ms=execution_time,
+                error=f"Command timed out after {timeout} seconds"
+            )
+        
+        exit_code = process.returncode
+        stdout_bytes, stderr_bytes = buffers[stdout_fd], buffers[stderr_fd]
+        
+        logger.info(
+            "Command completed: exit_code=%s, time=%sms, stdout_len=%d",
+            exit_code, execution_time, len(stdout_bytes)
+        )
+        
+        return ExecuteResult(
+            success=exit_code == 0,
+            exit_code=exit_code,
+            stdout=_decode_output(stdout_bytes, dropped[stdout_fd]),
+            stderr=_decode_output(stderr_bytes, dropped[stderr_fd]),
+            execution_time_ms=execution_time,
+            truncated=bool(dropped[stdout_fd] or dropped[stderr_fd])
+        )
 
 # Singleton instance
 _executor: Optional[HostExecutor] = None
@@ -18,16 +18,22 @@ DROP) — iptables идёт сверху вниз и ACCEPT обрывает о
 проходит ещё до блокировок, даже если попадает под заблокированный CIDR.
 """
 
+import asyncio
+import functools
 import ipaddress
 import json
 import logging
 import os
-import re
+import shlex
 import subprocess
 import threading
+from collections import namedtuple
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Optional
+from typing import Iterator, Optional
+
+from app.config import get_settings
+from app.services.host_executor import HostExecutor
 
 logger = logging.getLogger(__name__)
 
@@ -44,13 +50,34 @@ NON_PUBLIC_NETS = tuple(ipaddress.ip_network(n) for n in (
 ))
 
 
-def is_public_range(ip: str) -> bool:
-    """True, если IP/CIDR не пересекается с приватными/служебными диапазонами."""
+# Те же диапазоны целыми границами: пересечение — два сравнения int
+_NON_PUBLIC_BOUNDS = tuple(
+    (int(n.network_address), int(n.broadcast_address)) for n in NON_PUBLIC_NETS
+)
+
+
+def _parse_ipv4_net(ip: str) -> Optional[ipaddress.IPv4Network]:
+    """IPv4 адрес/CIDR -> сеть (хостовые биты обнуляются), None если невалидно."""
     try:
-        net = ipaddress.ip_network(ip, strict=False)
+        return ipaddress.IPv4Network(ip.strip(), strict=False)
     except ValueError:
-        return False
-    return not any(net.overlaps(bad) for bad in NON_PUBLIC_NETS)
+        return None
+
+
+def _canonical(net: ipaddress.IPv4Network) -> str:
+    """Форма, в которой запись показывает `ipset list`: /32 — голый адрес."""
+    return str(net.network_address) if net.prefixlen == 32 else net.with_prefixlen
+
+
+def _is_public_net(net: ipaddress.IPv4Network) -> bool:
+    lo, hi = int(net.network_address), int(net.broadcast_address)
+    return not any(lo <= bad_hi and bad_lo <= hi for bad_lo, bad_hi in _NON_PUBLIC_BOUNDS)
+
+
+def is_public_range(ip: str) -> bool:
+    """True, если IP/CIDR не пересекается с приватными/служебными диапазонами."""
+    net = _parse_ipv4_net(ip)
+    return net is not None and _is_public_net(net)
 
 # Incoming (default)
 SET_PERMANENT = "blocklist_permanent"
@@ -64,21 +91,47 @@ SET_OUT_TEMP = "blocklist_out_temp"
 SET_ALLOW = "allowlist"
 SET_ALLOW_OUT = "allowlist_out"
 
+# Сеты без таймаутов: их содержимое меняет только агент, копия держится в памяти
+_CACHED_SETS = frozenset({SET_PERMANENT, SET_OUT_PERMANENT, SET_ALLOW, SET_ALLOW_OUT})
+
 DEFAULT_TIMEOUT = 600  # 10 minutes
+RESTORE_CHUNK_LINES = 1000  # строк ipset restore на одну запись в stdin
+SAVE_DEBOUNCE_S = 0.5  # серия мутаций подряд сохраняется в файл один раз
+
+_NSENTER_PREFIX = ["nsenter", "-t", "1", "-m", "-u", "-n", "-i", "--"]
 
 # Direction config: chain + match flag
+DirCfg = namedtuple("DirCfg", "chain match perm temp")
 _DIR_CONFIG = {
-    "in":  {"chain": "INPUT",  "match": "src", "perm": SET_PERMANENT,     "temp": SET_TEMP},
-    "out": {"chain": "OUTPUT", "match": "dst", "perm": SET_OUT_PERMANENT, "temp": SET_OUT_TEMP},
+    "in":  DirCfg("INPUT",  "src", SET_PERMANENT,     SET_TEMP),
+    "out": DirCfg("OUTPUT", "dst", SET_OUT_PERMANENT, SET_OUT_TEMP),
 }
 
 # Allow config: chain + match flag + set name per direction
+AllowCfg = namedtuple("AllowCfg", "chain match set_name")
 _ALLOW_CONFIG = {
-    "in":  {"chain": "INPUT",  "match": "src", "set": SET_ALLOW},
-    "out": {"chain": "OUTPUT", "match": "dst", "set": SET_ALLOW_OUT},
+    "in":  AllowCfg("INPUT",  "src", SET_ALLOW),
+    "out": AllowCfg("OUTPUT", "dst", SET_ALLOW_OUT),
 }
 
 
+@functools.cache
+def _nsenter_needed() -> bool:
+    """Работаем ли в контейнере (команды надо запускать в неймспейсах хоста).
+
+    Окружение за время жизни процесса не меняется — проверяем один раз.
+    """
+    if os.path.exists('/.dockerenv'):
+        return True
+    try:
+        with open('/proc/1/cgroup', 'r') as f:
+            if 'docker' in f.read():
+                return True
+    except Exception:
+        pass
+    return False
+
+
 @dataclass
 class DirectionStatus:
     permanent_count: int
@@ -99,27 +152,55 @@ class IpsetManager:
     """Manages ipset blocklists via nsenter (for Docker with pid: host)"""
     
     def __init__(self):
-        self._use_nsenter = self._check_nsenter_needed()
+        self._use_nsenter = _nsenter_needed()
         self._temp_timeout = DEFAULT_TIMEOUT
         self._initialized = False
         # Мутации сетов сериализуются: эндпоинты выполняются в threadpool,
         # параллельные sync с панели не должны перемешивать diff-ы.
         self._mutate_lock = threading.Lock()
+        # Записи permanent/allow сетов (_CACHED_SETS) — заполняются из `ipset save`
+        # при первом обращении и дальше правятся вместе с сетом. Temp-сеты не
+        # кэшируются: их записи истекают в ядре сами.
+        self._members: dict[str, set[str]] = {}
+        self._save_timer: Optional[threading.Timer] = None
+        self._save_timer_lock = threading.Lock()
+        self._host_loop: Optional[asyncio.AbstractEventLoop] = None
+        if get_settings().ipset_host_shell:
+            self._start_host_shell()
     
-    def _check_nsenter_needed(self) -> bool:
-        if os.path.exists('/.dockerenv'):
-            return True
-        try:
-            with open('/proc/1/cgroup', 'r') as f:
-                if 'docker' in f.read():
-                    return True
-        except Exception:
-            pass
-        return False
+    def _start_host_shell(self):
+        """Короткие ipset/iptables — через долгоживущий `nsenter ... sh`.
+
+        Иначе каждый вызов — это exec nsenter + exec ipset из процесса агента.
+        Сессию (маркеры, таймауты) даёт HostExecutor; у него asyncio-подпроцессы,
+        а мы работаем из threadpool и из init_sets() прямо в event loop — поэтому
+        свой экземпляр на собственном loop в отдельном потоке, вызовы через
+        run_coroutine_threadsafe. Если сессия занята или не поднялась, _run_cmd
+        делает прямой exec (_NSENTER_PREFIX + cmd), а не shell-обёртку executor-а.
+        """
+        self._host = HostExecutor(use_nsenter=self._use_nsenter)
+        self._host_loop = asyncio.new_event_loop()
+        threading.Thread(
+            target=self._host_loop.run_forever, name="ipset-host-shell", daemon=True
+        ).start()
     
     def _run_cmd(self, cmd: list[str], timeout: int = 30) -> tuple[bool, str, str]:
+        if self._host_loop is not None:
+            # Вывод здесь короткий (ошибки, `list -n`, `iptables-save -t filter`):
+            # дампы сетов идут потоком через _run_ipset_stream, так что хватает
+            # обычного потолка execute()
+            result = asyncio.run_coroutine_threadsafe(
+                self._host.execute_in_session(shlex.join(cmd), timeout=timeout),
+                self._host_loop,
+            ).result()
+            if result is not None:
+                if result.error:
+                    return False, "", result.error
+                return result.success, result.stdout, result.stderr
+            # Сессия занята другим потоком или недоступна — прямой exec ниже
+        
         if self._use_nsenter:
-            cmd = ["nsenter", "-t", "1", "-m", "-u", "-n", "-i", "--"] + cmd
+            cmd = _NSENTER_PREFIX + cmd
         try:
             result = subprocess.run(cmd, capture_output=True, text=True, timeout=timeout)
             return result.returncode == 0, result.stdout.strip(), result.stderr.strip()
@@ -139,23 +220,100 @@ class IpsetManager:
         Per-IP вызовы ipset (2 subprocess на запись) на списках в десятки тысяч
         записей блокируют API ноды на десятки минут; restore применяет весь diff
         за доли секунды. `-exist` — уже существующие/отсутствующие записи не ошибка.
+
+        stdin пишется кусками по RESTORE_CHUNK_LINES строк: весь скрипт одной
+        строкой (на 100k записей — ещё несколько МБ) не собирается. stdout
+        restore пуст, stderr — одна строка ошибки, так что pipe не забьётся.
         """
+        return self._run_restore(["ipset", "-exist", "restore"], lines, timeout, "ipset restore")
+
+    def _run_restore(
+        self, cmd: list[str], lines: list[str], timeout: int, label: str
+    ) -> tuple[bool, str, str]:
+        """Скормить lines в stdin cmd (ipset restore / iptables-restore), см. выше."""
         if not lines:
             return True, "", ""
-        cmd = ["ipset", "-exist", "restore"]
         if self._use_nsenter:
-            cmd = ["nsenter", "-t", "1", "-m", "-u", "-n", "-i", "--"] + cmd
+            cmd = _NSENTER_PREFIX + cmd
         try:
-            result = subprocess.run(
-                cmd, input="\n".join(lines) + "\n",
-                capture_output=True, text=True, timeout=timeout,
+            proc = subprocess.Popen(
+                cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL,
+                stderr=subprocess.PIPE, text=True,
             )
-            return result.returncode == 0, result.stdout.strip(), result.stderr.strip()
-        except subprocess.TimeoutExpired:
-            return False, "", "ipset restore timed out"
         except Exception as e:
             return False, "", str(e)
 
+        # Зависший restore перестанет читать stdin — таймер убьёт его, и
+        # запись оборвётся BrokenPipeError вместо вечной блокировки
+        timed_out = threading.Event()
+
+        def _kill():
+            timed_out.set()
+            proc.kill()
+
+        watchdog = threading.Timer(timeout, _kill)
+        watchdog.start()
+        try:
+            try:
+                for i in range(0, len(lines), RESTORE_CHUNK_LINES):
+                    proc.stdin.write("\n".join(lines[i:i + RESTORE_CHUNK_LINES]) + "\n")
+                proc.stdin.close()
+            except BrokenPipeError:
+                # restore вышел на ошибке раньше, чем дочитал ввод — причина в stderr
+                try:
+                    proc.stdin.close()
+                except BrokenPipeError:
+                    pass
+            stderr = proc.stderr.read()
+            proc.wait()
+        finally:
+            watchdog.cancel()
+            proc.stderr.close()
+
+        if timed_out.is_set():
+            return False, "", f"{label} timed out"
+        return proc.returncode == 0, "", stderr.strip()
+
+    def _run_ipset_stream(self, args: list[str], timeout: int = 60) -> Iterator[str]:
+        """Строки stdout `ipset <args>` по мере чтения, без буфера на весь вывод.
+
+        `ipset save` сета на 500k записей — ~15 МБ; через _run_cmd это одна
+        строка плюс копия от splitlines(). Ошибка ipset или таймаут —
+        subprocess.CalledProcessError / TimeoutExpired после последней строки.
+        """
+        cmd = ["ipset"] + args
+        if self._use_nsenter:
+            cmd = _NSENTER_PREFIX + cmd
+        proc = subprocess.Popen(
+            cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+        )
+        timed_out = threading.Event()
+
+        def _kill():
+            timed_out.set()
+            proc.kill()
+
+        watchdog = threading.Timer(timeout, _kill)
+        watchdog.start()
+        try:
+            for line in proc.stdout:
+                yield line
+            # stderr — одна строка ошибки, после stdout его дочитываем без риска
+            stderr = proc.stderr.read()
+            proc.wait()
+        finally:
+            watchdog.cancel()
+            if proc.poll() is None:
+                # Потребитель бросил итерацию — не оставляем процесс висеть
+                proc.kill()
+                proc.wait()
+            proc.stdout.close()
+            proc.stderr.close()
+        if timed_out.is_set():
+            raise subprocess.TimeoutExpired(cmd, timeout)
+        if proc.returncode != 0:
+            raise subprocess.CalledProcessError(proc.returncode, cmd, stderr=stderr.strip())
+
     def _set_count(self, set_name: str) -> int:
         """Число записей из заголовка `ipset list -t` — не выгружает весь сет."""
         success, stdout, _ = self._run_ipset(["list", set_name, "-t"])
@@ -174,40 +332,29 @@ class IpsetManager:
 
     # ── helpers to resolve direction → set names / chain ──
 
-    def _get_dir_cfg(self, direction: str) -> dict:
+    def _get_dir_cfg(self, direction: str) -> DirCfg:
         return _DIR_CONFIG.get(direction, _DIR_CONFIG["in"])
 
     def _resolve_set(self, permanent: bool, direction: str = "in") -> str:
         cfg = self._get_dir_cfg(direction)
-        return cfg["perm"] if permanent else cfg["temp"]
+        return cfg.perm if permanent else cfg.temp
 
-    def _get_allow_cfg(self, direction: str) -> dict:
+    def _get_allow_cfg(self, direction: str) -> AllowCfg:
         return _ALLOW_CONFIG.get(direction, _ALLOW_CONFIG["in"])
     
     # ── IP validation ──
     
-    def _validate_ip_cidr(self, ip: str) -> bool:
-        ip = ip.strip()
-        if not ip:
-            return False
-        cidr_pattern = r'^(\d{1,3}\.){3}\d{1,3}(/\d{1,2})?$'
-        if not re.match(cidr_pattern, ip):
-            return False
-        parts = ip.split('/')[0].split('.')
-        for part in parts:
-            if int(part) > 255:
-                return False
-        if '/' in ip:
-            prefix = int(ip.split('/')[1])
-            if prefix < 0 or prefix > 32:
-                return False
-        return True
-    
-    def _normalize_ip(self, ip: str) -> str:
-        ip = ip.strip()
-        if ip.endswith('/32'):
-            ip = ip[:-3]
-        return ip
+    def _canon_ips(self, ips: list[str]) -> tuple[set[str], list[str]]:
+        """Разобрать записи один раз: (канонические валидные, невалидные как есть)."""
+        valid: set[str] = set()
+        invalid: list[str] = []
+        for ip in ips:
+            net = _parse_ipv4_net(ip)
+            if net is None:
+                invalid.append(ip.strip())
+            else:
+                valid.add(_canonical(net))
+        return valid, invalid
     
     # ── ipset operations ──
     
@@ -215,13 +362,16 @@ class IpsetManager:
         success, _, _ = self._run_ipset(["list", set_name])
         return success
     
-    def _create_set(self, set_name: str, with_timeout: bool = False) -> tuple[bool, str]:
-        if self._set_exists(set_name):
-            return True, f"Set {set_name} already exists"
+    def _create_args(self, set_name: str, with_timeout: bool = False) -> list[str]:
         args = ["create", set_name, "hash:net", "family", "inet", "hashsize", "4096", "maxelem", "1000000"]
         if with_timeout:
             args.extend(["timeout", str(self._temp_timeout)])
-        success, stdout, stderr = self._run_ipset(args)
+        return args
+    
+    def _create_set(self, set_name: str, with_timeout: bool = False) -> tuple[bool, str]:
+        if self._set_exists(set_name):
+            return True, f"Set {set_name} already exists"
+        success, stdout, stderr = self._run_ipset(self._create_args(set_name, with_timeout))
         if success:
             logger.info(f"Created ipset: {set_name}")
             return True, f"Set {set_name} created"
@@ -230,11 +380,25 @@ class IpsetManager:
     
     # ── iptables rules (direction-aware) ──
     
-    def _iptables_rule_exists(self, set_name: str, direction: str = "in") -> bool:
+    def _snapshot_iptables(self) -> Optional[str]:
+        """Таблица filter одним `iptables-save`; None — если снять не удалось."""
+        success, stdout, stderr = self._run_cmd(["iptables-save", "-t", "filter"])
+        if not success:
+            logger.warning(f"iptables-save failed, checking rules one by one: {stderr}")
+            return None
+        return stdout
+    
+    def _iptables_rule_exists(
+        self, set_name: str, direction: str = "in", snapshot: Optional[str] = None
+    ) -> bool:
+        """Есть ли DROP-правило сета; со snapshot — поиск по строкам iptables-save без -C."""
         cfg = self._get_dir_cfg(direction)
+        if snapshot is not None:
+            rule = f"-A {cfg.chain} -m set --match-set {set_name} {cfg.match} -j DROP"
+            return rule in snapshot.splitlines()
         success, _, _ = self._run_iptables([
-            "-C", cfg["chain"], "-m", "set",
-            "--match-set", set_name, cfg["match"], "-j", "DROP"
+            "-C", cfg.chain, "-m", "set",
+            "--match-set", set_name, cfg.match, "-j", "DROP"
         ])
         return success
     
@@ -243,11 +407,11 @@ class IpsetManager:
             return True, f"Rule for {set_name} already exists"
         cfg = self._get_dir_cfg(direction)
         success, stdout, stderr = self._run_iptables([
-            "-I", cfg["chain"], "-m", "set",
-            "--match-set", set_name, cfg["match"], "-j", "DROP"
+            "-I", cfg.chain, "-m", "set",
+            "--match-set", set_name, cfg.match, "-j", "DROP"
         ])
         if success:
-            logger.info(f"Added iptables {cfg['chain']} rule for {set_name}")
+            logger.info(f"Added iptables {cfg.chain} rule for {set_name}")
             return True, f"Rule for {set_name} added"
         logger.error(f"Failed to add iptables rule for {set_name}: {stderr}")
         return False, f"Failed to add rule: {stderr}"
@@ -257,11 +421,11 @@ class IpsetManager:
             return True, f"Rule for {set_name} does not exist"
         cfg = self._get_dir_cfg(direction)
         success, stdout, stderr = self._run_iptables([
-            "-D", cfg["chain"], "-m", "set",
-            "--match-set", set_name, cfg["match"], "-j", "DROP"
+            "-D", cfg.chain, "-m", "set",
+            "--match-set", set_name, cfg.match, "-j", "DROP"
         ])
         if success:
-            logger.info(f"Removed iptables {cfg['chain']} rule for {set_name}")
+            logger.info(f"Removed iptables {cfg.chain} rule for {set_name}")
             return True, f"Rule for {set_name} removed"
         return False, f"Failed to remove rule: {stderr}"
 
@@ -274,13 +438,13 @@ class IpsetManager:
         всех DROP. Вызывается после любой операции, способной всплыть DROP-правило
         наверх (init_sets, set_timeout)."""
         cfg = self._get_allow_cfg(direction)
-        rule = ["-m", "set", "--match-set", cfg["set"], cfg["match"], "-j", "ACCEPT"]
+        rule = ["-m", "set", "--match-set", cfg.set_name, cfg.match, "-j", "ACCEPT"]
         # idempotent: снимаем дубликаты, затем ставим единственное правило на верх
-        while self._run_iptables(["-C", cfg["chain"]] + rule)[0]:
-            self._run_iptables(["-D", cfg["chain"]] + rule)
-        success, _, stderr = self._run_iptables(["-I", cfg["chain"], "1"] + rule)
+        while self._run_iptables(["-C", cfg.chain] + rule)[0]:
+            self._run_iptables(["-D", cfg.chain] + rule)
+        success, _, stderr = self._run_iptables(["-I", cfg.chain, "1"] + rule)
         if success:
-            logger.info(f"Allowlist ACCEPT rule on top of {cfg['chain']} ({direction})")
+            logger.info(f"Allowlist ACCEPT rule on top of {cfg.chain} ({direction})")
         else:
             logger.error(f"Failed to add allowlist ACCEPT rule ({direction}): {stderr}")
     
@@ -291,53 +455,120 @@ class IpsetManager:
             return True, "Already initialized"
         
         self._run_cmd(["mkdir", "-p", "/var/lib/monitoring"])
-        self._load_config()
+        persisted = self._read_persisted()
+        self._temp_timeout = persisted.get('temp_timeout', DEFAULT_TIMEOUT)
         
-        # Create sets + iptables rules for both directions
-        for direction, cfg in _DIR_CONFIG.items():
-            success, msg = self._create_set(cfg["perm"], with_timeout=False)
-            if not success:
-                return False, f"Failed to create {direction} permanent set: {msg}"
-            
-            success, msg = self._create_set(cfg["temp"], with_timeout=True)
+        success, msg = self._init_sets_batch()
+        if not success:
+            return False, msg
+        if not self._init_rules_batch():
+            success, msg = self._init_rules_one_by_one()
             if not success:
-                return False, f"Failed to create {direction} temp set: {msg}"
-            
-            success, msg = self._add_iptables_rule(cfg["perm"], direction)
+                return False, msg
+
+        self._load_persisted_ips(persisted)
+        # Сеты могли пережить рестарт агента с чужим содержимым — кэш строим заново
+        self._members.clear()
+
+        self._initialized = True
+        logger.info("IpsetManager initialized successfully (in + out, block + allow)")
+        return True, "Initialized successfully"
+    
+    def _init_sets_batch(self) -> tuple[bool, str]:
+        """Создать недостающие сеты одним `ipset restore`.
+
+        Существующие сеты не трогаем: `create -exist` падает, если параметры
+        живого сета (maxelem, timeout) отличаются от наших.
+        """
+        success, stdout, stderr = self._run_ipset(["list", "-n"])
+        if not success:
+            return False, f"Failed to list ipsets: {stderr}"
+        existing = set(stdout.split())
+        wanted = [(cfg.perm, False) for cfg in _DIR_CONFIG.values()]
+        wanted += [(cfg.temp, True) for cfg in _DIR_CONFIG.values()]
+        wanted += [(cfg.set_name, False) for cfg in _ALLOW_CONFIG.values()]
+        lines = [
+            " ".join(self._create_args(name, with_timeout))
+            for name, with_timeout in wanted if name not in existing
+        ]
+        success, _, stderr = self._run_ipset_restore(lines)
+        if not success:
+            return False, f"Failed to create sets: {stderr}"
+        for line in lines:
+            logger.info(f"Created ipset: {line.split()[1]}")
+        return True, ""
+
+    def _init_rules_batch(self) -> bool:
+        """Недостающие DROP и ACCEPT белого списка одним `iptables-restore --noflush`.
+
+        Что уже стоит — по снимку iptables-save. DROP вставляются в начало
+        цепочки, поэтому после них (или если ACCEPT не первый / задублирован)
+        ACCEPT снимается и ставится в позицию 1 — как в _ensure_allow_rule_priority.
+        False — снимок или restore не удались, нужен поштучный путь.
+        """
+        snapshot = self._snapshot_iptables()
+        if snapshot is None:
+            return False
+        rules = snapshot.splitlines()
+        script = ["*filter"]
+        for direction, cfg in _DIR_CONFIG.items():
+            allow = _ALLOW_CONFIG[direction]
+            chain_rules = [r for r in rules if r.startswith(f"-A {cfg.chain} ")]
+            missing = [
+                name for name in (cfg.perm, cfg.temp)
+                if f"-A {cfg.chain} -m set --match-set {name} {cfg.match} -j DROP" not in chain_rules
+            ]
+            script += [f"-I {cfg.chain} -m set --match-set {name} {cfg.match} -j DROP" for name in missing]
+            accept = f"-m set --match-set {allow.set_name} {allow.match} -j ACCEPT"
+            count = chain_rules.count(f"-A {allow.chain} {accept}")
+            if missing or count != 1 or chain_rules[:1] != [f"-A {allow.chain} {accept}"]:
+                script += [f"-D {allow.chain} {accept}"] * count
+                script.append(f"-I {allow.chain} 1 {accept}")
+        if len(script) == 1:
+            return True
+        script.append("COMMIT")
+        success, _, stderr = self._run_restore(
+            ["iptables-restore", "--noflush"], script, 30, "iptables-restore"
+        )
+        if not success:
+            logger.warning(f"iptables-restore failed, adding rules one by one: {stderr}")
+            return False
+        logger.info(f"Applied {len(script) - 2} iptables rule change(s)")
+        return True
+
+    def _init_rules_one_by_one(self) -> tuple[bool, str]:
+        for direction, cfg in _DIR_CONFIG.items():
+            success, msg = self._add_iptables_rule(cfg.perm, direction)
             if not success:
                 return False, f"Failed to add iptables rule for {direction} permanent: {msg}"
             
-            success, msg = self._add_iptables_rule(cfg["temp"], direction)
+            success, msg = self._add_iptables_rule(cfg.temp, direction)
             if not success:
                 return False, f"Failed to add iptables rule for {direction} temp: {msg}"
 
-        # Allow lists: create set, затем поставить ACCEPT выше всех DROP
-        for direction, cfg in _ALLOW_CONFIG.items():
-            success, msg = self._create_set(cfg["set"], with_timeout=False)
-            if not success:
-                return False, f"Failed to create {direction} allow set: {msg}"
+        # ACCEPT белого списка — выше всех DROP
+        for direction in _ALLOW_CONFIG:
             self._ensure_allow_rule_priority(direction)
-
-        self._load_permanent_ips()
-        self._load_allow_ips()
-
-        self._initialized = True
-        logger.info("IpsetManager initialized successfully (in + out, block + allow)")
-        return True, "Initialized successfully"
+        return True, ""
     
     # ── persistence ──
     
-    def _load_config(self):
+    def _read_persisted(self) -> dict:
+        """Содержимое PERSISTENT_FILE ({} если файла нет или он битый)."""
         try:
-            if not os.path.exists(PERSISTENT_FILE):
-                return
             with open(PERSISTENT_FILE, 'r') as f:
-                data = json.load(f)
-                self._temp_timeout = data.get('temp_timeout', DEFAULT_TIMEOUT)
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
         except Exception as e:
             logger.warning(f"Failed to load config: {e}")
+            return {}
     
     def _save_config(self):
+        """Записать состояние в PERSISTENT_FILE атомарно (tmp + fsync + rename).
+
+        Вызывать под _mutate_lock: данные берутся из кэша записей сетов.
+        """
         try:
             data = {
                 'in_permanent': self.list_ips(permanent=True, direction="in"),
@@ -347,94 +578,105 @@ class IpsetManager:
                 'temp_timeout': self._temp_timeout,
             }
             Path(PERSISTENT_FILE).parent.mkdir(parents=True, exist_ok=True)
-            with open(PERSISTENT_FILE, 'w') as f:
-                json.dump(data, f, indent=2)
+            tmp_path = PERSISTENT_FILE + ".tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(data, f, separators=(',', ':'))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, PERSISTENT_FILE)
             logger.debug("Saved config to file")
         except Exception as e:
             logger.error(f"Failed to save config: {e}")
     
-    def _load_permanent_ips(self):
-        try:
-            if not os.path.exists(PERSISTENT_FILE):
+    def _schedule_save(self):
+        """Сохранить через SAVE_DEBOUNCE_S; вызовы в пределах окна сливаются в одну запись."""
+        with self._save_timer_lock:
+            if self._save_timer is not None:
                 return
-            with open(PERSISTENT_FILE, 'r') as f:
-                data = json.load(f)
-            
-            # Backward compat: old format has 'permanent' key (all incoming)
-            if 'permanent' in data and 'in_permanent' not in data:
-                data['in_permanent'] = data['permanent']
-            
-            for direction, key in [("in", "in_permanent"), ("out", "out_permanent")]:
-                ips = data.get(key, [])
-                if not ips:
-                    continue
-                set_name = self._resolve_set(permanent=True, direction=direction)
-                valid, _, skipped = self._prepare_block_ips(ips)
-                success, _, stderr = self._run_ipset_restore(
-                    [f"add {set_name} {ip}" for ip in sorted(valid)]
-                )
-                if success:
-                    logger.info(f"Loaded {len(valid)} {direction} permanent IPs from file"
-                                + (f" (skipped {skipped} non-public)" if skipped else ""))
-                else:
-                    logger.error(f"Failed to load {direction} permanent IPs: {stderr}")
-        except Exception as e:
-            logger.warning(f"Failed to load permanent IPs: {e}")
+            self._save_timer = threading.Timer(SAVE_DEBOUNCE_S, self.flush_pending_save)
+            self._save_timer.daemon = True
+            self._save_timer.start()
+    
+    def flush_pending_save(self):
+        """Немедленно записать отложенное сохранение, если оно есть (и при остановке)."""
+        with self._save_timer_lock:
+            timer, self._save_timer = self._save_timer, None
+        if timer is None:
+            return
+        timer.cancel()
+        with self._mutate_lock:
+            self._save_config()
+    
+    def _load_persisted_ips(self, data: dict):
+        """Вернуть сохранённые записи всех четырёх сетов одним `ipset restore`."""
+        # Backward compat: old format has 'permanent' key (all incoming)
+        if 'permanent' in data and 'in_permanent' not in data:
+            data['in_permanent'] = data['permanent']
+
+        lines: list[str] = []
+        loaded: list[str] = []
+        for direction, key in [("in", "in_permanent"), ("out", "out_permanent")]:
+            ips = data.get(key) or []
+            if not ips:
+                continue
+            set_name = self._resolve_set(permanent=True, direction=direction)
+            valid, _, skipped = self._prepare_block_ips(ips)
+            lines += [f"add {set_name} {ip}" for ip in sorted(valid)]
+            loaded.append(f"{len(valid)} {direction} permanent"
+                          + (f" (skipped {skipped} non-public)" if skipped else ""))
+        for direction, key in [("in", "in_allow"), ("out", "out_allow")]:
+            ips = data.get(key) or []
+            if not ips:
+                continue
+            set_name = self._get_allow_cfg(direction).set_name
+            valid = sorted(self._canon_ips(ips)[0])
+            lines += [f"add {set_name} {ip}" for ip in valid]
+            loaded.append(f"{len(valid)} {direction} allow")
 
-    def _load_allow_ips(self):
-        try:
-            if not os.path.exists(PERSISTENT_FILE):
-                return
-            with open(PERSISTENT_FILE, 'r') as f:
-                data = json.load(f)
-
-            for direction, key in [("in", "in_allow"), ("out", "out_allow")]:
-                ips = data.get(key, [])
-                if not ips:
-                    continue
-                set_name = self._get_allow_cfg(direction)["set"]
-                valid = sorted({
-                    self._normalize_ip(ip) for ip in ips
-                    if self._validate_ip_cidr(self._normalize_ip(ip))
-                })
-                success, _, stderr = self._run_ipset_restore(
-                    [f"add {set_name} {ip}" for ip in valid]
-                )
-                if success:
-                    logger.info(f"Loaded {len(valid)} {direction} allow IPs from file")
-                else:
-                    logger.error(f"Failed to load {direction} allow IPs: {stderr}")
-        except Exception as e:
-            logger.warning(f"Failed to load allow IPs: {e}")
+        if not lines:
+            return
+        success, _, stderr = self._run_ipset_restore(lines)
+        if success:
+            logger.info(f"Loaded IPs from file: {', '.join(loaded)}")
+        else:
+            logger.error(f"Failed to load persisted IPs: {stderr}")
     
     # ── core operations ──
     
-    def _ip_in_set(self, ip: str, set_name: str) -> bool:
-        success, _, _ = self._run_ipset(["test", set_name, ip])
-        return success
-    
     def add_ip(self, ip: str, permanent: bool = True, direction: str = "in", save: bool = True, timeout: int | None = None) -> tuple[bool, str]:
-        ip = self._normalize_ip(ip)
-        if not self._validate_ip_cidr(ip):
-            return False, f"Invalid IP/CIDR: {ip}"
-        if not is_public_range(ip):
+        net = _parse_ipv4_net(ip)
+        if net is None:
+            return False, f"Invalid IP/CIDR: {ip.strip()}"
+        ip = _canonical(net)
+        if not _is_public_net(net):
             return False, f"Refused to block non-public range: {ip}"
 
         set_name = self._resolve_set(permanent, direction)
-
-        if self._ip_in_set(ip, set_name):
-            return True, f"{ip} already in {set_name}"
-
-        args = ["add", set_name, ip]
         if not permanent:
+            # Temp: повторная блокировка обновляет таймаут записи (-exist), как и
+            # restore в bulk_add; без -exist ipset ответил бы "already added"
+            # и оставил старый таймаут
             effective_timeout = timeout if timeout is not None else self._temp_timeout
-            args.extend(["timeout", str(effective_timeout)])
-        
-        success, stdout, stderr = self._run_ipset(args)
+            return self._add_entry(set_name, ip, ["timeout", str(effective_timeout)], exist=True)
+
+        with self._mutate_lock:
+            members = self._cached_members(set_name)
+            if ip in members:
+                return True, f"{ip} already in {set_name}"
+            success, msg = self._add_entry(set_name, ip)
+            if success:
+                members.add(ip)
+                if save:
+                    self._schedule_save()
+            return success, msg
+    
+    def _add_entry(
+        self, set_name: str, ip: str, extra: Optional[list[str]] = None, exist: bool = False
+    ) -> tuple[bool, str]:
+        args = ["-exist", "add"] if exist else ["add"]
+        success, stdout, stderr = self._run_ipset(args + [set_name, ip] + (extra or []))
         if success:
             logger.info(f"Added {ip} to {set_name}")
-            if permanent and save:
-                self._save_config()
             return True, f"Added {ip} to {set_name}"
         if "already added" in stderr.lower() or "already in set" in stderr.lower():
             return True, f"{ip} already in {set_name}"
@@ -442,50 +684,86 @@ class IpsetManager:
         return False, f"Failed to add: {stderr}"
     
     def remove_ip(self, ip: str, permanent: bool = True, direction: str = "in") -> tuple[bool, str]:
-        ip = self._normalize_ip(ip)
-        if not self._validate_ip_cidr(ip):
-            return False, f"Invalid IP/CIDR: {ip}"
+        net = _parse_ipv4_net(ip)
+        if net is None:
+            return False, f"Invalid IP/CIDR: {ip.strip()}"
+        ip = _canonical(net)
         
         set_name = self._resolve_set(permanent, direction)
+        if not permanent:
+            return self._del_entry(set_name, ip)
+
+        with self._mutate_lock:
+            members = self._cached_members(set_name)
+            if ip not in members:
+                return True, f"{ip} was not in {set_name}"
+            success, msg = self._del_entry(set_name, ip)
+            if success:
+                members.discard(ip)
+                self._schedule_save()
+            return success, msg
+    
+    def _del_entry(self, set_name: str, ip: str) -> tuple[bool, str]:
         success, stdout, stderr = self._run_ipset(["del", set_name, ip])
-        
         if success:
             logger.info(f"Removed {ip} from {set_name}")
-            if permanent:
-                self._save_config()
             return True, f"Removed {ip} from {set_name}"
-        if "not in set" in stderr.lower() or "element is missing" in stderr.lower():
+        lowered = stderr.lower()
+        if "not in set" in lowered or "element is missing" in lowered or "it's not added" in lowered:
             return True, f"{ip} was not in {set_name}"
         logger.error(f"Failed to remove {ip} from {set_name}: {stderr}")
         return False, f"Failed to remove: {stderr}"
     
+    def _list_members(self, set_name: str) -> Optional[list[str]]:
+        """Записи сета из `ipset save`: по строке `add <set> <ip> [timeout N]`.
+
+        В отличие от `ipset list`, без заголовка и без поиска секции Members.
+        None — сет прочитать не удалось.
+        """
+        try:
+            return [
+                line.split(maxsplit=3)[2]
+                for line in self._run_ipset_stream(["save", set_name])
+                if line.startswith("add ")
+            ]
+        except subprocess.CalledProcessError as e:
+            logger.error(f"Failed to list {set_name}: {e.stderr}")
+        except (OSError, subprocess.SubprocessError) as e:
+            logger.error(f"Failed to list {set_name}: {e}")
+        return None
+    
+    def _cached_members(self, set_name: str) -> set[str]:
+        """Живая копия записей сета из _CACHED_SETS (правится вызывающим).
+
+        Записи в той же канонической форме, что и входные данные sync/add_ip,
+        чтобы diff не видел "1.2.3.4" и "1.2.3.4/32" разными записями.
+        """
+        members = self._members.get(set_name)
+        if members is None:
+            listed = self._list_members(set_name)
+            if listed is None:
+                # Не кэшируем пустоту: при следующем обращении попробуем снова
+                return set()
+            members = self._members[set_name] = self._canon_ips(listed)[0]
+        return members
+    
+    def _get_members(self, set_name: str) -> list[str]:
+        if set_name in _CACHED_SETS:
+            return sorted(self._cached_members(set_name))
+        return self._list_members(set_name) or []
+    
     def list_ips(self, permanent: bool = True, direction: str = "in") -> list[str]:
-        set_name = self._resolve_set(permanent, direction)
-        success, stdout, stderr = self._run_ipset(["list", set_name])
-        if not success:
-            logger.error(f"Failed to list {set_name}: {stderr}")
-            return []
-        
-        ips = []
-        in_members = False
-        for line in stdout.split('\n'):
-            line = line.strip()
-            if line.startswith('Members:'):
-                in_members = True
-                continue
-            if in_members and line:
-                parts = line.split()
-                if parts:
-                    ips.append(parts[0])
-        return ips
+        return self._get_members(self._resolve_set(permanent, direction))
     
     def clear_set(self, permanent: bool = True, direction: str = "in") -> tuple[bool, str]:
         set_name = self._resolve_set(permanent, direction)
-        success, stdout, stderr = self._run_ipset(["flush", set_name])
+        with self._mutate_lock:
+            success, stdout, stderr = self._run_ipset(["flush", set_name])
+            if success and permanent:
+                self._members[set_name] = set()
+                self._schedule_save()
         if success:
             logger.info(f"Cleared {set_name}")
-            if permanent:
-                self._save_config()
             return True, f"Cleared {set_name}"
         logger.error(f"Failed to clear {set_name}: {stderr}")
         return False, f"Failed to clear: {stderr}"
@@ -499,7 +777,7 @@ class IpsetManager:
         
         # Recreate temp sets for both directions
         for direction, cfg in _DIR_CONFIG.items():
-            temp_set = cfg["temp"]
+            temp_set = cfg.temp
             self._remove_iptables_rule(temp_set, direction)
             self._run_ipset(["destroy", temp_set])
             
@@ -517,7 +795,7 @@ class IpsetManager:
             # temp-DROP всплыл в позицию 1 — вернуть ACCEPT белого списка выше него
             self._ensure_allow_rule_priority(direction)
 
-        self._save_config()
+        self._schedule_save()
         logger.info(f"Changed temp timeout to {seconds}s")
         return True, f"Timeout changed to {seconds} seconds"
     
@@ -529,13 +807,13 @@ class IpsetManager:
         invalid: list[str] = []
         skipped_non_public = 0
         for ip in ips:
-            ip = self._normalize_ip(ip)
-            if not self._validate_ip_cidr(ip):
-                invalid.append(ip)
-            elif not is_public_range(ip):
+            net = _parse_ipv4_net(ip)
+            if net is None:
+                invalid.append(ip.strip())
+            elif not _is_public_net(net):
                 skipped_non_public += 1
             else:
-                normalized.add(ip)
+                normalized.add(_canonical(net))
         return normalized, invalid, skipped_non_public
 
     def bulk_add(self, ips: list[str], permanent: bool = True, direction: str = "in", timeout: int | None = None) -> tuple[int, int, list[str]]:
@@ -555,10 +833,13 @@ class IpsetManager:
             lines = [f"add {set_name} {ip}{suffix}" for ip in sorted(normalized)]
             success, _, stderr = self._run_ipset_restore(lines)
             if not success:
+                # restore мог примениться частично — кэш перечитаем из ядра
+                self._members.pop(set_name, None)
                 logger.error(f"bulk_add restore failed for {set_name}: {stderr}")
                 return 0, len(ips), errors + [f"ipset restore: {stderr}"]
             if permanent and normalized:
-                self._save_config()
+                self._cached_members(set_name).update(normalized)
+                self._schedule_save()
 
         fail_count = len(invalid) + skipped_non_public
         logger.info(f"Bulk-added {len(normalized)} entries to {set_name}")
@@ -566,15 +847,7 @@ class IpsetManager:
 
     def bulk_remove(self, ips: list[str], permanent: bool = True, direction: str = "in") -> tuple[int, int, list[str]]:
         set_name = self._resolve_set(permanent, direction)
-
-        normalized: set[str] = set()
-        invalid: list[str] = []
-        for ip in ips:
-            ip = self._normalize_ip(ip)
-            if self._validate_ip_cidr(ip):
-                normalized.add(ip)
-            else:
-                invalid.append(ip)
+        normalized, invalid = self._canon_ips(ips)
 
         errors = [f"{ip}: Invalid IP/CIDR" for ip in invalid]
 
@@ -582,10 +855,12 @@ class IpsetManager:
             lines = [f"del {set_name} {ip}" for ip in sorted(normalized)]
             success, _, stderr = self._run_ipset_restore(lines)
             if not success:
+                self._members.pop(set_name, None)
                 logger.error(f"bulk_remove restore failed for {set_name}: {stderr}")
                 return 0, len(ips), errors + [f"ipset restore: {stderr}"]
             if permanent and normalized:
-                self._save_config()
+                self._cached_members(set_name).difference_update(normalized)
+                self._schedule_save()
 
         logger.info(f"Bulk-removed {len(normalized)} entries from {set_name}")
         return len(normalized), len(invalid), errors
@@ -595,7 +870,10 @@ class IpsetManager:
         new_ips, invalid_ips, skipped_non_public = self._prepare_block_ips(ips)
 
         with self._mutate_lock:
-            current_ips = set(self.list_ips(permanent=permanent, direction=direction))
+            if permanent:
+                current_ips = self._cached_members(set_name)
+            else:
+                current_ips = self._canon_ips(self._list_members(set_name) or [])[0]
 
             to_add = new_ips - current_ips
             to_remove = current_ips - new_ips
@@ -604,11 +882,13 @@ class IpsetManager:
             lines += [f"add {set_name} {ip}" for ip in sorted(to_add)]
             success, _, stderr = self._run_ipset_restore(lines)
             if not success:
+                self._members.pop(set_name, None)
                 logger.error(f"sync restore failed for {set_name}: {stderr}")
                 return False, f"ipset restore failed: {stderr}", {}
 
             if permanent:
-                self._save_config()
+                self._members[set_name] = new_ips
+                self._schedule_save()
 
         result = {
             'total': len(new_ips),
@@ -625,39 +905,14 @@ class IpsetManager:
     # ── allow list operations (always permanent, no timeout) ──
 
     def list_allow_ips(self, direction: str = "in") -> list[str]:
-        set_name = self._get_allow_cfg(direction)["set"]
-        success, stdout, stderr = self._run_ipset(["list", set_name])
-        if not success:
-            logger.error(f"Failed to list {set_name}: {stderr}")
-            return []
-
-        ips = []
-        in_members = False
-        for line in stdout.split('\n'):
-            line = line.strip()
-            if line.startswith('Members:'):
-                in_members = True
-                continue
-            if in_members and line:
-                parts = line.split()
-                if parts:
-                    ips.append(parts[0])
-        return ips
+        return self._get_members(self._get_allow_cfg(direction).set_name)
 
     def sync_allow(self, ips: list[str], direction: str = "in") -> tuple[bool, str, dict]:
-        set_name = self._get_allow_cfg(direction)["set"]
-
-        normalized_ips = set()
-        invalid_ips = []
-        for ip in ips:
-            ip = self._normalize_ip(ip)
-            if self._validate_ip_cidr(ip):
-                normalized_ips.add(ip)
-            else:
-                invalid_ips.append(ip)
+        set_name = self._get_allow_cfg(direction).set_name
+        normalized_ips, invalid_ips = self._canon_ips(ips)
 
         with self._mutate_lock:
-            current_ips = set(self.list_allow_ips(direction=direction))
+            current_ips = self._cached_members(set_name)
             to_add = normalized_ips - current_ips
             to_remove = current_ips - normalized_ips
 
@@ -665,10 +920,12 @@ class IpsetManager:
             lines += [f"add {set_name} {ip}" for ip in sorted(to_add)]
             success, _, stderr = self._run_ipset_restore(lines)
             if not success:
+                self._members.pop(set_name, None)
                 logger.error(f"sync_allow restore failed for {set_name}: {stderr}")
                 return False, f"ipset restore failed: {stderr}", {}
 
-            self._save_config()
+            self._members[set_name] = normalized_ips
+            self._schedule_save()
 
         result = {
             'total': len(normalized_ips),
@@ -680,16 +937,19 @@ class IpsetManager:
         return True, f"Synced {set_name}", result
 
     def get_status(self) -> IpsetStatus:
+        # Все четыре проверки правил — по одному снимку вместо четырёх `iptables -C`
+        snapshot = self._snapshot_iptables()
+
         def _dir_status(direction: str) -> DirectionStatus:
             cfg = self._get_dir_cfg(direction)
             return DirectionStatus(
-                permanent_count=self._set_count(cfg["perm"]),
-                temp_count=self._set_count(cfg["temp"]),
+                permanent_count=len(self._cached_members(cfg.perm)),
+                temp_count=self._set_count(cfg.temp),
                 iptables_rules_exist=(
-                    self._iptables_rule_exists(cfg["perm"], direction)
-                    and self._iptables_rule_exists(cfg["temp"], direction)
+                    self._iptables_rule_exists(cfg.perm, direction, snapshot)
+                    and self._iptables_rule_exists(cfg.temp, direction, snapshot)
                 ),
-                allow_count=self._set_count(self._get_allow_cfg(direction)["set"]),
+                allow_count=len(self._cached_members(self._get_allow_cfg(direction).set_name)),
             )
         
         return IpsetStatus(
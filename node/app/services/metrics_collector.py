@@ -3,19 +3,148 @@ All speed calculations are done on the panel side.
 """
 
 import asyncio
+import heapq
 import json
+import logging
 import os
 import socket
 import platform
+import random
+import re
 import threading
 import time
+from collections import Counter
 from datetime import datetime, timezone
+from operator import itemgetter
 from pathlib import Path
 
 import psutil
 
 from app.config import get_settings
 
+logger = logging.getLogger(__name__)
+
+# /proc отдаём целиком за один-два read(): файл генерируется ядром на каждое
+# чтение, построчное чтение через TextIOWrapper — лишние syscalls и копии
+PROC_READ_SIZE = 65536
+
+# Поля /proc/net/dev (после "iface:") в порядке колонок ядра
+_NET_DEV_FIELDS = (
+    ("rx_bytes", 0), ("rx_packets", 1), ("rx_errors", 2), ("rx_drops", 3),
+    ("tx_bytes", 8), ("tx_packets", 9), ("tx_errors", 10), ("tx_drops", 11),
+)
+
+# Состояние сокета в /proc/net/tcp* (hex, ядро пишет в верхнем регистре) ->
+# корзина tcp_stats; CLOSE/LAST_ACK/CLOSING и неизвестные — в "other"
+_TCP_BUCKET = {
+    b'01': 'established',
+    b'02': 'syn_sent',
+    b'03': 'syn_recv',
+    b'04': 'fin_wait',
+    b'05': 'fin_wait',
+    b'06': 'time_wait',
+    b'08': 'close_wait',
+    b'0A': 'listen',
+}
+_TCP_STATS_KEYS = (
+    'established', 'listen', 'time_wait', 'close_wait',
+    'syn_sent', 'syn_recv', 'fin_wait', 'other',
+)
+
+
+def _tcp_state_counts(content: bytes) -> Counter:
+    """Bucket name -> socket count for a /proc/net/tcp{,6} dump (header skipped).
+
+    Считаем сырые коды состояний одним list comprehension и сворачиваем в
+    корзины уже по ~10 различным кодам, а не словарём на каждую строку."""
+    lines = content.splitlines()[1:]
+    try:
+        codes = Counter([line.split(None, 4)[3] for line in lines])
+    except IndexError:
+        # Обрезанная строка — не ядерный формат, разбираем поштучно
+        codes = Counter(parts[3] for parts in map(bytes.split, lines) if len(parts) >= 4)
+    buckets = Counter()
+    for code, count in codes.items():
+        buckets[_TCP_BUCKET.get(code, 'other')] += count
+    return buckets
+
+
+# /proc/<pid>/stat: "pid (comm) state fields..."; comm может содержать пробелы
+# и скобки, поэтому режем по последней ") "
+# Индексы в полях после comm (поле N из proc(5) -> N - 3)
+_STAT_STATE, _STAT_UTIME, _STAT_STIME, _STAT_STARTTIME, _STAT_RSS = 0, 11, 12, 19, 21
+# Как psutil.Process.status()
+_PROC_STATUS = {
+    'R': 'running', 'S': 'sleeping', 'D': 'disk-sleep', 'T': 'stopped',
+    't': 'tracing-stop', 'Z': 'zombie', 'X': 'dead', 'x': 'dead',
+    'K': 'wake-kill', 'W': 'waking', 'I': 'idle', 'P': 'parked',
+}
+# Одна строка из cpuinfo / os-release — ищем регуляркой по всему файлу,
+# без разбиения на строки
+_CPU_MODEL_RE = re.compile(r'^model name\s*:\s*(.*)$', re.M)
+_PRETTY_NAME_RE = re.compile(r'^PRETTY_NAME=(.*)$', re.M)
+# Ядро обрезает comm до 15 байт; полное имя тогда берём из cmdline
+_COMM_MAX = 15
+
+
+def _parse_proc_stat(content: bytes) -> tuple[str, str, int, int, int] | None:
+    """(comm, state, utime+stime ticks, starttime, rss pages) from /proc/<pid>/stat"""
+    left, sep, rest = content.rpartition(b') ')
+    start = left.find(b'(')
+    if not sep or start < 0:
+        return None
+    fields = rest.split()
+    if len(fields) <= _STAT_RSS:
+        return None
+    return (
+        left[start + 1:].decode('utf-8', 'replace'),
+        fields[_STAT_STATE].decode(),
+        int(fields[_STAT_UTIME]) + int(fields[_STAT_STIME]),
+        int(fields[_STAT_STARTTIME]),
+        int(fields[_STAT_RSS]),
+    )
+
+
+def _read_proc_bytes(path: str) -> bytes:
+    """Read a /proc file as bytes in PROC_READ_SIZE chunks."""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        chunks = []
+        while True:
+            chunk = os.read(fd, PROC_READ_SIZE)
+            if not chunk:
+                return b"".join(chunks)
+            chunks.append(chunk)
+    finally:
+        os.close(fd)
+
+
+# Буфер на поток: коллекторы идут параллельно из тред-пула, а один и тот же
+# поток обрабатывает прочитанное до следующего чтения
+_proc_buf = threading.local()
+
+
+def _read_proc_into(path: str) -> tuple[bytearray, int]:
+    """Read a /proc file into this thread's reusable buffer -> (buffer, length).
+
+    Буфер растёт вдвое, пока файл не поместится, и живёт между циклами сбора;
+    содержимое валидно до следующего вызова в том же потоке."""
+    buf = getattr(_proc_buf, 'buf', None)
+    if buf is None:
+        buf = _proc_buf.buf = bytearray(PROC_READ_SIZE)
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        n = 0
+        while True:
+            if n == len(buf):
+                buf.extend(bytes(len(buf)))
+            got = os.readv(fd, [memoryview(buf)[n:]])
+            if not got:
+                return buf, n
+            n += got
+    finally:
+        os.close(fd)
+
 
 class MetricsCollector:
     """Collects current system metrics from host - raw values only.
@@ -27,62 +156,128 @@ class MetricsCollector:
     # «одно ядро 100%, остальные 0» — не пересэмплируем чаще этого порога
     CPU_SAMPLE_MIN_INTERVAL = 0.5
 
+    # ±10% к TTL каждой записи: клиенты, опрашивающие на одной секунде,
+    # не промахиваются по кэшу все разом
+    CACHE_TTL_JITTER = 0.1
+    # Без hwmon-датчиков sensors_temperatures() зря обходит /sys/class/hwmon
+    # на каждый вызов: после пустого ответа перепроверяем раз в час (hotplug)
+    SENSORS_REPROBE_INTERVAL = 3600.0
+
     def __init__(self):
         self.settings = get_settings()
         # Initialize CPU baseline for non-blocking calls
         psutil.cpu_percent(percpu=True)
-        self._last_cpu_percent: list = [0.0] * (psutil.cpu_count() or 1)
+        # Число ядер фиксировано (cpu_count(logical=False) ходит в sysfs topology)
+        self._cores_logical: int = psutil.cpu_count(logical=True) or 1
+        self._cores_physical: int = psutil.cpu_count(logical=False) or 1
+        self._last_cpu_percent: list = [0.0] * self._cores_logical
+        self._last_cpu_usage: float = 0.0
         self._last_cpu_sample_at: float = time.monotonic()
         self._cpu_lock = threading.Lock()
+        # Пути на хосте считаем один раз, дальше — готовые строки для os.open
+        host_proc = self.settings.host_proc
+        self._host_root: str = os.path.dirname(host_proc.rstrip('/')) or '/'
+        self._tcp_paths = (f"{host_proc}/net/tcp", f"{host_proc}/net/tcp6")
+        self._udp_paths = (f"{host_proc}/net/udp", f"{host_proc}/net/udp6")
         # Process cache to avoid blocking
         self._processes_cache: list = []
-        self._processes_cache_time: float = 0
-        self._processes_cache_ttl: float = 5.0  # 5 seconds
+        self._processes_expires_at: float = 0.0
+        self._processes_cache_ttl: float = self.settings.metrics_processes_cache_ttl
+        # pid -> (starttime, utime+stime) с прошлого скана для cpu_percent
+        self._last_proc_times: dict[int, tuple[int, int]] = {}
+        self._last_proc_scan_at: float = 0.0
+        self._clk_tck: int = os.sysconf('SC_CLK_TCK')
+        self._phys_pages: int = os.sysconf('SC_PHYS_PAGES')
         # System info cache (connections parsing is heavy)
         self._system_cache: dict = {}
-        self._system_cache_time: float = 0
-        self._system_cache_ttl: float = 5.0  # 5 seconds
+        self._system_expires_at: float = 0.0
+        self._system_cache_ttl: float = self.settings.metrics_system_cache_ttl
+        # Перечень разделов и интерфейсов обходит sysfs/mountinfo на каждый вызов,
+        # а меняется редко — держим снимок, usage/счётчики читаются каждый раз
+        self._partitions_cache_ttl: float = self.settings.metrics_partitions_cache_ttl
+        self._net_if_cache_ttl: float = self.settings.metrics_net_if_cache_ttl
+        # Имя зоны из /etc/timezone; смещение (DST) считается на каждый вызов
+        self._timezone_cache_ttl: float = self.settings.metrics_timezone_cache_ttl
+        # Разбор сертификатов (openssl по каждому домену) — в фоне, запрос метрик
+        # отдаёт последний готовый результат
+        self._certs_refresh_interval: float = self.settings.metrics_certs_refresh_interval
+        # Коллекторы идут параллельно из тред-пула (get_all_metrics, роутеры)
+        self._processes_lock = threading.Lock()
+        self._system_lock = threading.Lock()
+        self._certs_info: dict = {"count": 0, "closest_expiry": None}
+        self._certs_lock = threading.Lock()
+        self._certs_refresher: threading.Thread | None = None
+        # Не меняются до перезагрузки хоста — читаем один раз
+        self._cpu_model: str | None = None
+        self._static_system: dict | None = None
+        # None — ещё не пробовали; False — датчиков нет до _temps_reprobe_at
+        self._has_temps: bool | None = None
+        self._temps_reprobe_at: float = 0.0
+        # btime из /proc/stat фиксирован до перезагрузки; аптайм берём из
+        # CLOCK_BOOTTIME — это /proc/uptime без чтения файла и без скачков часов
+        self._boot_time_iso: str = datetime.fromtimestamp(psutil.boot_time()).isoformat()
+        # key -> (monotonic expiry, value) для _cached()
+        self._ttl_cache: dict[str, tuple[float, object]] = {}
+        logger.info(
+            "Metrics cache TTLs: processes=%ss system=%ss partitions=%ss net_if=%ss "
+            "timezone=%ss certs_refresh=%ss",
+            self._processes_cache_ttl, self._system_cache_ttl, self._partitions_cache_ttl,
+            self._net_if_cache_ttl, self._timezone_cache_ttl, self._certs_refresh_interval,
+        )
     
     def _read_host_file(self, path: str) -> str:
         """Read file from host filesystem"""
-        host_path = Path(self.settings.host_proc).parent / path.lstrip('/')
-        if host_path.exists():
-            return host_path.read_text(encoding='utf-8', errors='replace')
-        fallback = Path(path)
-        if fallback.exists():
-            return fallback.read_text(encoding='utf-8', errors='replace')
+        for candidate in (os.path.join(self._host_root, path.lstrip('/')), path):
+            try:
+                return _read_proc_bytes(candidate).decode('utf-8', 'replace')
+            except FileNotFoundError:
+                continue
         return ""
     
+    def _expires_at(self, ttl: float) -> float:
+        """Monotonic deadline ttl seconds from now, with CACHE_TTL_JITTER spread"""
+        jitter = random.uniform(-self.CACHE_TTL_JITTER, self.CACHE_TTL_JITTER)
+        return time.monotonic() + ttl * (1 + jitter)
+    
+    def _cached(self, key: str, ttl: float, fn):
+        """Return fn() memoized under key for about ttl seconds (monotonic clock)"""
+        entry = self._ttl_cache.get(key)
+        if entry is None or time.monotonic() >= entry[0]:
+            entry = (self._expires_at(ttl), fn())
+            self._ttl_cache[key] = entry
+        return entry[1]
+    
     def prime_cpu_baseline(self):
         """Стартовый блокирующий замер (~0.25с) при запуске ноды: первый запрос
         метрик сразу получает реальные значения per-CPU, а не нули/мусор
         нулевого интервала."""
         with self._cpu_lock:
-            self._last_cpu_percent = psutil.cpu_percent(interval=0.25, percpu=True)
-            self._last_cpu_sample_at = time.monotonic()
+            self._store_cpu_sample(psutil.cpu_percent(interval=0.25, percpu=True), time.monotonic())
+
+    def _store_cpu_sample(self, per_cpu: list, now: float):
+        """Keep the per-CPU list and its mean together so readers reuse both (call under _cpu_lock)"""
+        self._last_cpu_percent = per_cpu
+        self._last_cpu_usage = sum(per_cpu) / len(per_cpu) if per_cpu else 0.0
+        self._last_cpu_sample_at = now
 
-    def _sample_per_cpu(self) -> list:
+    def _sample_per_cpu(self) -> tuple[list, float]:
         """Per-CPU % с защитой от слишком коротких интервалов замера.
 
         Состояние psutil глобально на процесс, а запросы метрик идут из тред-пула:
         без лока и порога два близких запроса укорачивают интервал друг друга
         до миллисекунд и получают мусор. Ранним запросам отдаём последний
-        валидный замер."""
+        валидный замер. Возвращает (per-CPU список, средняя загрузка)."""
         with self._cpu_lock:
             now = time.monotonic()
             if now - self._last_cpu_sample_at >= self.CPU_SAMPLE_MIN_INTERVAL:
                 sampled = psutil.cpu_percent(interval=None, percpu=True)
                 if sampled:
-                    self._last_cpu_percent = sampled
-                    self._last_cpu_sample_at = now
-            return self._last_cpu_percent
+                    self._store_cpu_sample(sampled, now)
+            return self._last_cpu_percent, self._last_cpu_usage
 
     def get_cpu_info(self) -> dict:
         """Get CPU information and usage"""
-        cpu_count_logical = psutil.cpu_count(logical=True) or 1
-        cpu_count_physical = psutil.cpu_count(logical=False) or 1
-
-        per_cpu = self._sample_per_cpu()
+        per_cpu, usage = self._sample_per_cpu()
         
         try:
             load_avg = os.getloadavg()
@@ -96,6 +291,29 @@ class MetricsCollector:
             "max": freq.max if freq else 0
         }
         
+        temps = self._read_temperatures()
+        
+        if self._cpu_model is None:
+            m = _CPU_MODEL_RE.search(self._read_host_file("/proc/cpuinfo"))
+            self._cpu_model = m.group(1).strip() if m else "Unknown"
+        
+        return {
+            "cores_physical": self._cores_physical,
+            "cores_logical": self._cores_logical,
+            "model": self._cpu_model,
+            "usage_percent": usage,
+            "per_cpu_percent": per_cpu,
+            "load_avg_1": load_avg[0],
+            "load_avg_5": load_avg[1],
+            "load_avg_15": load_avg[2],
+            "frequency": cpu_freq,
+            "temperatures": temps
+        }
+    
+    def _read_temperatures(self) -> dict:
+        """psutil.sensors_temperatures() unless the last probe found no sensors"""
+        if self._has_temps is False and time.monotonic() < self._temps_reprobe_at:
+            return {}
         temps = {}
         try:
             temp_data = psutil.sensors_temperatures()
@@ -107,26 +325,10 @@ class MetricsCollector:
                     ]
         except (AttributeError, Exception):
             pass
-        
-        model = "Unknown"
-        cpuinfo = self._read_host_file("/proc/cpuinfo")
-        for line in cpuinfo.split('\n'):
-            if line.startswith('model name'):
-                model = line.split(':')[1].strip()
-                break
-        
-        return {
-            "cores_physical": cpu_count_physical,
-            "cores_logical": cpu_count_logical,
-            "model": model,
-            "usage_percent": sum(per_cpu) / len(per_cpu) if per_cpu else 0,
-            "per_cpu_percent": per_cpu,
-            "load_avg_1": load_avg[0],
-            "load_avg_5": load_avg[1],
-            "load_avg_15": load_avg[2],
-            "frequency": cpu_freq,
-            "temperatures": temps
-        }
+        self._has_temps = bool(temps)
+        if not temps:
+            self._temps_reprobe_at = time.monotonic() + self.SENSORS_REPROBE_INTERVAL
+        return temps
     
     def get_memory_info(self) -> dict:
         """Get RAM and swap information"""
@@ -155,7 +357,9 @@ class MetricsCollector:
         """Get disk partitions and usage - raw bytes, no speed calculation"""
         partitions = []
         
-        for part in psutil.disk_partitions(all=False):
+        disk_partitions = self._cached(
+            "partitions", self._partitions_cache_ttl, lambda: psutil.disk_partitions(all=False))
+        for part in disk_partitions:
             if part.fstype and not part.mountpoint.startswith(('/snap', '/boot/efi')):
                 try:
                     usage = psutil.disk_usage(part.mountpoint)
@@ -194,29 +398,18 @@ class MetricsCollector:
         """Read network stats - with network_mode: host psutil sees real traffic"""
         result = {}
         # With network_mode: host, use standard /proc/net/dev (real host network)
-        net_dev_path = Path("/proc/net/dev")
-        
         try:
-            content = net_dev_path.read_text()
-            for line in content.split('\n')[2:]:  # Skip headers
-                if ':' not in line:
+            content = _read_proc_bytes("/proc/net/dev")
+            for line in content.splitlines()[2:]:  # Skip headers
+                iface, sep, rest = line.partition(b':')
+                if not sep:
                     continue
-                parts = line.split(':')
-                iface = parts[0].strip()
+                iface = iface.strip().decode()
                 if iface == 'lo':
                     continue
-                values = parts[1].split()
+                values = rest.split()
                 if len(values) >= 16:
-                    result[iface] = {
-                        'rx_bytes': int(values[0]),
-                        'rx_packets': int(values[1]),
-                        'rx_errors': int(values[2]),
-                        'rx_drops': int(values[3]),
-                        'tx_bytes': int(values[8]),
-                        'tx_packets': int(values[9]),
-                        'tx_errors': int(values[10]),
-                        'tx_drops': int(values[11]),
-                    }
+                    result[iface] = {name: int(values[i]) for name, i in _NET_DEV_FIELDS}
         except Exception:
             pass
         return result
@@ -255,8 +448,8 @@ class MetricsCollector:
         # Read from HOST's /proc/net/dev for real traffic
         host_net_stats = self._read_host_net_dev()
 
-        addrs = psutil.net_if_addrs()
-        stats = psutil.net_if_stats()
+        addrs = self._cached("if_addrs", self._net_if_cache_ttl, psutil.net_if_addrs)
+        stats = self._cached("if_stats", self._net_if_cache_ttl, psutil.net_if_stats)
 
         # Bond slaves duplicate traffic already counted on bond master
         bond_slaves = self._get_bond_slaves()
@@ -312,14 +505,14 @@ class MetricsCollector:
 
         # Total traffic — only physical interfaces, excluding bond slaves to avoid double-counting
         # (bond master already includes all slave traffic; veth/docker/br-* mirror physical)
-        physical_stats = {
-            iface: io for iface, io in host_net_stats.items()
-            if not self._is_virtual_interface(iface) and iface not in bond_slaves
-        }
-        total_rx = sum(io['rx_bytes'] for io in physical_stats.values())
-        total_tx = sum(io['tx_bytes'] for io in physical_stats.values())
-        total_rx_packets = sum(io['rx_packets'] for io in physical_stats.values())
-        total_tx_packets = sum(io['tx_packets'] for io in physical_stats.values())
+        total_rx = total_tx = total_rx_packets = total_tx_packets = 0
+        for iface, io in host_net_stats.items():
+            if self._is_virtual_interface(iface) or iface in bond_slaves:
+                continue
+            total_rx += io['rx_bytes']
+            total_tx += io['tx_bytes']
+            total_rx_packets += io['rx_packets']
+            total_tx_packets += io['tx_packets']
         
         total = {
             "rx_bytes": total_rx,
@@ -338,113 +531,109 @@ class MetricsCollector:
     
     def get_processes_info(self, top_n: int = 10) -> dict:
         """Get process statistics and top processes with caching to avoid blocking"""
-        current_time = time.time()
-        cpu_count = psutil.cpu_count() or 1
+        cpu_count = self._cores_logical
         
-        # Cache processes for 5 seconds to avoid blocking on frequent requests
-        if current_time - self._processes_cache_time > self._processes_cache_ttl or not self._processes_cache:
-            processes = []
-            for proc in psutil.process_iter(['pid', 'name', 'cpu_percent', 'memory_percent', 'status']):
-                try:
-                    pinfo = proc.info
-                    # Normalize cpu_percent to 0-100% range (psutil returns 0 to 100*cpu_count)
-                    raw_cpu = pinfo['cpu_percent'] or 0
-                    normalized_cpu = raw_cpu / cpu_count
-                    processes.append({
-                        "pid": pinfo['pid'],
-                        "name": pinfo['name'],
-                        "cpu_percent": round(normalized_cpu, 1),
-                        "memory_percent": pinfo['memory_percent'] or 0,
-                        "status": pinfo['status']
-                    })
-                except (psutil.NoSuchProcess, psutil.AccessDenied):
-                    continue
-            self._processes_cache = processes
-            self._processes_cache_time = current_time
+        # Cache processes for 5 seconds to avoid blocking on frequent requests.
+        # Под локом: параллельный запрос ждёт скан, а не делает второй и не
+        # сбивает базу дельт cpu_percent
+        with self._processes_lock:
+            if time.monotonic() >= self._processes_expires_at or not self._processes_cache:
+                self._processes_cache = self._scan_processes(cpu_count)
+                self._processes_expires_at = self._expires_at(self._processes_cache_ttl)
+            processes = self._processes_cache
+        top_by_cpu = heapq.nlargest(top_n, processes, key=itemgetter('cpu_percent'))
+        top_by_memory = heapq.nlargest(top_n, processes, key=itemgetter('memory_percent'))
         
-        processes = self._processes_cache
-        top_by_cpu = sorted(processes, key=lambda x: x['cpu_percent'], reverse=True)[:top_n]
-        top_by_memory = sorted(processes, key=lambda x: x['memory_percent'], reverse=True)[:top_n]
+        status_counts = Counter(map(itemgetter('status'), processes))
         
         return {
             "total": len(processes),
-            "running": sum(1 for p in processes if p['status'] == 'running'),
-            "sleeping": sum(1 for p in processes if p['status'] == 'sleeping'),
+            "running": status_counts['running'],
+            "sleeping": status_counts['sleeping'],
             "top_by_cpu": top_by_cpu,
             "top_by_memory": top_by_memory
         }
     
+    def _scan_processes(self, cpu_count: int) -> list[dict]:
+        """One read of /proc/<pid>/stat per process instead of psutil.process_iter.
+
+        cpu_percent считается по дельте utime+stime с прошлого скана и
+        нормализуется в 0-100% на всю машину; новый процесс (или переиспользованный
+        pid) получает 0, как и у psutil при первом замере."""
+        proc_root = self.settings.host_proc
+        try:
+            entries = os.scandir(proc_root)
+        except OSError:
+            proc_root = "/proc"
+            entries = os.scandir(proc_root)
+        
+        now = time.monotonic()
+        elapsed = now - self._last_proc_scan_at
+        # тики -> % всей машины за прошедший интервал
+        cpu_scale = 100.0 / (elapsed * self._clk_tck * cpu_count) if self._last_proc_times and elapsed > 0 else 0.0
+        mem_scale = 100.0 / self._phys_pages if self._phys_pages > 0 else 0.0
+        last_times = self._last_proc_times
+        times: dict[int, tuple[int, int]] = {}
+        processes = []
+        with entries:
+            for entry in entries:
+                # d_name из getdents без stat на запись; pid-каталоги начинаются с цифры
+                pid_dir = entry.name
+                if not pid_dir[:1].isdigit():
+                    continue
+                try:
+                    stat = _parse_proc_stat(_read_proc_bytes(f"{proc_root}/{pid_dir}/stat"))
+                except OSError:
+                    continue  # процесс завершился между getdents и read
+                if stat is None:
+                    continue
+                name, state, ticks, starttime, rss = stat
+                pid = int(pid_dir)
+                times[pid] = (starttime, ticks)
+                prev = last_times.get(pid)
+                cpu = (ticks - prev[1]) * cpu_scale if prev and prev[0] == starttime else 0.0
+                if len(name) >= _COMM_MAX:
+                    name = self._full_process_name(proc_root, pid_dir, name)
+                processes.append({
+                    "pid": pid,
+                    "name": name,
+                    "cpu_percent": round(cpu, 1),
+                    "memory_percent": rss * mem_scale,
+                    "status": _PROC_STATUS.get(state, state),
+                })
+        self._last_proc_times = times
+        self._last_proc_scan_at = now
+        return processes
+    
+    @staticmethod
+    def _full_process_name(proc_root: str, pid: str, comm: str) -> str:
+        """Untruncated name from cmdline when comm hit the kernel's 15-byte limit (as psutil does)"""
+        try:
+            cmdline = _read_proc_bytes(f"{proc_root}/{pid}/cmdline")
+        except OSError:
+            return comm
+        exe = os.path.basename(cmdline.split(b'\0', 1)[0]).decode('utf-8', 'replace')
+        return exe if exe.startswith(comm) else comm
+    
     def _read_host_connections(self) -> dict:
         """Read TCP/UDP connection stats from host's /proc/net/*"""
-        # TCP states mapping (hex -> name)
-        tcp_states = {
-            '01': 'established',
-            '02': 'syn_sent',
-            '03': 'syn_recv',
-            '04': 'fin_wait1',
-            '05': 'fin_wait2',
-            '06': 'time_wait',
-            '07': 'close',
-            '08': 'close_wait',
-            '09': 'last_ack',
-            '0A': 'listen',
-            '0B': 'closing',
-        }
-        
-        tcp_stats = {
-            'total': 0,
-            'established': 0,
-            'listen': 0,
-            'time_wait': 0,
-            'close_wait': 0,
-            'syn_sent': 0,
-            'syn_recv': 0,
-            'fin_wait': 0,
-            'other': 0,
-        }
-        udp_stats = {'total': 0}
-        
-        # Read TCP (IPv4 + IPv6)
-        for tcp_file in ['/proc/net/tcp', '/proc/net/tcp6']:
-            host_path = Path(self.settings.host_proc) / tcp_file.lstrip('/proc/')
+        counts = Counter()
+        for tcp_path in self._tcp_paths:
             try:
-                if host_path.exists():
-                    content = host_path.read_text()
-                    for line in content.strip().split('\n')[1:]:  # Skip header
-                        parts = line.split()
-                        if len(parts) >= 4:
-                            state = parts[3].upper()
-                            tcp_stats['total'] += 1
-                            state_name = tcp_states.get(state, 'other')
-                            if state_name == 'established':
-                                tcp_stats['established'] += 1
-                            elif state_name == 'listen':
-                                tcp_stats['listen'] += 1
-                            elif state_name == 'time_wait':
-                                tcp_stats['time_wait'] += 1
-                            elif state_name == 'close_wait':
-                                tcp_stats['close_wait'] += 1
-                            elif state_name == 'syn_sent':
-                                tcp_stats['syn_sent'] += 1
-                            elif state_name == 'syn_recv':
-                                tcp_stats['syn_recv'] += 1
-                            elif state_name in ('fin_wait1', 'fin_wait2'):
-                                tcp_stats['fin_wait'] += 1
-                            else:
-                                tcp_stats['other'] += 1
-            except Exception:
+                counts.update(_tcp_state_counts(_read_proc_bytes(tcp_path)))
+            except OSError:
                 pass
+        tcp_stats = {'total': sum(counts.values())}
+        tcp_stats.update((key, counts[key]) for key in _TCP_STATS_KEYS)
+        udp_stats = {'total': 0}
         
-        # Read UDP (IPv4 + IPv6)
-        for udp_file in ['/proc/net/udp', '/proc/net/udp6']:
-            host_path = Path(self.settings.host_proc) / udp_file.lstrip('/proc/')
+        # Read UDP (IPv4 + IPv6): строка на сокет, нужен только их счёт
+        for udp_path in self._udp_paths:
             try:
-                if host_path.exists():
-                    content = host_path.read_text()
-                    lines = content.strip().split('\n')[1:]  # Skip header
-                    udp_stats['total'] += len(lines)
-            except Exception:
-                pass
+                buf, n = _read_proc_into(udp_path)
+            except OSError:
+                continue
+            udp_stats['total'] += max(0, buf.count(b'\n', 0, n) - 1)  # минус заголовок
         
         return {
             'tcp': tcp_stats,
@@ -453,68 +642,69 @@ class MetricsCollector:
     
     def get_system_info(self) -> dict:
         """Get general system information with caching for heavy operations"""
-        current_time = time.time()
-        
-        # Return cached result if still valid
-        if current_time - self._system_cache_time < self._system_cache_ttl and self._system_cache:
-            # Update only lightweight fields
-            boot_time = datetime.fromtimestamp(psutil.boot_time())
-            uptime_seconds = (datetime.now() - boot_time).total_seconds()
-            self._system_cache["uptime_seconds"] = int(uptime_seconds)
-            self._system_cache["uptime_human"] = self._format_uptime(uptime_seconds)
-            return self._system_cache
-        
-        boot_time = datetime.fromtimestamp(psutil.boot_time())
-        uptime_seconds = (datetime.now() - boot_time).total_seconds()
-        
-        os_release = self._read_host_file("/etc/os-release")
-        os_name = "Unknown"
-        for line in os_release.split('\n'):
-            if line.startswith('PRETTY_NAME='):
-                os_name = line.split('=')[1].strip().strip('"')
-                break
-        
-        try:
-            kernel = platform.release()
-        except Exception:
-            kernel = "Unknown"
-        
-        try:
-            open_files = len(psutil.Process().open_files())
-        except Exception:
-            open_files = 0
-        
-        # Get connections from host /proc/net/* (heavy operation)
-        conn_stats = self._read_host_connections()
-        
-        # Legacy format for backward compatibility
-        connections = {
-            "established": conn_stats['tcp']['established'],
-            "listen": conn_stats['tcp']['listen'],
-            "time_wait": conn_stats['tcp']['time_wait'],
-            "other": conn_stats['tcp']['other'],
-        }
-        
-        result = {
-            "hostname": socket.gethostname(),
-            "os": os_name,
-            "kernel": kernel,
-            "architecture": platform.machine(),
-            "boot_time": boot_time.isoformat(),
-            "uptime_seconds": int(uptime_seconds),
-            "uptime_human": self._format_uptime(uptime_seconds),
-            "open_files": open_files,
-            "connections": connections,
-            "connections_detailed": conn_stats,
-            "server_name": self.settings.node_name,
-            "timezone": self._get_timezone_info()
-        }
-        
-        # Cache the result
-        self._system_cache = result
-        self._system_cache_time = current_time
-        
-        return result
+        with self._system_lock:
+            # Return cached result if still valid
+            if time.monotonic() < self._system_expires_at and self._system_cache:
+                # Update only lightweight fields
+                uptime_seconds = time.clock_gettime(time.CLOCK_BOOTTIME)
+                self._system_cache["uptime_seconds"] = int(uptime_seconds)
+                self._system_cache["uptime_human"] = self._format_uptime(uptime_seconds)
+                return dict(self._system_cache)
+            
+            uptime_seconds = time.clock_gettime(time.CLOCK_BOOTTIME)
+            
+            try:
+                open_files = len(psutil.Process().open_files())
+            except Exception:
+                open_files = 0
+            
+            # Get connections from host /proc/net/* (heavy operation)
+            conn_stats = self._read_host_connections()
+            
+            # Legacy format for backward compatibility
+            connections = {
+                "established": conn_stats['tcp']['established'],
+                "listen": conn_stats['tcp']['listen'],
+                "time_wait": conn_stats['tcp']['time_wait'],
+                "other": conn_stats['tcp']['other'],
+            }
+            
+            result = {
+                "hostname": socket.gethostname(),
+                **self._get_static_system(),
+                "boot_time": self._boot_time_iso,
+                "uptime_seconds": int(uptime_seconds),
+                "uptime_human": self._format_uptime(uptime_seconds),
+                "open_files": open_files,
+                "connections": connections,
+                "connections_detailed": conn_stats,
+                "server_name": self.settings.node_name,
+                "timezone": self._get_timezone_info()
+            }
+            
+            # Cache the result
+            self._system_cache = result
+            self._system_expires_at = self._expires_at(self._system_cache_ttl)
+            
+            return dict(result)
+    
+    def _get_static_system(self) -> dict:
+        """OS name, kernel and architecture — fixed for the boot lifetime, read once"""
+        if self._static_system is None:
+            m = _PRETTY_NAME_RE.search(self._read_host_file("/etc/os-release"))
+            os_name = m.group(1).strip().strip('"') if m else "Unknown"
+            
+            try:
+                kernel = platform.release()
+            except Exception:
+                kernel = "Unknown"
+            
+            self._static_system = {
+                "os": os_name,
+                "kernel": kernel,
+                "architecture": platform.machine(),
+            }
+        return self._static_system
     
     def _format_uptime(self, seconds: float) -> str:
         """Format uptime in human readable format"""
@@ -552,7 +742,9 @@ class MetricsCollector:
         tz_name = time.tzname[time.daylight] if time.daylight else time.tzname[0]
         
         # Try reading /etc/timezone for more readable name
-        tz_file = self._read_host_file("/etc/timezone").strip()
+        tz_file = self._cached(
+            "tz_file", self._timezone_cache_ttl,
+            lambda: self._read_host_file("/etc/timezone").strip())
         if tz_file:
             tz_name = tz_file
         
@@ -563,7 +755,27 @@ class MetricsCollector:
         }
     
     def get_certificates_info(self) -> dict:
-        """Get SSL certificate information (closest to expiry)"""
+        """Get SSL certificate information (closest to expiry) from the background refresher.
+
+        Первый вызов собирает данные сам и запускает поток обновления,
+        дальше — только чтение готового словаря."""
+        with self._certs_lock:
+            if self._certs_refresher is None:
+                self._certs_info = self._collect_certificates_info()
+                self._certs_refresher = threading.Thread(
+                    target=self._refresh_certificates_loop, name="certs-refresh", daemon=True)
+                self._certs_refresher.start()
+            return self._certs_info
+    
+    def _refresh_certificates_loop(self):
+        while True:
+            time.sleep(self._certs_refresh_interval)
+            info = self._collect_certificates_info()
+            with self._certs_lock:
+                self._certs_info = info
+    
+    def _collect_certificates_info(self) -> dict:
+        """Summarise HAProxy certificates: count and the one closest to expiry"""
         try:
             from app.services.haproxy_manager import get_haproxy_manager
             manager = get_haproxy_manager()
@@ -585,8 +797,7 @@ class MetricsCollector:
                 }
             }
         except Exception as e:
-            import logging
-            logging.getLogger(__name__).error(f"Failed to get certificates info: {e}")
+            logger.error(f"Failed to get certificates info: {e}")
             return {"count": 0, "closest_expiry": None}
     
     def _read_proc_int(self, path: str, default=None):
@@ -708,7 +919,6 @@ class MetricsCollector:
 
     async def get_all_metrics(self) -> dict:
         """Collect all metrics in parallel using thread pool"""
-        tz_info = self._get_timezone_info()
         cpu, memory, disk, network, processes, system, certs, antiddos = await asyncio.gather(
             asyncio.to_thread(self.get_cpu_info),
             asyncio.to_thread(self.get_memory_info),
@@ -722,7 +932,7 @@ class MetricsCollector:
         return {
             "timestamp": datetime.now().isoformat(),
             "server_name": self.settings.node_name,
-            "timezone": tz_info,
+            "timezone": system["timezone"],
             "cpu": cpu,
             "memory": memory,
             "disk": disk,
@@ -9,6 +9,26 @@ from app.services.host_executor import get_host_executor
 
 logger = logging.getLogger(__name__)
 
+_MONTHS = {
+    "Jan": 1, "Feb": 2, "Mar": 3, "Apr": 4, "May": 5, "Jun": 6,
+    "Jul": 7, "Aug": 8, "Sep": 9, "Oct": 10, "Nov": 11, "Dec": 12,
+}
+
+
+def _parse_openssl_date(value: str) -> datetime:
+    """'Jan  5 12:00:00 2027 GMT' -> naive UTC datetime.
+
+    openssl всегда печатает GMT и английские месяцы, а strptime с %b/%Z
+    зависит от локали процесса.
+    """
+    mon, day, clock, year = value.split()[:4]
+    hour, minute, second = clock.split(":")
+    try:
+        month = _MONTHS[mon]
+    except KeyError:
+        raise ValueError(f"Unknown month: {mon}")
+    return datetime(int(year), month, int(day), int(hour), int(minute), int(second))
+
 
 class SSLManager:
 
@@ -148,8 +168,7 @@ class SSLManager:
         for line in result.stdout.strip().split("\n"):
             if line.startswith("notAfter="):
                 try:
-                    expiry_str = line.replace("notAfter=", "")
-                    expiry = datetime.strptime(expiry_str, "%b %d %H:%M:%S %Y %Z")
+                    expiry = _parse_openssl_date(line[len("notAfter="):])
                     expiry_date = expiry.isoformat()
                     days_left = (expiry - datetime.utcnow()).days
                 except ValueError:
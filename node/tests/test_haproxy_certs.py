@@ -0,0 +1,95 @@
+"""Tests for certificate path handling in haproxy_manager.
+
+Runnable with plain stdlib:  python -m unittest discover -s node/tests
+
+Имя домена подставляется в путь live/{domain}: ".", ".." и пустые метки
+должны отсекаться до любой записи или удаления.
+"""
+
+import os
+import sys
+import tempfile
+import threading
+import unittest
+from collections import OrderedDict
+from pathlib import Path
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.services.haproxy_manager import HAProxyManager, _is_valid_domain  # noqa: E402
+from app.services.host_executor import ExecuteResult  # noqa: E402
+
+
+class _CertCheckingExecutor:
+    """haproxy -c понарошку: конфиг валиден, если существуют все crt-файлы"""
+
+    def __init__(self, cert: Path):
+        self.cert = cert
+        self.calls = 0
+
+    def execute_sync(self, command, timeout=30):
+        self.calls += 1
+        ok = self.cert.exists()
+        return ExecuteResult(success=ok, exit_code=0 if ok else 1, stdout="",
+                             stderr="" if ok else "unable to load SSL certificate",
+                             execution_time_ms=0)
+
+
+class DomainValidationTest(unittest.TestCase):
+    def test_valid(self):
+        for domain in ("example.com", "a-b.example.com", "example.com-0001", "localhost"):
+            self.assertTrue(_is_valid_domain(domain), domain)
+
+    def test_invalid(self):
+        for domain in ("", ".", "..", "a..b", ".example.com", "example.com.",
+                       "../etc", "a/b", "evil\n", "*.example.com", "a" * 254):
+            self.assertFalse(_is_valid_domain(domain), repr(domain))
+
+
+class DeleteCertificateTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.live = Path(self.tmp.name) / "live"
+        (self.live / "example.com").mkdir(parents=True)
+        (self.live / "example.com" / "fullchain.pem").write_text("x")
+        self.manager = HAProxyManager.__new__(HAProxyManager)
+        self.manager.certs_dir = self.live
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_rejects_paths_outside_live(self):
+        for domain in (".", "..", "", "example.com/.."):
+            ok, _ = self.manager.delete_certificate(domain)
+            self.assertFalse(ok, repr(domain))
+        self.assertTrue((self.live / "example.com" / "fullchain.pem").exists())
+
+
+class CheckConfigCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        root = Path(self.tmp.name)
+        self.cert = root / "combined.pem"
+        self.manager = HAProxyManager.__new__(HAProxyManager)
+        self.manager.config_path = root / "haproxy.cfg"
+        self.manager.config_path.write_text(f"frontend f\n    bind *:443 ssl crt {self.cert}\n")
+        self.manager._check_cache = OrderedDict()
+        self.manager._check_cache_lock = threading.Lock()
+        self.manager._executor = _CertCheckingExecutor(self.cert)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_cert_change_invalidates_cached_result(self):
+        self.assertFalse(self.manager.check_config()[0])
+        self.cert.write_text("pem")
+        self.assertTrue(self.manager.check_config()[0])
+        self.assertTrue(self.manager.check_config()[0])
+        self.assertEqual(self.manager._executor.calls, 2)
+        os.utime(self.cert, ns=(0, 0))
+        self.manager.check_config()
+        self.assertEqual(self.manager._executor.calls, 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+"""Tests for the rules-region splice in haproxy_manager.
+
+Runnable with plain stdlib:  python -m unittest discover -s node/tests
+
+add_rule/delete_rule больше не гоняют DOTALL-регулярки по всему конфигу:
+область между маркерами режется на секции, список правится и собирается
+обратно. Проверяем, что сборка обратима и что удаление трогает только свои
+секции.
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.services.haproxy_manager import (  # noqa: E402
+    RULES_END_MARKER,
+    RULES_START_MARKER,
+    _join_sections,
+    _section_name,
+    _split_sections,
+)
+
+BASE = f"""global
+    maxconn 10000
+
+defaults
+    mode tcp
+
+{RULES_START_MARKER}
+{RULES_END_MARKER}
+"""
+
+RULES = f"""global
+    maxconn 10000
+
+{RULES_START_MARKER}
+
+frontend tcp_a
+    bind *:1000
+    default_backend backend_tcp_a
+
+backend backend_tcp_a
+    server srv1 10.0.0.1:1000
+
+frontend tcp_b
+    bind *:2000
+    default_backend backend_tcp_b
+
+backend backend_tcp_b
+    server srv1 10.0.0.2:2000
+{RULES_END_MARKER}
+"""
+
+
+class SplitSectionsTest(unittest.TestCase):
+    def test_empty_region_roundtrip(self):
+        header, sections, footer = _split_sections(BASE)
+        self.assertEqual(sections, [])
+        self.assertTrue(header.endswith(RULES_START_MARKER + "\n"))
+        self.assertTrue(footer.startswith(RULES_END_MARKER))
+        self.assertEqual(_join_sections(header, sections, footer), BASE)
+
+    def test_rules_roundtrip(self):
+        self.assertEqual(_join_sections(*_split_sections(RULES)), RULES)
+
+    def test_sections_are_named(self):
+        _, sections, _ = _split_sections(RULES)
+        self.assertEqual(
+            [_section_name(s) for s in sections],
+            [("frontend", "tcp_a"), ("backend", "backend_tcp_a"),
+             ("frontend", "tcp_b"), ("backend", "backend_tcp_b")],
+        )
+
+    def test_drop_keeps_other_rule(self):
+        header, sections, footer = _split_sections(RULES)
+        dropped = {("frontend", "tcp_a"), ("backend", "backend_tcp_a")}
+        result = _join_sections(
+            header, [s for s in sections if _section_name(s) not in dropped], footer
+        )
+        self.assertNotIn("tcp_a", result)
+        self.assertIn("frontend tcp_b\n", result)
+        self.assertIn("server srv1 10.0.0.2:2000\n" + RULES_END_MARKER, result)
+        self.assertNotIn("\n\n\n", result)
+
+    def test_drop_last_rule_restores_empty_region(self):
+        header, sections, footer = _split_sections(RULES)
+        self.assertEqual(
+            _join_sections(header, [], footer),
+            f"global\n    maxconn 10000\n\n{RULES_START_MARKER}\n{RULES_END_MARKER}\n",
+        )
+
+    def test_no_markers_uses_whole_file(self):
+        content = RULES.replace(RULES_START_MARKER + "\n", "").replace(RULES_END_MARKER + "\n", "")
+        header, sections, footer = _split_sections(content)
+        self.assertEqual((header, footer), ("", ""))
+        self.assertEqual(_section_name(sections[0]), ("global",))
+        self.assertEqual(_section_name(sections[-1]), ("backend", "backend_tcp_b"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+"""Tests for HostExecutor's persistent shell session (execute(reuse_session=True)).
+
+Runnable with plain stdlib:  python -m unittest discover -s node/tests
+
+Команды идут в один долгоживущий sh; каждая — в своей подоболочке, конец
+вывода ищется по маркеру. Проверяем, что состояние не протекает между
+командами и что после таймаута сессия поднимается заново.
+"""
+
+import asyncio
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.services.host_executor import HostExecutor  # noqa: E402
+
+
+class HostSessionTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.executor = HostExecutor()
+        self.executor._use_nsenter = False
+
+    async def asyncTearDown(self):
+        for session in self.executor._sessions.values():
+            session.kill()
+            await session.process.wait()
+
+    async def test_output_and_exit_code(self):
+        result = await self.executor.execute("echo out; echo err >&2; exit 3", reuse_session=True)
+        self.assertEqual((result.exit_code, result.stdout, result.stderr), (3, "out", "err"))
+        self.assertFalse(result.success)
+
+    async def test_state_does_not_leak_and_process_is_reused(self):
+        await self.executor.execute("cd /; export LEAK=1", reuse_session=True)
+        pid = self.executor._sessions["sh"].process.pid
+        result = await self.executor.execute('echo "[$LEAK]"', reuse_session=True)
+        self.assertEqual(result.stdout, "[]")
+        self.assertEqual(self.executor._sessions["sh"].process.pid, pid)
+
+    async def test_output_larger_than_read_chunk(self):
+        result = await self.executor.execute("seq 1 100000", reuse_session=True)
+        lines = result.stdout.splitlines()
+        self.assertEqual((len(lines), lines[-1]), (100000, "100000"))
+
+    async def test_output_cap_keeps_exit_code(self):
+        for reuse_session in (False, True):
+            result = await self.executor.execute(
+                "seq 1 100000; exit 4", reuse_session=reuse_session, max_output_bytes=100
+            )
+            self.assertEqual(result.exit_code, 4)
+            self.assertTrue(result.truncated)
+            self.assertTrue(result.stdout.startswith("1\n2\n3\n"))
+            self.assertTrue(result.stdout.endswith(" bytes>"))
+            self.assertLess(len(result.stdout), 200)
+
+    async def test_timeout_replaces_session(self):
+        await self.executor.execute("true", reuse_session=True)
+        pid = self.executor._sessions["sh"].process.pid
+        result = await self.executor.execute("sleep 5", timeout=1, reuse_session=True)
+        self.assertEqual(result.exit_code, -1)
+        self.assertIn("timed out", result.error)
+        result = await self.executor.execute("echo back", reuse_session=True)
+        self.assertEqual(result.stdout, "back")
+        self.assertNotEqual(self.executor._sessions["sh"].process.pid, pid)
+
+    async def test_concurrent_callers_fall_back_to_spawn(self):
+        results = await asyncio.gather(
+            *(self.executor.execute(f"echo {i}", reuse_session=True) for i in range(5))
+        )
+        self.assertEqual([r.stdout for r in results], [str(i) for i in range(5)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+"""Tests for IP/CIDR parsing in ipset_manager.
+
+Runnable with plain stdlib:  python -m unittest discover -s node/tests
+
+Записи приводятся к той форме, в которой их показывает `ipset list`
+(адрес сети, /32 без префикса) — иначе diff в sync() видит лишние add/del.
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.services.ipset_manager import IpsetManager, is_public_range  # noqa: E402
+
+
+class CanonicalFormTest(unittest.TestCase):
+    def setUp(self):
+        # Без __init__: он проверяет окружение (nsenter), парсингу это не нужно
+        self.manager = IpsetManager.__new__(IpsetManager)
+
+    def test_canonical_forms(self):
+        valid, invalid = self.manager._canon_ips(
+            [" 8.8.8.8 ", "8.8.8.8/32", "8.8.4.7/24", "9.9.9.9/8", "1.1.1.0/24"]
+        )
+        self.assertEqual(valid, {"8.8.8.8", "8.8.4.0/24", "9.0.0.0/8", "1.1.1.0/24"})
+        self.assertEqual(invalid, [])
+
+    def test_invalid_entries(self):
+        bad = ["256.1.1.1", "1.2.3", "8.8.8.8/33", "abc", "", "01.2.3.4", "2001:db8::1"]
+        valid, invalid = self.manager._canon_ips(bad)
+        self.assertEqual(valid, set())
+        self.assertEqual(invalid, bad)
+
+    def test_block_ips_skip_non_public(self):
+        valid, invalid, skipped = self.manager._prepare_block_ips(
+            ["8.8.8.8", "10.0.0.1", "172.16.5.0/24", "0.0.0.0/0", "100.64.1.1", "bad"]
+        )
+        self.assertEqual(valid, {"8.8.8.8"})
+        self.assertEqual(invalid, ["bad"])
+        self.assertEqual(skipped, 4)
+
+    def test_members_cache_is_canonical(self):
+        self.manager._members = {}
+        self.manager._list_members = lambda name: ["8.8.8.8/32", "1.1.1.7/24", "9.9.9.9"]
+        members = self.manager._cached_members("blocklist_permanent")
+        self.assertEqual(members, {"8.8.8.8", "1.1.1.0/24", "9.9.9.9"})
+        new, _, _ = self.manager._prepare_block_ips(["8.8.8.8", "1.1.1.0/24", "9.9.9.9/32"])
+        self.assertEqual(new ^ members, set())
+
+    def test_is_public_range(self):
+        self.assertTrue(is_public_range("8.8.8.0/24"))
+        self.assertFalse(is_public_range("192.168.1.1"))
+        self.assertFalse(is_public_range("8.0.0.0/4"))  # накрывает 0.0.0.0/8
+        self.assertFalse(is_public_range("not-an-ip"))
+
+
+if __name__ == "__main__":
+    unittest.main()
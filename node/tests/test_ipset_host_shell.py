@@ -0,0 +1,87 @@
+"""Tests for running IpsetManager commands through a persistent host shell.
+
+Runnable with plain stdlib:  python -m unittest discover -s node/tests
+
+Вызовы ipset/iptables идут в долгоживущую сессию HostExecutor на отдельном
+event loop; проверяем, что синхронный _run_cmd видит те же коды возврата и
+вывод, что и при spawn, и что параллельные вызовы из потоков не мешают друг другу.
+"""
+
+import asyncio
+import os
+import subprocess
+import sys
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.services.ipset_manager import IpsetManager  # noqa: E402
+
+
+class HostShellTest(unittest.TestCase):
+    def setUp(self):
+        self.manager = IpsetManager.__new__(IpsetManager)
+        self.manager._use_nsenter = False
+        self.manager._start_host_shell()
+
+    def tearDown(self):
+        loop = self.manager._host_loop
+
+        async def _close():
+            for session in self.manager._host._sessions.values():
+                session.kill()
+                await session.process.wait()
+
+        asyncio.run_coroutine_threadsafe(_close(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+
+    def test_output_and_exit_code(self):
+        self.assertEqual(
+            self.manager._run_cmd(["sh", "-c", "echo out; echo err >&2; exit 3"]),
+            (False, "out", "err"),
+        )
+        self.assertEqual(self.manager._run_cmd(["echo", "a b", "$HOME;", "'q'"]),
+                         (True, "a b $HOME; 'q'", ""))
+
+    def test_session_is_reused(self):
+        self.manager._run_cmd(["true"])
+        pid = self.manager._host._sessions["sh"].process.pid
+        self.manager._run_cmd(["true"])
+        self.assertEqual(self.manager._host._sessions["sh"].process.pid, pid)
+
+    def test_large_output(self):
+        ok, out, _ = self.manager._run_cmd(["seq", "1", "200000"])
+        self.assertTrue(ok)
+        self.assertEqual(out.rsplit("\n", 1)[-1], "200000")
+
+    def test_busy_session_falls_back_to_direct_exec(self):
+        async def _hold():
+            session = await self.manager._host._get_session("sh")
+            await session.lock.acquire()
+            return session
+
+        session = asyncio.run_coroutine_threadsafe(_hold(), self.manager._host_loop).result()
+        try:
+            with mock.patch("app.services.ipset_manager.subprocess.run", wraps=subprocess.run) as run:
+                self.assertEqual(self.manager._run_cmd(["echo", "direct"]), (True, "direct", ""))
+            run.assert_called_once()
+            self.assertEqual(run.call_args.args[0], ["echo", "direct"])
+        finally:
+            self.manager._host_loop.call_soon_threadsafe(session.lock.release)
+
+    def test_timeout(self):
+        ok, _, err = self.manager._run_cmd(["sleep", "5"], timeout=1)
+        self.assertFalse(ok)
+        self.assertIn("timed out", err)
+        self.assertEqual(self.manager._run_cmd(["echo", "back"]), (True, "back", ""))
+
+    def test_concurrent_callers(self):
+        with ThreadPoolExecutor(8) as pool:
+            results = list(pool.map(lambda i: self.manager._run_cmd(["echo", str(i)]), range(32)))
+        self.assertEqual(results, [(True, str(i), "") for i in range(32)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,57 @@
+"""Tests for /proc parsing in metrics_collector.
+
+Runnable with plain stdlib:  python -m unittest discover -s node/tests
+
+Файлы /proc читаются байтами одним куском и разбираются без промежуточных
+строк; проверяем, что корзины и счётчики совпадают с прежним построчным
+разбором.
+"""
+
+import os
+import sys
+import unittest
+from collections import Counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.services.metrics_collector import _parse_proc_stat, _tcp_state_counts  # noqa: E402
+
+TCP = (
+    b"  sl  local_address rem_address   st tx_queue rx_queue tr tm->when retrnsmt   uid  timeout inode\n"
+    b"   0: 0100007F:1F90 00000000:0000 0A 00000000:00000000 00:00000000 00000000     0        0 1 1\n"
+    b"   1: 0100007F:1F90 0100007F:A1B2 01 00000000:00000000 00:00000000 00000000     0        0 2 1\n"
+    b"   2: 0100007F:1F90 0100007F:A1B3 04 00000000:00000000 00:00000000 00000000     0        0 3 1\n"
+    b"   3: 0100007F:1F90 0100007F:A1B4 05 00000000:00000000 00:00000000 00000000     0        0 4 1\n"
+    b"   4: 0100007F:1F90 0100007F:A1B5 0B 00000000:00000000 00:00000000 00000000     0        0 5 1\n"
+    b"   5: 0100007F:1F90 0100007F:A1B6 06 00000000:00000000 00:00000000 00000000     0        0 6 1\n"
+)
+
+
+class TcpBucketsTest(unittest.TestCase):
+    def test_buckets(self):
+        self.assertEqual(
+            _tcp_state_counts(TCP),
+            Counter({"listen": 1, "established": 1, "fin_wait": 2, "other": 1, "time_wait": 1}),
+        )
+
+    def test_header_only(self):
+        self.assertEqual(_tcp_state_counts(TCP.split(b"\n", 1)[0] + b"\n"), Counter())
+        self.assertEqual(_tcp_state_counts(b""), Counter())
+
+    def test_short_row_is_skipped(self):
+        self.assertEqual(_tcp_state_counts(TCP + b"   6: 0100007F:1F90\n")["other"], 1)
+
+
+class ProcStatTest(unittest.TestCase):
+    def test_comm_with_spaces_and_parens(self):
+        stat = (b"4242 (tmux: server) (x)) S 1 4242 4242 0 -1 4194560 100 0 0 0 "
+                b"250 75 0 0 20 0 1 0 98765 12345678 1500 18446744073709551615\n")
+        self.assertEqual(_parse_proc_stat(stat), ("tmux: server) (x)", "S", 325, 98765, 1500))
+
+    def test_truncated(self):
+        self.assertIsNone(_parse_proc_stat(b"1 (init) S 0 1"))
+        self.assertIsNone(_parse_proc_stat(b""))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1065,13 +1065,18 @@ async def execute_command_stream_on_node(
     SSE Event types:
         - stdout: {"line": "output line"}
         - stderr: {"line": "error line"}
+        - stdout_batch / stderr_batch: {"lines": [...]} (when batch is true)
         - done: {"exit_code": 0, "execution_time_ms": 1234, "success": true}
         - error: {"message": "error description"}
     
+    While the command is silent the node also sends ": keepalive" SSE comments
+    every 15 seconds; they are passed through unchanged.
+    
     Request body:
         command: str - Shell command to execute (required)
         timeout: int - Timeout in seconds, 1-600 (default: 30)
         shell: str - Shell to use: "sh" or "bash" (default: "sh")
+        batch: bool - Coalesce consecutive lines into *_batch events (default: false)
     """
     server = await get_server_by_id(server_id, db)
     url = f"{server.url}/api/system/execute-stream"
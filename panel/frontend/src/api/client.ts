@@ -609,6 +609,7 @@ export interface ExecuteRequest {
   command: string
   timeout?: number
   shell?: 'sh' | 'bash'
+  batch?: boolean
 }
 
 export interface ExecuteResponse {
@@ -628,6 +629,11 @@ export interface SSEStderrEvent {
   line: string
 }
 
+// stdout_batch / stderr_batch: consecutive lines of one stream in a single frame
+export interface SSEBatchEvent {
+  lines: string[]
+}
+
 export interface SSEDoneEvent {
   exit_code: number
   execution_time_ms: number
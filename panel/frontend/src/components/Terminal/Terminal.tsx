@@ -14,7 +14,7 @@ import {
   X,
   FileCode2,
 } from 'lucide-react'
-import { proxyApi, SSEStdoutEvent, SSEStderrEvent, SSEDoneEvent, SSEErrorEvent } from '../../api/client'
+import { proxyApi, SSEStdoutEvent, SSEStderrEvent, SSEBatchEvent, SSEDoneEvent, SSEErrorEvent } from '../../api/client'
 
 interface TerminalProps {
   serverId: number
@@ -136,7 +136,8 @@ export default function Terminal({ serverId }: TerminalProps) {
         body: JSON.stringify({
           command: trimmedCommand,
           timeout,
-          shell
+          shell,
+          batch: true
         }),
         credentials: 'include',
         signal: abortControllerRef.current.signal
@@ -194,6 +195,17 @@ export default function Terminal({ serverId }: TerminalProps) {
                   ])
                   break
                 }
+                case 'stdout_batch':
+                case 'stderr_batch': {
+                  const batchData = data as SSEBatchEvent
+                  const type = currentEvent === 'stdout_batch' ? 'stdout' : 'stderr'
+                  const timestamp = new Date()
+                  setOutput(prev => [
+                    ...prev,
+                    ...batchData.lines.map(content => ({ type, content, timestamp }))
+                  ])
+                  break
+                }
                 case 'done': {
                   const doneData = data as SSEDoneEvent
                   setLastResult({